@@ -32,26 +32,49 @@
         'stock',
         'delivery',
         'mail',
+        'bus',
     ],
     'data': [
-        # 'data/ir_cron_data.xml',
         'security/groups.xml',
         'security/ir.model.access.csv',
+        'data/ir_cron_data.xml',
+        'data/vtp_place_data.xml',
+        'data/vtp.address.conversion.csv',
 
         'wizards/vtp_create_bill_views.xml',
+        'wizards/vtp_mass_create_bill_wizard.xml',
+        'wizards/vtp_batch_quote_wizard.xml',
         'wizards/vtp_update_bill_status_wizard.xml',
         'wizards/vtp_update_bill_wizard.xml',
         'wizards/vtp_print_bill_wizard.xml',
+        'wizards/vtp_cod_import_wizard.xml',
+        'wizards/vtp_consistency_sweep_wizard.xml',
 
         'views/vtp_store_views.xml',
+        'views/vtp_store_route_views.xml',
         'views/vtp_account_views.xml',
         'views/vtp_api_audit_views.xml',
         'views/vtp_place_views.xml',
+        'views/vtp_address_conversion_views.xml',
         'views/vtp_order_bill_views.xml',       
         'views/vtp_service_bill_views.xml',
         'views/sale_order_views.xml',
         'views/stock_picking_views.xml',
+        'views/res_partner_views.xml',
+        'views/vtp_webhook_inbox_views.xml',
+        'views/vtp_order_bill_archive_views.xml',
+        'views/vtp_shipment_kpi_views.xml',
+        'views/vtp_cod_reconcile_views.xml',
+        'views/vtp_transit_stat_views.xml',
+        'views/vtp_webhook_redrive_views.xml',
+        'views/vtp_notify_views.xml',
     ],
+    'assets': {
+        'web.assets_backend': [
+            'viettel_ingration_odoo_18/static/src/js/vtp_shipment_board.js',
+            'viettel_ingration_odoo_18/static/src/xml/vtp_shipment_board.xml',
+        ],
+    },
     'installable': True,
     'application': False,
     'auto_install': False,
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Webhook Benchmark - Ingestion hot path
+
+Đo hiệu năng của vtp.order.bill.process_webhook_batch (và tùy chọn route
+/vtp/webhook/order_status) với luồng sự kiện tổng hợp:
+- Chuỗi chuyển trạng thái hợp lệ theo VALID_TRANSITIONS
+- Sự kiện trùng lặp, sai thứ tự, đơn không tồn tại
+- Payload dạng chuẩn VTP, dạng proxy (body/DATA) và dạng DATA trần
+
+Chỉ số: events/giây, p99 latency, số câu SQL / sự kiện cho batch 1/50/500.
+Kết quả được lưu (JSON lines) và so sánh với lần chạy trước để phát hiện
+regression trước khi deploy.
+
+Sử dụng:
+    python benchmarks/webhook_bench.py -c odoo.conf -d mydb
+    python benchmarks/webhook_bench.py -c odoo.conf -d mydb --url http://localhost:8069
+
+Dữ liệu giả lập (tài khoản, store, phiếu xuất kho, vận đơn) của đường model được
+rollback sau khi đo; đường HTTP dùng fixture được commit riêng (server tại --url
+phải dùng cùng database) và xóa sau khi đo.
+"""
+
+import argparse
+import json
+import os
+import random
+import secrets
+import sys
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_BATCH_SIZES = (1, 50, 500)
+DEFAULT_RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', 'webhook.jsonl')
+
+# Ngưỡng regression so với lần chạy trước
+REGRESSION_THRESHOLDS = {
+    'events_per_second': 0.20,   # giảm quá 20%
+    'p99_ms': 0.25,              # tăng quá 25%
+    'queries_per_event': 0.10,   # tăng quá 10%
+}
+
+STATUS_NAMES = {
+    101: 'ViettelPost yêu cầu hủy đơn hàng',
+    102: 'Đơn hàng chờ xử lý',
+    103: 'Giao cho bưu cục',
+    104: 'Giao cho Bưu tá đi nhận',
+    105: 'Bưu tá đã nhận hàng',
+    106: 'Đối tác yêu cầu lấy lại hàng',
+    107: 'Đối tác yêu cầu hủy qua API',
+    200: 'Nhận từ bưu tá - Bưu cục gốc',
+    300: 'Khai thác đi',
+    400: 'Khai thác đến',
+    500: 'Giao bưu tá đi phát',
+    501: 'Phát thành công',
+    502: 'Chuyển hoàn bưu cục gốc',
+    503: 'Hủy - Theo yêu cầu khách hàng',
+    504: 'Thành công - Chuyển trả cho người gửi',
+}
+
+
+# ============ Synthetic event generator ============
+
+class WebhookEventGenerator:
+    """
+    Sinh luồng sự kiện webhook thực tế.
+
+    Args:
+        transitions: dict - Đồ thị VALID_TRANSITIONS
+        final_states: list - Các trạng thái cuối
+        seed: int - Seed cho random (kết quả lặp lại được)
+        duplicate_ratio: float - Tỉ lệ sự kiện bị gửi trùng
+        out_of_order_ratio: float - Tỉ lệ cặp sự kiện liền kề bị đảo thứ tự
+        unknown_ratio: float - Tỉ lệ sự kiện của đơn không tồn tại
+        wrapped_ratio: float - Tỉ lệ payload dạng proxy {"body": {...}}
+        bare_ratio: float - Tỉ lệ payload là DATA trần
+    """
+
+    def __init__(self, transitions, final_states, seed=42, duplicate_ratio=0.05,
+                 out_of_order_ratio=0.05, unknown_ratio=0.02, wrapped_ratio=0.2,
+                 bare_ratio=0.1, token=None):
+        self.transitions = transitions
+        self.final_states = set(final_states)
+        self.random = random.Random(seed)
+        self.duplicate_ratio = duplicate_ratio
+        self.out_of_order_ratio = out_of_order_ratio
+        self.unknown_ratio = unknown_ratio
+        self.wrapped_ratio = wrapped_ratio
+        self.bare_ratio = bare_ratio
+        self.token = token
+
+    def status_chain(self, max_length=12):
+        """Một chuỗi trạng thái hợp lệ bắt đầu từ đơn mới tạo"""
+        chain = []
+        current = None
+        while len(chain) < max_length:
+            next_states = self.transitions.get(current) or []
+            if not next_states:
+                break
+            current = self.random.choice(next_states)
+            chain.append(current)
+            if current in self.final_states:
+                break
+        return chain
+
+    def event(self, order_number, order_reference, status, when):
+        return {
+            'ORDER_NUMBER': order_number,
+            'ORDER_REFERENCE': order_reference,
+            'ORDER_STATUSDATE': when.strftime('%d/%m/%Y %H:%M:%S'),
+            'ORDER_STATUS': status,
+            'STATUS_NAME': STATUS_NAMES.get(status, f'Trạng thái {status}'),
+            'LOCATION_CURRENTLY': self.random.choice(['Bưu cục Cầu Giấy', 'Bưu cục Quận 1', 'Kho Hà Đông']),
+            'NOTE': '',
+            'MONEY_COLLECTION': self.random.choice([0, 150000, 320000]),
+            'MONEY_FEECOD': 0,
+            'MONEY_TOTALFEE': 25000,
+            'MONEY_TOTAL': 25000,
+            'MONEY_TOTALVAT': 0,
+            'PRODUCT_WEIGHT': self.random.choice([200, 500, 1200]),
+            'ORDER_SERVICE': 'VSL6',
+            'ORDER_PAYMENT': 3,
+            'EXPECTED_DELIVERY_DATE': (when + timedelta(days=2)).strftime('%d/%m/%Y %H:%M:%S'),
+            'IS_RETURNING': False,
+            'RECEIVER_FULLNAME': 'Nguyễn Văn A',
+        }
+
+    def wrap(self, data):
+        """Đóng gói DATA theo một trong các dạng payload thực tế"""
+        roll = self.random.random()
+        if roll < self.bare_ratio:
+            return data
+        payload = {'DATA': data, 'TOKEN': self.token or ''}
+        if roll < self.bare_ratio + self.wrapped_ratio:
+            return {'body': payload}
+        return payload
+
+    def generate(self, orders, start=None):
+        """
+        Sinh danh sách payload cho các đơn.
+
+        Args:
+            orders: list of (order_number, order_reference)
+
+        Returns:
+            list: Payload thô, đã trộn theo thời gian
+        """
+        start = start or datetime.now() - timedelta(days=3)
+        timeline = []
+        for order_number, order_reference in orders:
+            when = start + timedelta(minutes=self.random.randint(0, 600))
+            for status in self.status_chain():
+                when += timedelta(minutes=self.random.randint(5, 240))
+                timeline.append((when, self.event(order_number, order_reference, status, when)))
+                if self.random.random() < self.duplicate_ratio:
+                    timeline.append((when, self.event(order_number, order_reference, status, when)))
+
+            if self.random.random() < self.unknown_ratio:
+                unknown = f'UNKNOWN{self.random.randint(10 ** 8, 10 ** 9)}'
+                timeline.append((when, self.event(unknown, f'WH/OUT/{unknown}', 200, when)))
+
+        timeline.sort(key=lambda pair: pair[0])
+        events = [data for unused_when, data in timeline]
+
+        # Đảo thứ tự một số cặp liền kề
+        for i in range(len(events) - 1):
+            if self.random.random() < self.out_of_order_ratio:
+                events[i], events[i + 1] = events[i + 1], events[i]
+
+        return [self.wrap(data) for data in events]
+
+
+# ============ Measurement ============
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _batches(events, size):
+    for i in range(0, len(events), size):
+        yield events[i:i + size]
+
+
+def _create_fixture(env, order_count, token, prefix='BENCH'):
+    """
+    Tạo tài khoản, store, phiếu xuất kho và vận đơn giả để sự kiện có đơn tương ứng.
+
+    Returns:
+        dict: {'orders': [(order_number, order_reference)], 'account_id', 'store_id',
+               'picking_ids', 'bill_ids'}
+    """
+    picking_type = env['stock.picking.type'].search([('code', '=', 'outgoing')], limit=1)
+    if not picking_type:
+        raise RuntimeError('Cần ít nhất một loại phiếu xuất kho (outgoing) để tạo dữ liệu benchmark')
+    run_id = f'{int(time.time())}{random.randint(100, 999)}'
+    account = env['vtp.account'].create({
+        'name': f'Benchmark account {prefix} {run_id}',
+        'username': f'benchmark-{prefix.lower()}-{run_id}',
+        'webhook_token': token,
+    })
+    store = env['vtp.store'].create({
+        'name': f'Benchmark store {prefix} {run_id}',
+        'groupaddressId': f'{prefix}{run_id}',
+        'account_id': account.id,
+    })
+    orders = [(f'{prefix}{run_id}{i:06d}', f'{prefix}/OUT/{run_id}/{i:06d}') for i in range(order_count)]
+    pickings = env['stock.picking'].create([{
+        'name': reference,
+        'picking_type_id': picking_type.id,
+        'vtp_store_id': store.id,
+        'vtp_order_number': order_number,
+        'vtp_state': 'waiting_webhook',
+    } for order_number, reference in orders])
+    bills = env['vtp.order.bill'].create([{
+        'name': reference,
+        'order_number': order_number,
+        'store_id': store.id,
+        'order_id': picking.id,
+    } for (order_number, reference), picking in zip(orders, pickings)])
+    for picking, bill in zip(pickings, bills):
+        picking.vtp_id = bill
+    env.flush_all()
+    return {
+        'orders': orders,
+        'account_id': account.id,
+        'store_id': store.id,
+        'picking_ids': pickings.ids,
+        'bill_ids': bills.ids,
+    }
+
+
+def _delete_fixture(env, fixture):
+    """Xóa dữ liệu do _create_fixture tạo (dùng cho fixture đã commit của đường HTTP)"""
+    bills = env['vtp.order.bill'].search([
+        '|', ('id', 'in', fixture['bill_ids']), ('store_id', '=', fixture['store_id']),
+    ])
+    env['vtp.order.bill.history'].search([
+        '|', ('bill_id', 'in', bills.ids), ('order_id', 'in', fixture['picking_ids']),
+    ]).unlink()
+    bills.unlink()
+    pickings = env['stock.picking'].browse(fixture['picking_ids']).exists()
+    pickings.write({'vtp_id': False})
+    pickings.unlink()
+    env['vtp.store'].browse(fixture['store_id']).exists().unlink()
+    env['vtp.account'].browse(fixture['account_id']).exists().unlink()
+    env.flush_all()
+
+
+def measure_model_path(env, events, batch_size):
+    """Đo process_webhook_batch với một kích thước batch"""
+    Bill = env['vtp.order.bill'].sudo()
+    cr = env.cr
+    latencies = []
+    queries = 0
+    processed = 0
+    started = time.perf_counter()
+    for batch in _batches(events, batch_size):
+        query_count = cr.sql_log_count
+        t0 = time.perf_counter()
+        Bill.process_webhook_batch(batch)
+        env.flush_all()
+        latencies.append((time.perf_counter() - t0) * 1000)
+        queries += cr.sql_log_count - query_count
+        processed += len(batch)
+    elapsed = time.perf_counter() - started
+    return {
+        'path': 'model',
+        'batch_size': batch_size,
+        'events': processed,
+        'events_per_second': round(processed / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(_percentile(latencies, 50), 3),
+        'p99_ms': round(_percentile(latencies, 99), 3),
+        'queries_per_event': round(queries / processed, 2) if processed else 0.0,
+    }
+
+
+def measure_http_path(url, events, batch_size, timeout=60):
+    """Đo route /vtp/webhook/order_status qua HTTP (fixture do run_http tạo và xóa)"""
+    import requests
+
+    endpoint = url.rstrip('/') + '/vtp/webhook/order_status'
+    session = requests.Session()
+    latencies = []
+    processed = 0
+    started = time.perf_counter()
+    for batch in _batches(events, batch_size):
+        body = json.dumps(batch if batch_size > 1 else batch[0], ensure_ascii=False).encode('utf-8')
+        t0 = time.perf_counter()
+        session.post(endpoint, data=body, headers={'Content-Type': 'application/json'}, timeout=timeout)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        processed += len(batch)
+    elapsed = time.perf_counter() - started
+    return {
+        'path': 'http',
+        'batch_size': batch_size,
+        'events': processed,
+        'events_per_second': round(processed / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(_percentile(latencies, 50), 3),
+        'p99_ms': round(_percentile(latencies, 99), 3),
+        'queries_per_event': None,
+    }
+
+
+def run(env, batch_sizes=DEFAULT_BATCH_SIZES, order_count=300, seed=42, url=None):
+    """
+    Chạy benchmark trên env cho trước. Dữ liệu được rollback sau mỗi kích thước batch.
+
+    Returns:
+        list[dict]: Kết quả cho từng (path, batch_size)
+    """
+    from odoo.addons.viettel_ingration_odoo_18.models.vtp_order_bill import FINAL_STATES, VALID_TRANSITIONS
+
+    results = []
+    for batch_size in batch_sizes:
+        token = secrets.token_hex(16)
+        savepoint = env.cr.savepoint()
+        try:
+            fixture = _create_fixture(env, order_count, token)
+            generator = WebhookEventGenerator(VALID_TRANSITIONS, FINAL_STATES, seed=seed, token=token)
+            events = generator.generate(fixture['orders'])
+            results.append(measure_model_path(env, events, batch_size))
+        finally:
+            savepoint.close(rollback=True)
+            env.invalidate_all()
+
+        if url:
+            results.append(run_http(env.registry, url, batch_size, order_count, seed))
+    return results
+
+
+def run_http(registry, url, batch_size, order_count, seed):
+    """
+    Đo đường HTTP: server chỉ thấy dữ liệu đã commit nên fixture được tạo và commit
+    trên cursor riêng (cùng database với server tại url), rồi xóa sau khi đo.
+    """
+    from odoo import SUPERUSER_ID, api
+    from odoo.addons.viettel_ingration_odoo_18.models.vtp_order_bill import FINAL_STATES, VALID_TRANSITIONS
+
+    token = secrets.token_hex(16)
+    with registry.cursor() as cr:
+        fixture = _create_fixture(api.Environment(cr, SUPERUSER_ID, {}), order_count, token, prefix='HTTP')
+        cr.commit()
+    try:
+        generator = WebhookEventGenerator(VALID_TRANSITIONS, FINAL_STATES, seed=seed, token=token)
+        events = generator.generate(fixture['orders'])
+        return measure_http_path(url, events, batch_size)
+    finally:
+        with registry.cursor() as cr:
+            _delete_fixture(api.Environment(cr, SUPERUSER_ID, {}), fixture)
+            cr.commit()
+
+
+# ============ Result storage & regression check ============
+
+def load_previous(results_file):
+    """Lần chạy gần nhất đã lưu, theo (path, batch_size)"""
+    previous = {}
+    if not os.path.exists(results_file):
+        return previous
+    with open(results_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            for result in record.get('results', []):
+                previous[(result['path'], result['batch_size'])] = result
+    return previous
+
+
+def find_regressions(results, previous):
+    regressions = []
+    for result in results:
+        baseline = previous.get((result['path'], result['batch_size']))
+        if not baseline:
+            continue
+        for metric, threshold in REGRESSION_THRESHOLDS.items():
+            new, old = result.get(metric), baseline.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            worse = change < -threshold if metric == 'events_per_second' else change > threshold
+            if worse:
+                regressions.append(
+                    f"{result['path']} batch={result['batch_size']} {metric}: {old} -> {new} ({change:+.0%})"
+                )
+    return regressions
+
+
+def save_results(results_file, results, meta):
+    os.makedirs(os.path.dirname(results_file), exist_ok=True)
+    with open(results_file, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(dict(meta, results=results), ensure_ascii=False) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='VTP webhook ingestion benchmark')
+    parser.add_argument('-c', '--config', help='Odoo config file')
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--batch-sizes', default=','.join(map(str, DEFAULT_BATCH_SIZES)))
+    parser.add_argument('--orders', type=int, default=300, help='Số đơn giả lập')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url', help='URL Odoo để đo cả route HTTP')
+    parser.add_argument('--results', default=DEFAULT_RESULTS_FILE)
+    parser.add_argument('--label', default='', help='Nhãn cho lần chạy (vd: commit hash)')
+    args = parser.parse_args(argv)
+
+    import odoo
+    from odoo import SUPERUSER_ID, api
+    from odoo.modules.registry import Registry
+
+    config_args = ['-d', args.database]
+    if args.config:
+        config_args = ['-c', args.config] + config_args
+    odoo.tools.config.parse_config(config_args)
+
+    batch_sizes = [int(x) for x in args.batch_sizes.split(',') if x.strip()]
+    registry = Registry(args.database)
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        results = run(env, batch_sizes=batch_sizes, order_count=args.orders, seed=args.seed, url=args.url)
+        cr.rollback()
+
+    previous = load_previous(args.results)
+    regressions = find_regressions(results, previous)
+    save_results(args.results, results, {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'label': args.label,
+        'orders': args.orders,
+        'seed': args.seed,
+    })
+
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    if regressions:
+        print('REGRESSION:')
+        for line in regressions:
+            print('  ' + line)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,3 @@
 from . import webhook
+from . import tracking
+from . import controllers
@@ -1,8 +1,39 @@
 from odoo import http
 from odoo.http import request
 import json
+import logging
 import urllib.request
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from ..models.vtp_address_conversion import insert_cache_entries, select_cache_entry
+from ..services.request_guard import Counters, KeyedRateLimiter, SingleFlight
+
+_logger = logging.getLogger(__name__)
+
+# Gọi Casso khi bảng chuyển đổi nội bộ không khớp tới cấp phường/xã ('0' để tắt).
+# Module chỉ đi kèm dữ liệu cấp tỉnh: khi chưa nhập dữ liệu cấp phường, tắt fallback
+# nghĩa là mọi địa chỉ chỉ được chuyển một phần (partial)
+PARAM_CASSO_FALLBACK = 'viettel_ingration_odoo_18.address_convert_fallback'
+# Giới hạn theo client: số địa chỉ mỗi phút và số địa chỉ tối đa dồn một lúc
+PARAM_RATE_PER_MINUTE = 'viettel_ingration_odoo_18.address_rate_per_minute'
+PARAM_RATE_BURST = 'viettel_ingration_odoo_18.address_rate_burst'
+DEFAULT_RATE_PER_MINUTE = 120
+DEFAULT_RATE_BURST = 200
+
+# Số địa chỉ tối đa mỗi request batch
+ADDRESS_BATCH_LIMIT = 200
+# Số lời gọi Casso song song trong một request batch
+UPSTREAM_MAX_WORKERS = 4
+
+# Trạng thái theo worker - _SINGLE_FLIGHT chỉ gộp lời gọi trong cùng process; giữa
+# các worker, lời gọi Casso cùng địa chỉ được tuần tự hóa bằng advisory lock (_upstream)
+_SINGLE_FLIGHT = SingleFlight()
+# Tiền tố khóa advisory lock (pg_advisory_xact_lock(hashtext(...))) theo địa chỉ
+UPSTREAM_LOCK_PREFIX = 'vtp_address_convert:'
+_METRICS = Counters('requests', 'addresses', 'local', 'cache_hit', 'cache_miss',
+                    'upstream', 'upstream_failed', 'coalesced', 'rate_limited')
+_RATE_LIMITERS = {}
 
 
 class AddressConvertController(http.Controller):
@@ -45,9 +76,183 @@ class AddressConvertController(http.Controller):
         old_address = post.get("old_address")
         if not old_address:
             return {"success": False, "message": "Thiếu tham số old_address"}
+        if not self._check_rate_limit(1):
+            return {"success": False, "message": "Quá nhiều yêu cầu, vui lòng thử lại sau"}
 
-        new_address = self.get_new_address(old_address)
-        if not new_address:
+        result = self._convert_many([old_address])[0]
+        if result['partial']:
+            return {
+                "success": False,
+                "partial": True,
+                "new_address": result['new_address'],
+                "matched": result['matched'],
+                "source": result['source'],
+                "message": "Chỉ chuyển được tên tỉnh/thành phố, phường/xã và quận/huyện cũ chưa được chuyển",
+            }
+        if not result['success']:
             return {"success": False, "message": "Không convert được địa chỉ"}
+        return {
+            "success": True,
+            "new_address": result['new_address'],
+            "matched": result['matched'],
+            "source": result['source'],
+        }
+
+    @http.route('/api/convert/address/batch', type='json', auth='public', methods=['POST'], csrf=False)
+    def api_convert_address_batch(self, **post):
+        """
+        Chuyển nhiều địa chỉ trong một request.
+        POST /api/convert/address/batch
+        {
+            "old_addresses": ["123 duong cu, Quan 1, TPHCM", ...]
+        }
+        """
+        addresses = post.get("old_addresses")
+        if not isinstance(addresses, list) or not addresses:
+            return {"success": False, "message": "Thiếu tham số old_addresses"}
+        if len(addresses) > ADDRESS_BATCH_LIMIT:
+            return {"success": False, "message": f"Tối đa {ADDRESS_BATCH_LIMIT} địa chỉ mỗi request"}
+        addresses = [str(address) for address in addresses]
+        if not self._check_rate_limit(len(addresses)):
+            return {"success": False, "message": "Quá nhiều yêu cầu, vui lòng thử lại sau"}
+        return {"success": True, "results": self._convert_many(addresses)}
+
+    @http.route('/api/convert/address/metrics', type='json', auth='user', methods=['POST'])
+    def api_convert_address_metrics(self, **post):
+        """Metrics của worker hiện tại và thống kê cache"""
+        if not request.env.user.has_group('viettel_ingration_odoo_18.group_viettel_post_admin'):
+            return {"success": False, "message": "Không có quyền"}
+        return {
+            "success": True,
+            "worker": _METRICS.snapshot(),
+            "cache": request.env['vtp.address.cache'].sudo()._get_stats(),
+            "rules": request.env['vtp.address.conversion'].sudo()._get_rule_counts(),
+        }
+
+    # ============ Helpers ============
+
+    def _fallback_enabled(self):
+        value = request.env['ir.config_parameter'].sudo().get_param(PARAM_CASSO_FALLBACK, '1')
+        return value not in ('0', 'False', 'false')
+
+    def _check_rate_limit(self, cost):
+        ICP = request.env['ir.config_parameter'].sudo()
+        rate = float(ICP.get_param(PARAM_RATE_PER_MINUTE, DEFAULT_RATE_PER_MINUTE))
+        burst = float(ICP.get_param(PARAM_RATE_BURST, DEFAULT_RATE_BURST))
+        if rate <= 0:
+            return True
+        limiter = _RATE_LIMITERS.get((rate, burst))
+        if limiter is None:
+            _RATE_LIMITERS.clear()
+            limiter = _RATE_LIMITERS[(rate, burst)] = KeyedRateLimiter(rate / 60.0, burst)
+        if limiter.allow(request.httprequest.remote_addr, cost):
+            return True
+        _METRICS.incr('rate_limited')
+        return False
+
+    def _upstream(self, registry, ttl_days, key, old_address):
+        """
+        Gọi Casso cho một địa chỉ chưa có trong cache (chạy trong thread, không dùng ORM).
+
+        - Trong process: các request cùng địa chỉ dùng chung một lời gọi (_SINGLE_FLIGHT)
+        - Giữa các worker: giữ pg_advisory_xact_lock(hashtext(key)) trên cursor riêng,
+          đọc lại cache sau khi có khóa (worker khác có thể vừa ghi), chỉ gọi Casso khi
+          vẫn chưa có rồi ghi cache trước khi nhả khóa
+
+        Returns:
+            tuple: (new_address, shared) - shared=True nếu kết quả do lời gọi khác tạo ra
+        """
+        def call():
+            with registry.cursor() as cr:
+                cr.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (UPSTREAM_LOCK_PREFIX + key,))
+                cached = select_cache_entry(cr, key)
+                if cached:
+                    return cached, True
+                new_address = self.get_new_address(old_address)
+                if new_address:
+                    insert_cache_entries(cr, [(key, old_address, new_address, 'casso')], ttl_days)
+                return new_address, False
+
+        try:
+            (new_address, from_cache), shared = _SINGLE_FLIGHT.do(key, call)
+        except Exception:
+            _logger.exception("VTP Address: Lỗi khi gọi Casso / ghi cache")
+            _METRICS.incr('upstream_failed')
+            return False, False
+        shared = shared or from_cache
+        _METRICS.incr('coalesced' if shared else 'upstream')
+        if not new_address and not shared:
+            _METRICS.incr('upstream_failed')
+        return new_address, shared
+
+    def _convert_many(self, addresses):
+        """
+        Thứ tự: bảng chuyển đổi nội bộ (khớp cấp phường) -> cache -> Casso (song song,
+        single-flight trong process, advisory lock giữa các worker) -> kết quả nội bộ cấp tỉnh.
+
+        Chỉ bước đầu trả lời trong process, và chỉ khi đã nhập dữ liệu cấp phường; với dữ
+        liệu cấp tỉnh đi kèm module, địa chỉ chưa có trong cache vẫn cần Casso.
+
+        Returns:
+            list[dict]: {'old_address', 'success', 'partial', 'new_address', 'matched', 'source'}
+            theo thứ tự addresses; partial=True (success=False) khi chỉ đổi được tên tỉnh
+        """
+        _METRICS.incr('requests')
+        _METRICS.incr('addresses', len(addresses))
+        Conversion = request.env['vtp.address.conversion'].sudo()
+        Cache = request.env['vtp.address.cache'].sudo()
+
+        answers = {}
+        pending = {}
+        for address in dict.fromkeys(addresses):
+            converted = Conversion.convert_address(address)
+            if converted['matched'] == 'ward':
+                _METRICS.incr('local')
+                answers[address] = (converted['new_address'], 'ward', 'local')
+            else:
+                pending.setdefault(Cache._cache_key(address), []).append((address, converted))
+
+        if pending and self._fallback_enabled():
+            cached = Cache._cache_get(pending)
+            _METRICS.incr('cache_hit', len(cached))
+            _METRICS.incr('cache_miss', len(pending) - len(cached))
+            misses = []
+            for key, items in pending.items():
+                if key in cached:
+                    new_address, source = cached[key]
+                    for address, unused in items:
+                        answers[address] = (new_address, 'full', source)
+                else:
+                    misses.append((key, items[0][0]))
+
+            if misses:
+                registry, ttl_days = request.env.registry, Cache._get_ttl_days()
+                with ThreadPoolExecutor(max_workers=min(UPSTREAM_MAX_WORKERS, len(misses))) as executor:
+                    upstream = list(executor.map(lambda miss: self._upstream(registry, ttl_days, *miss), misses))
+                # Kết quả Casso đã được ghi cache trong _upstream
+                for (key, unused), (new_address, unused_shared) in zip(misses, upstream):
+                    if not new_address:
+                        continue
+                    for address, unused in pending[key]:
+                        answers[address] = (new_address, 'full', 'casso')
+
+        # Không có kết quả tốt hơn - trả kết quả nội bộ cấp tỉnh (nếu có) dưới dạng một phần:
+        # phần phường/quận vẫn là đơn vị cũ (quận/huyện đã bị bỏ) nên không tính là thành công
+        for items in pending.values():
+            for address, converted in items:
+                if address not in answers and converted['new_address']:
+                    answers[address] = (converted['new_address'], converted['matched'], 'local')
 
-        return {"success": True, "new_address": new_address}
+        results = []
+        for address in addresses:
+            new_address, matched, source = answers.get(address, (False, False, False))
+            partial = matched == 'province'
+            results.append({
+                'old_address': address,
+                'success': bool(new_address) and not partial,
+                'partial': partial,
+                'new_address': new_address,
+                'matched': matched,
+                'source': source,
+            })
+        return results
@@ -0,0 +1,77 @@
+from odoo import http, fields
+import json
+import logging
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from odoo.http import request
+from odoo.http import Response
+
+_logger = logging.getLogger(__name__)
+
+_UTC = timezone.utc
+
+# Trình duyệt/CDN được cache ngắn; luôn kiểm tra lại bằng ETag
+TRACKING_CACHE_CONTROL = 'public, max-age=60, must-revalidate'
+
+
+class VTPTrackingController(http.Controller):
+
+    @http.route('/vtp/tracking/<string:token>', type='http', auth='public', methods=['GET'], csrf=False)
+    def vtp_tracking(self, token):
+        """
+        Tra cứu hành trình vận đơn công khai theo mã tra cứu (tracking_token).
+
+        Trả về snapshot dựng sẵn bằng một lần tra cứu theo index; hỗ trợ
+        If-None-Match / If-Modified-Since (304).
+        """
+        request.env.cr.execute("""
+            SELECT id, tracking_snapshot, tracking_etag, tracking_modified
+              FROM vtp_order_bill
+             WHERE tracking_token = %s
+        """, (token,))
+        row = request.env.cr.fetchone()
+        if not row:
+            return self._json_response({'error': 'Không tìm thấy vận đơn'}, status=404)
+
+        bill_id, snapshot, etag, modified = row
+        if not snapshot:
+            # Vận đơn cũ chưa có snapshot - dựng một lần
+            bill = request.env['vtp.order.bill'].sudo().browse(bill_id)
+            bill._refresh_tracking_snapshot()
+            snapshot, etag, modified = bill.tracking_snapshot, bill.tracking_etag, bill.tracking_modified
+
+        quoted_etag = f'"{etag}"'
+        headers = [
+            ('ETag', quoted_etag),
+            ('Cache-Control', TRACKING_CACHE_CONTROL),
+        ]
+        if modified:
+            modified = fields.Datetime.to_datetime(modified).replace(microsecond=0)
+            headers.append(('Last-Modified', format_datetime(modified.replace(tzinfo=_UTC), usegmt=True)))
+
+        if self._not_modified(quoted_etag, modified):
+            return Response(status=304, headers=headers)
+        return Response(snapshot, status=200, headers=headers + [('Content-Type', 'application/json; charset=utf-8')])
+
+    @staticmethod
+    def _not_modified(quoted_etag, modified):
+        if_none_match = request.httprequest.headers.get('If-None-Match')
+        if if_none_match:
+            candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            return '*' in candidates or quoted_etag in candidates
+        if_modified_since = request.httprequest.headers.get('If-Modified-Since')
+        if if_modified_since and modified:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return modified.replace(tzinfo=_UTC) <= since
+        return False
+
+    @staticmethod
+    def _json_response(data, status=200):
+        return Response(
+            json.dumps(data, ensure_ascii=False),
+            status=status,
+            headers=[('Content-Type', 'application/json; charset=utf-8')],
+        )
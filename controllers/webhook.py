@@ -1,9 +1,12 @@
 from odoo import http, fields
+import json
 import logging
 from odoo.http import request
-import json
 from odoo.http import Response
 
+from ..models.vtp_order_bill import WEBHOOK_RETRY_STATUSES
+from ..services.webhook_decoder import WebhookPayloadError, iter_webhook_items
+
 _logger = logging.getLogger(__name__)
 
 
@@ -13,87 +16,78 @@ class VTPWebhookController(http.Controller):
     def vtp_order_status(self):
         """
         Xử lý webhook ViettelPost để cập nhật trạng thái đơn hàng
+
+        Body được giải mã theo kiểu streaming; mỗi item được xử lý trong savepoint riêng.
+
+        Mã phản hồi:
+        - 200: mọi item đã được ghi nhận (kể cả item bị từ chối theo checklist)
+        - 207: một phần item thất bại - chỉ cần gửi lại các item trong "failed"
+        - 401 / 500: mọi item đều thất bại
+        - 400: body không hợp lệ trước khi xử lý được item nào
+
+        Nếu body hỏng giữa chừng, các item đứng trước đã được commit theo savepoint:
+        phản hồi báo cáo chúng kèm một mục lỗi cho phần còn lại thay vì trả 400.
         """
         try:
-            raw_data = request.httprequest.data
-            if not raw_data:
+            parse_errors = []
+            items = self._iter_until_parse_error(
+                iter_webhook_items(request.httprequest.stream), parse_errors)
+            results = request.env['vtp.order.bill'].sudo().process_webhook_batch(items)
+
+            if parse_errors:
+                _logger.error(f"VTP Webhook: JSON không hợp lệ sau {len(results)} item: {parse_errors[0]}")
+                if not results:
+                    return Response("JSON không hợp lệ", status=400)
+                results.append({
+                    'index': len(results),
+                    'order_number': False,
+                    'status': 'error',
+                    'message': f"JSON không hợp lệ: {parse_errors[0]}",
+                })
+
+            if not results:
                 _logger.warning("VTP Webhook: Không nhận được dữ liệu")
                 return Response("Không nhận được dữ liệu", status=400)
 
-            # Parse JSON
-            try:
-                raw_payload = json.loads(raw_data)
-            except Exception as e:
-                _logger.error(f"VTP Webhook: JSON không hợp lệ: {e}")
-                return Response("JSON không hợp lệ", status=400)
-
-            _logger.debug(f"VTP Webhook raw data: {raw_data}")
-
-            # Xử lý danh sách hoặc 
-            items = raw_payload if isinstance(raw_payload, list) else [raw_payload]
-
-            count = 0
-            for item in items:
-                # Tìm dữ liệu DATA trong item
-                data_dict = False
-                token = False
-                
-                if isinstance(item, dict):
-                    # Check for nested structure from n8n-like proxies
-                    if 'body' in item and isinstance(item['body'], dict):
-                        data_dict = item['body'].get('DATA')
-                        token = item['body'].get('TOKEN')
-                    # Standard VTP direct structure
-                    elif 'DATA' in item:
-                        data_dict = item.get('DATA')
-                        token = item.get('TOKEN')
-                    # Fallback if the whole object is the data
-                    else:
-                        data_dict = item
-
-                # Check for TOKEN (Optional security)
-                # Compare with configured webhook token if set
-                if token:
-                    _logger.info(f"VTP Webhook nhận được token: {token}")
-
-                # Process the data
-                if data_dict and isinstance(data_dict, dict) and data_dict.get('ORDER_NUMBER'):
-                    order_number = data_dict.get('ORDER_NUMBER')
-                    _logger.info("VTP Webhook đang xử lý đơn hàng: %s (Status: %s)", 
-                                 order_number, data_dict.get('STATUS_NAME'))
-                    
-                    # Find the account via order_number to validate token
-                    if token:
-                        # Find the bill to get the account
-                        bill = request.env['vtp.order.bill'].sudo().search([
-                            ('order_number', '=', order_number)
-                        ], limit=1)
-                        
-                        if bill and bill.account_id:
-                            # Validate token against account's webhook_token
-                            if bill.account_id.webhook_token:
-                                if token != bill.account_id.webhook_token:
-                                    _logger.warning(
-                                        f"VTP Webhook: Token không hợp lệ cho tài khoản {bill.account_id.name}, "
-                                        f"đơn hàng {order_number}"
-                                    )
-                                    return Response("Unauthorized - Token không hợp lệ", status=401)
-                                else:
-                                    _logger.info(f"VTP Webhook: Token hợp lệ cho tài khoản {bill.account_id.name}")
-                    
-                    # Call model method
-                    # Note: create_update_bill_from_webhook already handles audit logging and history
-                    result = request.env['vtp.order.bill'].sudo().create_update_bill_from_webhook(data_dict)
-                    
-                    if result:
-                        count += 1
-                    else:
-                        _logger.warning(f"VTP Webhook: Item for order {order_number} không hợp lệ.")
-                else:
-                    _logger.warning(f"VTP Webhook: Item structure not recognized or missing ORDER_NUMBER: {item}")
-
-            return Response(f"Processed {count} items", status=200)
+            return self._build_batch_response(results)
 
         except Exception as e:
             _logger.exception(f"VTP Webhook: Lỗi không mong muốn: {e}")
             return Response(str(e), status=500)
+
+    @staticmethod
+    def _iter_until_parse_error(items, errors):
+        """Dừng lặp khi gặp lỗi giải mã, ghi lỗi vào errors để giữ kết quả đã xử lý"""
+        try:
+            yield from items
+        except WebhookPayloadError as e:
+            errors.append(e)
+
+    def _build_batch_response(self, results):
+        """Tạo phản hồi JSON với báo cáo từng item"""
+        failed = [r for r in results if r['status'] in WEBHOOK_RETRY_STATUSES]
+        processed = len(results) - len(failed)
+
+        if not failed:
+            status = 200
+        elif processed:
+            status = 207
+        elif all(r['status'] == 'unauthorized' for r in failed):
+            status = 401
+        else:
+            status = 500
+
+        if failed:
+            _logger.warning(f"VTP Webhook: {len(failed)}/{len(results)} item thất bại")
+
+        body = {
+            'processed': processed,
+            'failed_count': len(failed),
+            'failed': failed,
+            'results': results,
+        }
+        return Response(
+            json.dumps(body, ensure_ascii=False),
+            status=status,
+            content_type='application/json; charset=utf-8',
+        )
@@ -1,7 +1,25 @@
 # from . import res_config_settings
 from . import vtp_api_audit
+from . import vtp_cache_version
 from . import vtp_place
 from . import vtp_order_bill
+from . import vtp_board_channel
 from . import vtp_pricing
 from . import vtp_service_bill
-from . import vtp_store
\ No newline at end of file
+from . import vtp_store
+from . import vtp_store_route
+from . import vtp_account_pool
+from . import vtp_webhook_inbox
+from . import vtp_order_bill_archive
+from . import vtp_shipment_kpi
+from . import vtp_cod_reconcile
+from . import ir_websocket
+from . import vtp_transit_stat
+from . import vtp_stuck_detector
+from . import vtp_webhook_redrive
+from . import vtp_consistency_sweeper
+from . import vtp_notify
+from . import vtp_place_loader
+from . import vtp_gazetteer
+from . import res_partner
+from . import vtp_address_conversion
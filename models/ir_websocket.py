@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Giới hạn kênh bus của board vận đơn (vtp_board_<account_id>) cho người dùng
+có quyền đọc tài khoản VTP tương ứng.
+"""
+
+from odoo import models
+
+from .vtp_order_bill import BOARD_CHANNEL_PREFIX
+
+
+class IrWebsocket(models.AbstractModel):
+    _inherit = 'ir.websocket'
+
+    def _build_bus_channel_list(self, channels):
+        channels = list(channels)
+        board_channels = [c for c in channels if isinstance(c, str) and c.startswith(BOARD_CHANNEL_PREFIX)]
+        if board_channels:
+            channels = [c for c in channels if c not in board_channels]
+            if self.env.uid and self.env['vtp.account'].has_access('read'):
+                allowed = {f'{BOARD_CHANNEL_PREFIX}{account_id}' for account_id in self.env['vtp.account'].search([]).ids}
+                channels.extend(c for c in board_channels if c in allowed)
+        return super()._build_bus_channel_list(channels)
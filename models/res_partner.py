@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from odoo import fields, models
+from odoo.tools.sql import create_index
+
+# Thay đổi các trường này thì phải phân giải lại địa chỉ VTP
+PARTNER_ADDRESS_FIELDS = {'street', 'street2', 'city', 'state_id'}
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    vtp_province_id = fields.Many2one('vtp.province', string='Tỉnh/TP (VTP)', ondelete='set null')
+    vtp_district_id = fields.Many2one('vtp.district', string='Quận/Huyện (VTP)', ondelete='set null')
+    vtp_ward_id = fields.Many2one('vtp.ward', string='Phường/Xã (VTP)', ondelete='set null')
+    vtp_address_checked = fields.Boolean(string='Đã phân giải địa chỉ VTP', copy=False, readonly=True)
+
+    def write(self, vals):
+        if PARTNER_ADDRESS_FIELDS.intersection(vals) and 'vtp_province_id' not in vals:
+            vals = dict(vals, vtp_province_id=False, vtp_district_id=False, vtp_ward_id=False,
+                        vtp_address_checked=False)
+        return super().write(vals)
+
+    def init(self):
+        # Job backfill đọc các khách hàng chưa phân giải theo id
+        create_index(self.env.cr, 'res_partner_vtp_address_pending_idx',
+                     self._table, ['id'], where="vtp_address_checked IS NOT TRUE")
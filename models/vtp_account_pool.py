@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Account Pool - Cân bằng tải và chuyển đổi dự phòng giữa các tài khoản ViettelPost
+
+Tài khoản hợp lệ: đang hoạt động và có store phù hợp (tra cước: store gần store
+gốc nhất / có trong bảng định tuyến; tạo đơn: store cùng điểm lấy hàng). Trọng số
+mỗi tài khoản lấy từ vtp.api.audit trong cửa sổ gần đây: tỷ lệ lỗi (làm mượt) và
+độ trễ trung bình. Khi lời gọi thất bại vì lỗi cấp tài khoản pool thử ngay tài
+khoản kế tiếp trong cùng lời gọi, thay các trường người gửi (GROUPADDRESS_ID,
+CUS_ID, SENDER_*) theo store của tài khoản đó. Tra cước chuyển tài khoản với mọi
+lỗi cấp tài khoản (token, 401/403/429, 5xx, mất kết nối, timeout); tạo đơn chỉ
+chuyển khi lỗi chắc chắn xảy ra trước khi VTP nhận đơn (token, 401/403/429).
+"""
+
+import logging
+import random
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Endpoint được pool định tuyến - dùng để tính trọng số
+POOL_ENDPOINTS = ('order/createOrder', 'order/getPrice')
+POOL_WINDOW_MINUTES = 30
+# Làm mượt tỷ lệ lỗi: coi như có thêm N lời gọi thành công
+POOL_ERROR_SMOOTHING = 5
+# Độ trễ giả định khi chưa có số liệu (ms)
+POOL_DEFAULT_LATENCY_MS = 1000
+# Tài khoản có tỷ lệ lỗi từ ngưỡng này (và đủ số lời gọi) chỉ được thử sau cùng
+POOL_DEGRADED_ERROR_RATE = 0.5
+POOL_DEGRADED_MIN_CALLS = 5
+# Số tài khoản tối đa được thử trong một lời gọi
+POOL_MAX_ATTEMPTS = 3
+
+# Trường payload phụ thuộc store người gửi
+STORE_PAYLOAD_FIELDS = {
+    'GROUPADDRESS_ID': lambda store: int(store.groupaddressId) if store.groupaddressId else 0,
+    'CUS_ID': lambda store: int(store.cusId) if store.cusId else 0,
+    'SENDER_FULLNAME': lambda store: store.name,
+    'SENDER_ADDRESS': lambda store: store.address,
+    'SENDER_PHONE': lambda store: store.phone,
+    'SENDER_WARD': lambda store: store.wardId.wardId if store.wardId else '',
+    'SENDER_DISTRICT': lambda store: store.districtId.districtId if store.districtId else '',
+    'SENDER_PROVINCE': lambda store: store.provinceId.provinceId if store.provinceId else '',
+}
+
+# Lỗi chắc chắn xảy ra trước khi VTP nhận đơn (lấy token thất bại, 401/403/429) -
+# an toàn để chuyển tài khoản với mọi endpoint
+PRE_ACCEPTANCE_ERROR_MARKERS = ('token', 'http error 401', 'http error 403', 'http error 429')
+# Lỗi cấp tài khoản khác (5xx, mất kết nối, timeout) - đơn có thể đã được tạo phía VTP,
+# chỉ chuyển tài khoản với endpoint idempotent
+FAILOVER_ERROR_MARKERS = PRE_ACCEPTANCE_ERROR_MARKERS + ('http error 5', 'lỗi kết nối', 'max retries', 'timeout')
+IDEMPOTENT_ENDPOINTS = ('order/getPrice',)
+# Endpoint gắn với điểm lấy hàng - store thay thế phải cùng điểm lấy hàng với store gốc
+PICKUP_ENDPOINTS = ('order/createOrder',)
+
+
+def is_failover_error(error, endpoint):
+    """Lỗi có nên chuyển sang tài khoản khác không"""
+    if not error:
+        return False
+    error = str(error).lower()
+    markers = FAILOVER_ERROR_MARKERS if endpoint in IDEMPOTENT_ENDPOINTS else PRE_ACCEPTANCE_ERROR_MARKERS
+    return any(marker in error for marker in markers)
+
+
+def _same_pickup_point(candidate, store):
+    """Hai store có cùng điểm lấy hàng không (cùng kho, hoặc cùng phường + địa chỉ)"""
+    if store.warehouse_id and candidate.warehouse_id == store.warehouse_id:
+        return True
+    return bool(
+        candidate.wardId and candidate.wardId == store.wardId
+        and ' '.join((candidate.address or '').lower().split()) == ' '.join((store.address or '').lower().split())
+    )
+
+
+class VTPAccountPool(models.AbstractModel):
+    _name = 'vtp.account.pool'
+    _description = 'ViettelPost Account Pool'
+
+    # ============ Configuration ============
+
+    @api.model
+    def _get_strategy(self):
+        """
+        'failover': tài khoản của store đã chọn trước, các tài khoản khác theo trọng số khi lỗi
+        'weighted': mọi tài khoản hợp lệ theo trọng số
+        'off': chỉ dùng store đã chọn
+        """
+        return self.env['ir.config_parameter'].sudo().get_param(
+            'viettel_ingration_odoo_18.account_pool_strategy', 'failover'
+        )
+
+    # ============ Health ============
+
+    @api.model
+    def _get_account_stats(self, accounts=None):
+        """
+        Số liệu trong cửa sổ gần đây, một truy vấn gộp.
+
+        Returns:
+            dict: {account_id: {'calls', 'errors', 'avg_ms', 'error_rate', 'weight', 'degraded'}}
+        """
+        since = fields.Datetime.now() - timedelta(minutes=POOL_WINDOW_MINUTES)
+        domain = [('timestamp', '>=', since), ('endpoint', 'in', POOL_ENDPOINTS)]
+        if accounts is not None:
+            domain.append(('account_id', 'in', accounts.ids))
+        stats = {}
+        for account, success, count, avg_ms in self.env['vtp.api.audit'].sudo()._read_group(
+            domain, ['account_id', 'success'], ['__count', 'duration_ms:avg'],
+        ):
+            entry = stats.setdefault(account.id, {'calls': 0, 'errors': 0, 'latency_total': 0.0, 'latency_calls': 0})
+            entry['calls'] += count
+            if success:
+                if avg_ms:
+                    entry['latency_total'] += avg_ms * count
+                    entry['latency_calls'] += count
+            else:
+                entry['errors'] += count
+
+        for account_id in (accounts.ids if accounts is not None else []):
+            stats.setdefault(account_id, {'calls': 0, 'errors': 0, 'latency_total': 0.0, 'latency_calls': 0})
+        for entry in stats.values():
+            latency_calls = entry.pop('latency_calls')
+            latency_total = entry.pop('latency_total')
+            entry['avg_ms'] = latency_total / latency_calls if latency_calls else 0.0
+            entry['error_rate'] = entry['errors'] / (entry['calls'] + POOL_ERROR_SMOOTHING)
+            # Trọng số: tỷ lệ thành công^2 / độ trễ (giây)
+            latency = (entry['avg_ms'] or POOL_DEFAULT_LATENCY_MS) / 1000.0
+            entry['weight'] = (1.0 - entry['error_rate']) ** 2 / max(latency, 0.05)
+            entry['degraded'] = (entry['calls'] >= POOL_DEGRADED_MIN_CALLS
+                                 and entry['errors'] / entry['calls'] >= POOL_DEGRADED_ERROR_RATE)
+        return stats
+
+    # ============ Candidates ============
+
+    @api.model
+    def _get_candidate_stores(self, store, receiver_province=None, receiver_district=None, warehouse=None,
+                              endpoint=None):
+        """
+        Store đại diện của mỗi tài khoản hợp lệ, theo thứ tự thử.
+
+        Tra cước: mỗi tài khoản chọn store theo thứ hạng trong bảng định tuyến, cùng
+        quận / cùng tỉnh với store gốc, store mặc định.
+        Tạo đơn (PICKUP_ENDPOINTS): chỉ nhận store cùng điểm lấy hàng với store gốc
+        (cùng kho, hoặc cùng phường + địa chỉ), xếp theo độ gần với người gửi.
+        """
+        strategy = self._get_strategy()
+        if strategy == 'off' or not store:
+            return store
+
+        stores = self.env['vtp.store'].search([
+            ('active', '=', True),
+            ('account_id.active', '=', True),
+            ('provinceId', '!=', False),
+        ])
+        if endpoint in PICKUP_ENDPOINTS:
+            stores = stores.filtered(lambda candidate: _same_pickup_point(candidate, store))
+            route_rank = {}
+        else:
+            route_rank = {
+                route_store.id: index for index, route_store in enumerate(
+                    self.env['vtp.store.route']._get_ranked_stores(receiver_province, receiver_district, warehouse))
+            }
+
+        def store_key(candidate):
+            return (
+                candidate != store,
+                route_rank.get(candidate.id, len(route_rank)),
+                not (store.warehouse_id and candidate.warehouse_id == store.warehouse_id),
+                candidate.wardId != store.wardId,
+                candidate.districtId != store.districtId,
+                candidate.provinceId != store.provinceId,
+                not candidate.is_default,
+                candidate.id,
+            )
+
+        best = {}
+        for candidate in stores.sorted(store_key):
+            best.setdefault(candidate.account_id.id, candidate)
+        best.setdefault(store.account_id.id, store)
+
+        stats = self._get_account_stats(self.env['vtp.account'].browse(list(best)))
+        pinned = [store.account_id.id] if strategy == 'failover' else []
+
+        def account_key(account_id):
+            entry = stats.get(account_id) or {}
+            # Lấy mẫu có trọng số không hoàn lại (Efraimidis-Spirakis)
+            weight = max(entry.get('weight', 0.0), 1e-6)
+            return (account_id not in pinned, entry.get('degraded', False), -random.random() ** (1.0 / weight))
+
+        ordered = sorted(best, key=account_key)
+        return self.env['vtp.store'].browse([best[account_id].id for account_id in ordered[:POOL_MAX_ATTEMPTS]])
+
+    @api.model
+    def _apply_store(self, data, store):
+        """Bản sao payload với các trường người gửi theo store (chỉ trường đã có trong payload)"""
+        data = dict(data)
+        for key, getter in STORE_PAYLOAD_FIELDS.items():
+            if key in data:
+                data[key] = getter(store)
+        return data
+
+    # ============ Calls ============
+
+    @api.model
+    def _call(self, method_name, endpoint, store, data, order_bill=None,
+              receiver_province=None, receiver_district=None, warehouse=None):
+        """
+        Gọi vtp.service.<method_name> qua pool, chuyển tài khoản khi gặp lỗi cấp tài khoản.
+
+        Returns:
+            tuple: (kết quả, store đã dùng)
+        """
+        candidates = self._get_candidate_stores(store, receiver_province, receiver_district, warehouse,
+                                                endpoint=endpoint)
+        service_method = getattr(self.env['vtp.service'], method_name)
+        result, used = {'error': 'No eligible account'}, store
+        for candidate in candidates:
+            payload = data if candidate == store else self._apply_store(data, candidate)
+            result, used = service_method(account=candidate.account_id, data=payload, order_bill=order_bill), candidate
+            error = result.get('error') if isinstance(result, dict) else None
+            if not is_failover_error(error, endpoint):
+                break
+            _logger.warning(f"VTP Pool: {endpoint} lỗi trên tài khoản {candidate.account_id.name}: {error}, "
+                            f"chuyển tài khoản")
+        if used != store:
+            _logger.info(f"VTP Pool: {endpoint} dùng store {used.name} ({used.account_id.name}) "
+                         f"thay cho {store.name} ({store.account_id.name})")
+        return result, used
+
+    @api.model
+    def calculate_fee(self, store, data, **kwargs):
+        return self._call('calculate_fee', 'order/getPrice', store, data, **kwargs)
+
+    @api.model
+    def create_bill(self, store, data, **kwargs):
+        return self._call('create_bill', 'order/createOrder', store, data, **kwargs)
+
+
+class VTPAccount(models.Model):
+    _inherit = 'vtp.account'
+
+    pool_call_count = fields.Integer(string='Lời gọi gần đây', compute='_compute_pool_utilisation')
+    pool_error_rate = fields.Float(string='Tỷ lệ lỗi (%)', compute='_compute_pool_utilisation', digits=(16, 1))
+    pool_avg_latency_ms = fields.Integer(string='Độ trễ TB (ms)', compute='_compute_pool_utilisation')
+    pool_share = fields.Float(string='Tỷ trọng tải (%)', compute='_compute_pool_utilisation', digits=(16, 1))
+    pool_degraded = fields.Boolean(string='Suy giảm', compute='_compute_pool_utilisation')
+
+    def _compute_pool_utilisation(self):
+        """Mức sử dụng của từng tài khoản trong cửa sổ gần đây (tạo đơn + tra cước)"""
+        stats = self.env['vtp.account.pool']._get_account_stats()
+        total = sum(entry['calls'] for entry in stats.values())
+        for account in self:
+            entry = stats.get(account.id) or {}
+            calls = entry.get('calls', 0)
+            account.pool_call_count = calls
+            account.pool_error_rate = 100.0 * entry.get('errors', 0) / calls if calls else 0.0
+            account.pool_avg_latency_ms = int(entry.get('avg_ms', 0))
+            account.pool_share = 100.0 * calls / total if total else 0.0
+            account.pool_degraded = entry.get('degraded', False)
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Address Conversion - Chuyển địa chỉ theo đơn vị hành chính cũ sang mới (sáp nhập 2025)
+
+Bảng ánh xạ gồm hai cấp:
+- province: tỉnh cũ -> tỉnh mới (63 -> 34, đi kèm module trong data/vtp.address.conversion.csv)
+- ward: (tỉnh, quận/huyện, phường/xã cũ) -> (phường/xã mới, tỉnh mới), KHÔNG đi kèm
+  module - nhập bằng chức năng Import chuẩn của Odoo (cột level=ward, old_province_name,
+  old_district_name, old_ward_name, new_province_name, new_ward_name). Khi chưa có dữ
+  liệu cấp phường, mọi địa chỉ chỉ khớp cấp tỉnh: kết quả là một phần (partial) vì
+  phường và quận/huyện cũ (đã bị bỏ) được giữ nguyên
+
+Phạm vi: chỉ các địa chỉ khớp quy tắc cấp phường mới được trả lời hoàn toàn trong
+process. Với bộ dữ liệu đi kèm (chỉ cấp tỉnh), /api/convert/address vẫn tra cache rồi
+gọi Casso; bảng nội bộ chỉ dùng cho kết quả một phần khi Casso tắt hoặc lỗi.
+
+Địa chỉ cũ được tách theo dấu phẩy, so khớp từ phải sang trái trên tên đã chuẩn hóa
+(bỏ dấu, bỏ tiền tố, bí danh "TP HCM"...) với bảng tra trong bộ nhớ (ormcache theo
+phiên bản 'address_conversion' của vtp.cache.version).
+
+Kết quả từ dịch vụ ngoài (Casso) được lưu trong vtp.address.cache theo địa chỉ
+đã chuẩn hóa, có TTL và dọn theo LRU.
+"""
+
+import logging
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models, tools
+from odoo.tools.sql import create_index
+
+from ..services.address_gazetteer import PROVINCE_ALIASES, normalize_name, strip_admin_prefix
+
+_logger = logging.getLogger(__name__)
+
+# Phần đuôi địa chỉ bị bỏ qua khi so khớp
+COUNTRY_SUFFIXES = {'viet nam', 'vietnam', 'vn'}
+
+
+def _place_key(name):
+    """Khóa so khớp: tên bỏ tiền tố; tên dạng số giữ tiền tố ('phuong 1')"""
+    full = normalize_name(name)
+    core = strip_admin_prefix(full)
+    return full if core.isdigit() else core
+
+
+class VTPAddressConversion(models.Model):
+    _name = 'vtp.address.conversion'
+    _description = 'ViettelPost Administrative Unit Conversion'
+    _order = 'level, old_province_name, old_district_name, old_ward_name'
+    _rec_name = 'old_province_name'
+
+    level = fields.Selection([
+        ('province', 'Tỉnh/Thành phố'),
+        ('ward', 'Phường/Xã'),
+    ], string='Cấp', required=True, default='ward')
+    old_province_name = fields.Char(string='Tỉnh/TP cũ', required=True)
+    old_district_name = fields.Char(string='Quận/Huyện cũ')
+    old_ward_name = fields.Char(string='Phường/Xã cũ')
+    new_province_name = fields.Char(string='Tỉnh/TP mới', required=True)
+    new_ward_name = fields.Char(string='Phường/Xã mới')
+
+    # Bảng tra được cache theo phiên bản 'address_conversion' (mọi trường đều là dữ liệu tra cứu)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['vtp.cache.version']._bump('address_conversion')
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env['vtp.cache.version']._bump('address_conversion')
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env['vtp.cache.version']._bump('address_conversion')
+        return result
+
+    # ============ Lookup tables ============
+
+    @api.model
+    def _get_conversion_tables(self):
+        return self._load_conversion_tables(self.env['vtp.cache.version']._get('address_conversion'))
+
+    @api.model
+    @tools.ormcache('version')
+    def _load_conversion_tables(self, version):
+        """
+        Returns:
+            tuple: (provinces, wards, wards_by_province)
+                provinces: {khóa tỉnh cũ: tên tỉnh mới}
+                wards: {(tỉnh, quận, phường cũ): (phường mới, tỉnh mới)}
+                wards_by_province: {(tỉnh, phường cũ): [(phường mới, tỉnh mới)]} - dùng khi địa chỉ thiếu quận
+        """
+        self.env.cr.execute("""
+            SELECT level, old_province_name, old_district_name, old_ward_name, new_province_name, new_ward_name
+              FROM vtp_address_conversion
+        """)
+        provinces, wards, wards_by_province = {}, {}, {}
+        for level, old_province, old_district, old_ward, new_province, new_ward in self.env.cr.fetchall():
+            province_key = _place_key(old_province)
+            if level == 'province':
+                provinces[province_key] = new_province
+            elif old_ward and new_ward:
+                ward_key = _place_key(old_ward)
+                target = (new_ward, new_province)
+                if old_district:
+                    wards[(province_key, _place_key(old_district), ward_key)] = target
+                targets = wards_by_province.setdefault((province_key, ward_key), [])
+                if target not in targets:
+                    targets.append(target)
+        for alias, canonical in PROVINCE_ALIASES.items():
+            if canonical in provinces:
+                provinces.setdefault(alias, provinces[canonical])
+        return provinces, wards, wards_by_province
+
+    @api.model
+    def _get_rule_counts(self):
+        """Số quy tắc theo cấp: {'province': n, 'ward': n} - ward=0 nghĩa là chưa nhập dữ liệu cấp phường"""
+        counts = dict(self._read_group([], ['level'], ['__count']))
+        return {level: counts.get(level, 0) for level in ('province', 'ward')}
+
+    # ============ Conversion ============
+
+    @api.model
+    def convert_address(self, old_address):
+        """
+        Chuyển địa chỉ cũ sang địa chỉ mới.
+
+        Returns:
+            dict: {'new_address', 'matched' ('ward' | 'province' | False), 'partial',
+                   'new_province', 'new_ward'} - partial=True khi chỉ đổi được tên tỉnh
+        """
+        result = {'new_address': False, 'matched': False, 'partial': False, 'new_province': False,
+                  'new_ward': False}
+        segments = [segment.strip() for segment in (old_address or '').split(',') if segment.strip()]
+        if segments and normalize_name(segments[-1]) in COUNTRY_SUFFIXES:
+            segments.pop()
+        if not segments:
+            return result
+
+        provinces, wards, wards_by_province = self._get_conversion_tables()
+        province_key = _place_key(segments[-1])
+        new_province = provinces.get(province_key)
+        if not new_province:
+            return result
+        head = segments[:-1]
+
+        # (street..., phường, quận, tỉnh)
+        if len(head) >= 2:
+            target = wards.get((province_key, _place_key(head[-1]), _place_key(head[-2])))
+            if target:
+                return self._converted(head[:-2], target[0], target[1], 'ward')
+        # (street..., phường, tỉnh) - địa chỉ không ghi quận
+        if head:
+            targets = wards_by_province.get((province_key, _place_key(head[-1])))
+            if targets and len(targets) == 1:
+                return self._converted(head[:-1], targets[0][0], targets[0][1], 'ward')
+
+        # Chỉ đổi tên tỉnh, giữ nguyên phần còn lại
+        return self._converted(head, False, new_province, 'province')
+
+    @api.model
+    def _converted(self, street_parts, new_ward, new_province, matched):
+        parts = list(street_parts) + ([new_ward] if new_ward else []) + [new_province]
+        return {
+            'new_address': ', '.join(parts),
+            'matched': matched,
+            'partial': matched == 'province',
+            'new_province': new_province,
+            'new_ward': new_ward or False,
+        }
+
+
+# Cache kết quả chuyển đổi từ dịch vụ ngoài
+DEFAULT_ADDRESS_CACHE_TTL_DAYS = 30
+DEFAULT_ADDRESS_CACHE_MAX_ENTRIES = 100000
+PARAM_ADDRESS_CACHE_TTL = 'viettel_ingration_odoo_18.address_cache_ttl_days'
+PARAM_ADDRESS_CACHE_MAX = 'viettel_ingration_odoo_18.address_cache_max_entries'
+
+
+def select_cache_entry(cr, address_key):
+    """Địa chỉ mới trong cache (chưa hết hạn) - dùng được với cursor riêng ngoài ORM"""
+    cr.execute("""
+        SELECT new_address FROM vtp_address_cache
+         WHERE address_key = %s AND expires_at > now() at time zone 'UTC'
+    """, (address_key,))
+    row = cr.fetchone()
+    return row[0] if row else False
+
+
+def insert_cache_entries(cr, entries, ttl_days):
+    """
+    Ghi / làm mới các bản ghi cache - dùng được với cursor riêng ngoài ORM.
+
+    Args:
+        entries: list of (address_key, old_address, new_address, source)
+    """
+    execute_values(cr._obj, """
+        INSERT INTO vtp_address_cache
+            (address_key, old_address, new_address, source, hit_count, last_hit, expires_at,
+             create_date, write_date)
+        VALUES %s
+        ON CONFLICT (address_key) DO UPDATE
+           SET new_address = EXCLUDED.new_address,
+               source = EXCLUDED.source,
+               expires_at = EXCLUDED.expires_at,
+               write_date = EXCLUDED.write_date
+    """, entries, template=(
+        "(%s, %s, %s, %s, 0, now() at time zone 'UTC', "
+        f"(now() at time zone 'UTC') + interval '{int(ttl_days)} days', "
+        "now() at time zone 'UTC', now() at time zone 'UTC')"
+    ))
+
+
+class VTPAddressCache(models.Model):
+    _name = 'vtp.address.cache'
+    _description = 'ViettelPost Address Conversion Cache'
+    _order = 'last_hit desc'
+    _rec_name = 'old_address'
+
+    address_key = fields.Char(string='Khóa (đã chuẩn hóa)', required=True, readonly=True)
+    old_address = fields.Char(string='Địa chỉ cũ', readonly=True)
+    new_address = fields.Char(string='Địa chỉ mới', readonly=True)
+    source = fields.Char(string='Nguồn', readonly=True)
+    hit_count = fields.Integer(string='Số lần dùng', readonly=True)
+    last_hit = fields.Datetime(string='Dùng lần cuối', readonly=True)
+    expires_at = fields.Datetime(string='Hết hạn', readonly=True)
+
+    _sql_constraints = [
+        ('address_key_unique', 'UNIQUE(address_key)', 'Địa chỉ đã có trong cache!'),
+    ]
+
+    def init(self):
+        # Dọn LRU sắp xếp theo last_hit
+        create_index(self.env.cr, 'vtp_address_cache_last_hit_idx',
+                     self._table, ['last_hit'])
+
+    @api.model
+    def _cache_key(self, address):
+        return normalize_name(address)[:512]
+
+    @api.model
+    def _cache_get(self, keys):
+        """
+        Tra cache (chưa hết hạn) bằng SELECT thường - không giữ khóa dòng trong
+        transaction của request (có thể kéo dài trong lúc gọi Casso).
+        """
+        if not keys:
+            return {}
+        self.env.cr.execute("""
+            SELECT address_key, new_address, source
+              FROM vtp_address_cache
+             WHERE address_key = ANY(%s)
+               AND expires_at > now() at time zone 'UTC'
+        """, (list(keys),))
+        hits = {key: (new_address, source) for key, new_address, source in self.env.cr.fetchall()}
+        self._cache_touch(list(hits))
+        return hits
+
+    @api.model
+    def _cache_touch(self, keys):
+        """
+        Cập nhật hit_count / last_hit trên cursor riêng (commit ngay). Dòng đang bị
+        khóa bởi worker khác được bỏ qua - thống kê LRU không cần chính xác tuyệt đối.
+        """
+        if not keys:
+            return
+        try:
+            with self.env.registry.cursor() as cr:
+                cr.execute("""
+                    UPDATE vtp_address_cache
+                       SET hit_count = hit_count + 1, last_hit = now() at time zone 'UTC'
+                     WHERE id IN (
+                            SELECT id FROM vtp_address_cache
+                             WHERE address_key = ANY(%s)
+                               FOR UPDATE SKIP LOCKED
+                           )
+                """, (keys,))
+        except Exception as e:
+            _logger.warning(f"VTP Address cache: không cập nhật được thống kê: {e}")
+
+    @api.model
+    def _get_ttl_days(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            PARAM_ADDRESS_CACHE_TTL, DEFAULT_ADDRESS_CACHE_TTL_DAYS))
+
+    @api.model
+    def _get_stats(self):
+        self.env.cr.execute("""
+            SELECT count(*), COALESCE(sum(hit_count), 0),
+                   count(*) FILTER (WHERE expires_at <= now() at time zone 'UTC')
+              FROM vtp_address_cache
+        """)
+        entries, hits, expired = self.env.cr.fetchone()
+        return {'entries': entries, 'total_hits': hits, 'expired': expired}
+
+    @api.autovacuum
+    def _gc_address_cache(self):
+        """Xóa bản ghi hết hạn, rồi bỏ bản ghi ít dùng gần đây nhất khi vượt giới hạn (LRU)"""
+        max_entries = int(self.env['ir.config_parameter'].sudo().get_param(
+            PARAM_ADDRESS_CACHE_MAX, DEFAULT_ADDRESS_CACHE_MAX_ENTRIES))
+        self.env.cr.execute("DELETE FROM vtp_address_cache WHERE expires_at <= now() at time zone 'UTC'")
+        self.env.cr.execute("""
+            DELETE FROM vtp_address_cache
+             WHERE id IN (SELECT id FROM vtp_address_cache ORDER BY last_hit DESC OFFSET %s)
+        """, (max_entries,))
+        return True
@@ -5,6 +5,7 @@ Track all API calls for debugging, auditing, and compliance.
 """
 
 from odoo import models, fields, api
+from odoo.tools.sql import create_index
 from datetime import datetime, timedelta
 import logging
 
@@ -63,6 +64,11 @@ class VTPAPIAudit(models.Model):
     # User tracking
     user_id = fields.Many2one('res.users', string='User', default=lambda self: self.env.user)
     
+    def init(self):
+        # Account pool đọc số liệu gần đây theo tài khoản
+        create_index(self.env.cr, 'vtp_api_audit_account_timestamp_idx',
+                     self._table, ['account_id', 'timestamp'])
+
     @api.autovacuum
     def _gc_audit_logs(self):
         """Auto-delete logs older than 90 days to manage disk space"""
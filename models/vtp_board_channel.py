@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Board Channel - Giới hạn tần suất thông báo bus của board vận đơn theo tài khoản
+
+Mỗi transaction ghi các vận đơn thay đổi vào vtp_board_pending. Kênh của một tài
+khoản chỉ được gửi khi đã qua khoảng tối thiểu kể từ lần gửi trước (last_sent);
+khi đó mọi vận đơn đang chờ của tài khoản (kể cả từ transaction / worker khác)
+được gộp vào một thông báo. Vận đơn còn chờ khi hết cửa sổ được gửi bởi lần cập
+nhật kế tiếp hoặc bởi cron flush (trailing flush).
+
+Vận đơn đã sang trạng thái cuối (hoặc bị xóa) được gửi trong 'removed' để client
+bỏ khỏi board.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+PARAM_BOARD_MIN_INTERVAL = 'viettel_ingration_odoo_18.board_min_interval_seconds'
+DEFAULT_BOARD_MIN_INTERVAL = 2
+
+
+class VTPBoardChannel(models.Model):
+    _name = 'vtp.board.channel'
+    _description = 'ViettelPost Shipment Board Channel'
+    _log_access = False
+
+    account_id = fields.Many2one('vtp.account', string='Tài khoản VTP', required=True, ondelete='cascade')
+    last_sent = fields.Datetime(string='Gửi lần cuối', readonly=True)
+
+    _sql_constraints = [
+        ('account_unique', 'UNIQUE(account_id)', 'Mỗi tài khoản chỉ có một kênh board!'),
+    ]
+
+    @api.model
+    def _get_min_interval(self):
+        return float(self.env['ir.config_parameter'].sudo().get_param(
+            PARAM_BOARD_MIN_INTERVAL, DEFAULT_BOARD_MIN_INTERVAL))
+
+    @api.model
+    def _enqueue(self, pending):
+        """
+        Ghi vận đơn chờ gửi và gửi ngay các kênh đã hết khoảng chờ.
+
+        Args:
+            pending: dict {account_id: set(bill_id)}
+        """
+        rows = [(account_id, bill_id) for account_id, bill_ids in pending.items() for bill_id in bill_ids]
+        if not rows:
+            return
+        execute_values(self.env.cr._obj, """
+            INSERT INTO vtp_board_pending (account_id, bill_id) VALUES %s
+            ON CONFLICT (account_id, bill_id) DO NOTHING
+        """, rows, page_size=1000)
+        self._flush_accounts(list(pending))
+
+    @api.model
+    def _flush_accounts(self, account_ids):
+        """Gửi các kênh đã qua khoảng tối thiểu; hẹn cron flush cho các kênh còn lại"""
+        cr = self.env.cr
+        interval = self._get_min_interval()
+        execute_values(cr._obj, """
+            INSERT INTO vtp_board_channel (account_id) VALUES %s
+            ON CONFLICT (account_id) DO NOTHING
+        """, [(account_id,) for account_id in account_ids])
+        # clock_timestamp(): transaction webhook có thể kéo dài, now() là lúc bắt đầu transaction
+        cr.execute("""
+            UPDATE vtp_board_channel
+               SET last_sent = clock_timestamp() at time zone 'UTC'
+             WHERE account_id = ANY(%s)
+               AND (last_sent IS NULL
+                    OR last_sent <= (clock_timestamp() at time zone 'UTC') - make_interval(secs => %s))
+         RETURNING account_id
+        """, (account_ids, interval))
+        due = [row[0] for row in cr.fetchall()]
+        if due:
+            cr.execute("""
+                DELETE FROM vtp_board_pending WHERE account_id = ANY(%s)
+             RETURNING account_id, bill_id
+            """, (due,))
+            bills_by_account = defaultdict(list)
+            for account_id, bill_id in cr.fetchall():
+                bills_by_account[account_id].append(bill_id)
+            self.env['vtp.order.bill']._send_board_payloads(bills_by_account)
+        if len(due) < len(account_ids):
+            self._schedule_flush(interval)
+        self.invalidate_model()
+
+    @api.model
+    def _schedule_flush(self, interval):
+        """Hẹn cron flush sau khoảng tối thiểu (bỏ qua nếu đã có lần chạy được hẹn)"""
+        cron = self.env.ref('viettel_ingration_odoo_18.ir_cron_viettelpost_board_flush', raise_if_not_found=False)
+        if not cron:
+            return
+        self.env.cr.execute("""
+            SELECT 1 FROM ir_cron_trigger WHERE cron_id = %s AND call_at >= now() at time zone 'UTC' LIMIT 1
+        """, (cron.id,))
+        if not self.env.cr.fetchone():
+            cron.sudo()._trigger(at=fields.Datetime.now() + timedelta(seconds=interval))
+
+    @api.model
+    def _cron_flush(self):
+        """Trailing flush: gửi vận đơn còn chờ của các kênh đã hết khoảng chờ"""
+        self.env.cr.execute("SELECT DISTINCT account_id FROM vtp_board_pending")
+        account_ids = [row[0] for row in self.env.cr.fetchall()]
+        if account_ids:
+            self._flush_accounts(account_ids)
+        return True
+
+
+class VTPBoardPending(models.Model):
+    _name = 'vtp.board.pending'
+    _description = 'ViettelPost Shipment Board Pending Update'
+    _log_access = False
+
+    account_id = fields.Many2one('vtp.account', string='Tài khoản VTP', required=True, ondelete='cascade')
+    bill_id = fields.Integer(string='Vận đơn', required=True)
+
+    _sql_constraints = [
+        ('account_bill_unique', 'UNIQUE(account_id, bill_id)', 'Vận đơn đã chờ gửi!'),
+    ]
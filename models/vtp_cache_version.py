@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Cache Version - Phiên bản cho các bảng tra cứu được cache theo worker (ormcache)
+
+registry.clear_cache() xóa toàn bộ ormcache 'default' (của mọi module) trên mọi
+worker. Thay vào đó mỗi bảng tra cứu có một sequence PostgreSQL làm phiên bản;
+hàm ormcache nhận phiên bản làm một phần khóa cache. Khi dữ liệu nguồn thay đổi,
+phiên bản được tăng sau khi transaction commit, nên worker đọc phiên bản mới chắc
+chắn thấy dữ liệu đã commit. Các mục cache của phiên bản cũ bị LRU loại dần.
+"""
+
+import logging
+
+from odoo import api, models
+from odoo.tools import SQL
+
+_logger = logging.getLogger(__name__)
+
+CACHE_VERSIONS = ('gazetteer', 'address_conversion', 'store_route', 'transit_stat')
+
+
+def _sequence(name):
+    return f'vtp_cache_version_{name}_seq'
+
+
+class VTPCacheVersion(models.AbstractModel):
+    _name = 'vtp.cache.version'
+    _description = 'ViettelPost Lookup Cache Version'
+
+    def init(self):
+        for name in CACHE_VERSIONS:
+            self.env.cr.execute(SQL("CREATE SEQUENCE IF NOT EXISTS %s", SQL.identifier(_sequence(name))))
+
+    @api.model
+    def _get(self, name):
+        """Phiên bản hiện tại của bảng tra cứu (đọc sequence, không khóa)"""
+        # Sequence mới có last_value = 1 nhưng is_called = false, và nextval() đầu tiên
+        # cũng trả về 1: coi sequence chưa dùng là phiên bản 0 để lần tăng đầu có hiệu lực
+        self.env.cr.execute(SQL(
+            "SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM %s",
+            SQL.identifier(_sequence(name))))
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _bump(self, name):
+        """Tăng phiên bản sau khi transaction hiện tại commit (một lần mỗi transaction)"""
+        pending = self.env.cr.postcommit.data.setdefault('vtp_cache_version.pending', set())
+        if not pending:
+            self.env.cr.postcommit.add(self._run_pending_bumps)
+        pending.add(name)
+
+    @api.model
+    def _run_pending_bumps(self):
+        pending = self.env.cr.postcommit.data.pop('vtp_cache_version.pending', set())
+        if not pending:
+            return
+        with self.env.registry.cursor() as cr:
+            for name in sorted(pending):
+                cr.execute(SQL("SELECT nextval(%s)", _sequence(name)))
+        _logger.info(f"VTP Cache: Tăng phiên bản {', '.join(sorted(pending))}")
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+VTP COD Reconciliation - Đối soát tiền thu hộ (COD) với bảng kê ViettelPost
+
+Mỗi lần import bảng kê tạo một batch (vtp.cod.reconcile). Các dòng bảng kê được
+ghi bằng INSERT nhiều dòng, sau đó đối chiếu với vtp_order_bill theo mã vận đơn
+bằng một câu UPDATE ... FROM (không duyệt từng bản ghi). Batch có tài khoản chỉ
+đối chiếu với vận đơn của tài khoản đó; vận đơn của tài khoản khác coi như không có.
+"""
+
+import logging
+
+from psycopg2.extras import execute_values
+
+from odoo import _, fields, models
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+# Trạng thái vận đơn được VTP trả tiền thu hộ: phát thành công / chuyển trả thành công
+COD_SETTLED_STATES = [501, 504]
+# Số dòng bảng kê mỗi câu INSERT
+COD_INSERT_CHUNK = 5000
+
+MATCH_STATES = [
+    ('pending', 'Chưa đối soát'),
+    ('matched', 'Khớp'),
+    ('mismatch', 'Lệch số tiền'),
+    ('missing_bill', 'Không có vận đơn'),
+    ('not_delivered', 'Chưa giao thành công'),
+    ('duplicate', 'Trùng dòng'),
+]
+
+
+class VTPCodReconcile(models.Model):
+    _name = 'vtp.cod.reconcile'
+    _description = 'ViettelPost COD Reconciliation'
+    _inherit = ['mail.thread']
+    _order = 'create_date desc, id desc'
+
+    name = fields.Char(string='Tên', required=True, default=lambda self: _('Đối soát COD %s') % fields.Date.today())
+    account_id = fields.Many2one('vtp.account', string='Tài khoản VTP', ondelete='set null', index=True)
+    filename = fields.Char(string='Tên file')
+    state = fields.Selection([
+        ('draft', 'Nháp'),
+        ('done', 'Đã đối soát'),
+    ], string='Trạng thái', default='draft', required=True, tracking=True)
+    tolerance = fields.Float(string='Sai số cho phép', default=0.0)
+    line_ids = fields.One2many('vtp.cod.reconcile.line', 'batch_id', string='Dòng bảng kê')
+
+    line_count = fields.Integer(string='Số dòng', readonly=True)
+    matched_count = fields.Integer(string='Khớp', readonly=True)
+    mismatch_count = fields.Integer(string='Lệch số tiền', readonly=True)
+    missing_count = fields.Integer(string='Không có vận đơn', readonly=True)
+    not_delivered_count = fields.Integer(string='Chưa giao thành công', readonly=True)
+    duplicate_count = fields.Integer(string='Trùng dòng', readonly=True)
+    total_remitted = fields.Float(string='Tổng VTP chuyển', readonly=True)
+    total_expected = fields.Float(string='Tổng COD trên vận đơn', readonly=True)
+    total_difference = fields.Float(string='Chênh lệch', readonly=True)
+
+    # ============ Import ============
+
+    def _insert_lines(self, rows):
+        """
+        Ghi các dòng bảng kê theo chunk, mỗi chunk một câu INSERT.
+
+        Args:
+            rows: iterable of (row_number, order_number, amount) - có thể là generator
+        """
+        self.ensure_one()
+        uid = int(self.env.uid)
+        template = (
+            f"({self.id}, %s, %s, %s, 'pending', {uid}, now() at time zone 'UTC', "
+            f"{uid}, now() at time zone 'UTC')"
+        )
+        query = """
+            INSERT INTO vtp_cod_reconcile_line
+                (batch_id, row_number, order_number, amount, match_state,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES %s
+        """
+        total = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= COD_INSERT_CHUNK:
+                execute_values(self.env.cr._obj, query, chunk, template=template, page_size=len(chunk))
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            execute_values(self.env.cr._obj, query, chunk, template=template, page_size=len(chunk))
+            total += len(chunk)
+        self.env['vtp.cod.reconcile.line'].invalidate_model()
+        return total
+
+    # ============ Reconciliation ============
+
+    def action_reconcile(self):
+        """Đối soát toàn bộ dòng của batch với vận đơn bằng SQL theo tập"""
+        self.env.flush_all()
+        cr = self.env.cr
+        for batch in self:
+            params = {'batch': batch.id, 'tolerance': batch.tolerance or 0.0, 'settled': COD_SETTLED_STATES,
+                      'account': batch.account_id.id or None}
+
+            # Một mã vận đơn xuất hiện nhiều lần trong bảng kê: chỉ dòng đầu được đối soát
+            cr.execute("""
+                UPDATE vtp_cod_reconcile_line l
+                   SET match_state = 'duplicate', bill_id = NULL, expected_amount = 0, difference = 0
+                  FROM (
+                        SELECT id, row_number() OVER (PARTITION BY order_number ORDER BY row_number, id) AS rn
+                          FROM vtp_cod_reconcile_line
+                         WHERE batch_id = %(batch)s
+                       ) d
+                 WHERE l.id = d.id AND d.rn > 1
+            """, params)
+
+            cr.execute("""
+                UPDATE vtp_cod_reconcile_line l
+                   SET bill_id = b.id,
+                       bill_status = b.vtp_order_status,
+                       expected_amount = COALESCE(b.vtp_money_collection, 0),
+                       difference = l.amount - COALESCE(b.vtp_money_collection, 0),
+                       match_state = CASE
+                           WHEN NOT (COALESCE(b.vtp_order_status, 0) = ANY(%(settled)s)) THEN 'not_delivered'
+                           WHEN abs(l.amount - COALESCE(b.vtp_money_collection, 0)) <= %(tolerance)s THEN 'matched'
+                           ELSE 'mismatch'
+                       END
+                  FROM vtp_order_bill b
+                 WHERE l.batch_id = %(batch)s
+                   AND l.match_state != 'duplicate'
+                   AND b.order_number = l.order_number
+                   AND (%(account)s::int IS NULL OR b.account_id = %(account)s)
+            """, params)
+
+            cr.execute("""
+                UPDATE vtp_cod_reconcile_line
+                   SET match_state = 'missing_bill', bill_id = NULL, expected_amount = 0, difference = amount
+                 WHERE batch_id = %(batch)s
+                   AND match_state = 'pending'
+            """, params)
+
+            cr.execute("""
+                SELECT count(*),
+                       count(*) FILTER (WHERE match_state = 'matched'),
+                       count(*) FILTER (WHERE match_state = 'mismatch'),
+                       count(*) FILTER (WHERE match_state = 'missing_bill'),
+                       count(*) FILTER (WHERE match_state = 'not_delivered'),
+                       count(*) FILTER (WHERE match_state = 'duplicate'),
+                       COALESCE(sum(amount), 0),
+                       COALESCE(sum(expected_amount), 0)
+                  FROM vtp_cod_reconcile_line
+                 WHERE batch_id = %(batch)s
+            """, params)
+            (line_count, matched, mismatch, missing, not_delivered, duplicate,
+             remitted, expected) = cr.fetchone()
+
+            self.env['vtp.cod.reconcile.line'].invalidate_model()
+            batch.write({
+                'state': 'done',
+                'line_count': line_count,
+                'matched_count': matched,
+                'mismatch_count': mismatch,
+                'missing_count': missing,
+                'not_delivered_count': not_delivered,
+                'duplicate_count': duplicate,
+                'total_remitted': remitted,
+                'total_expected': expected,
+                'total_difference': remitted - expected,
+            })
+            _logger.info(
+                f"VTP COD: Batch {batch.name}: {line_count} dòng, {matched} khớp, {mismatch} lệch, "
+                f"{missing} không có vận đơn, {not_delivered} chưa giao"
+            )
+        return True
+
+    def action_reset(self):
+        """Đưa batch về nháp để đối soát lại (ví dụ sau khi đổi sai số cho phép)"""
+        if not self:
+            raise UserError(_('Không có batch nào được chọn.'))
+        self.env.flush_all()
+        self.env.cr.execute("""
+            UPDATE vtp_cod_reconcile_line
+               SET match_state = 'pending', bill_id = NULL, bill_status = NULL,
+                   expected_amount = 0, difference = 0
+             WHERE batch_id IN %s
+        """, (tuple(self.ids),))
+        self.env['vtp.cod.reconcile.line'].invalidate_model()
+        self.write({'state': 'draft'})
+
+    def action_view_lines(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Dòng bảng kê'),
+            'res_model': 'vtp.cod.reconcile.line',
+            'view_mode': 'list,form',
+            'domain': [('batch_id', '=', self.id)],
+            'context': {'search_default_filter_problem': 1},
+        }
+
+
+class VTPCodReconcileLine(models.Model):
+    _name = 'vtp.cod.reconcile.line'
+    _description = 'ViettelPost COD Reconciliation Line'
+    _order = 'batch_id, row_number, id'
+    _rec_name = 'order_number'
+
+    batch_id = fields.Many2one('vtp.cod.reconcile', string='Batch', required=True, ondelete='cascade', index=True)
+    row_number = fields.Integer(string='Dòng')
+    order_number = fields.Char(string='Mã vận đơn ViettelPost', required=True)
+    amount = fields.Float(string='VTP chuyển')
+    bill_id = fields.Many2one('vtp.order.bill', string='Vận đơn', ondelete='set null', index='btree_not_null')
+    bill_status = fields.Integer(string='Trạng thái vận đơn')
+    expected_amount = fields.Float(string='COD trên vận đơn')
+    difference = fields.Float(string='Chênh lệch')
+    match_state = fields.Selection(MATCH_STATES, string='Kết quả', default='pending', required=True, index=True)
+
+    def init(self):
+        # Đối soát theo batch + mã vận đơn
+        create_index(self.env.cr, 'vtp_cod_reconcile_line_batch_order_idx',
+                     self._table, ['batch_id', 'order_number'])
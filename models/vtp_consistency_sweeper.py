@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Consistency Sweeper - Đồng bộ trạng thái vận đơn giữa bill / picking / sale order
+
+Trạng thái một lô hàng được lưu lặp lại ở vtp.order.bill (order_number,
+vtp_order_status, order_id), stock.picking (vtp_order_number, vtp_state, vtp_id)
+và sale.order (vtp_id). Mỗi kiểm tra là một câu SQL theo tập: đếm (dry run)
+hoặc sửa theo chunk giới hạn bằng UPDATE ... WHERE id IN (SELECT ... LIMIT n).
+"""
+
+import logging
+
+from odoo import api, models
+
+from .vtp_order_bill import PICKING_STATE_MAPPING
+
+_logger = logging.getLogger(__name__)
+
+SWEEP_CHUNK_SIZE = 5000
+SWEEP_MAX_CHUNKS = 100
+SWEEP_SAMPLE_SIZE = 20
+
+# Mỗi kiểm tra: 'select' trả về (id đối tượng cần sửa, mô tả); 'fix' cập nhật các id
+# thuộc %(ids_query)s. Kiểm tra không có 'fix' chỉ được báo cáo.
+CONSISTENCY_CHECKS = [
+    {
+        'code': 'picking_missing_bill_link',
+        'label': 'Phiếu giao hàng chưa liên kết vận đơn (vtp_id trống)',
+        'select': """
+            SELECT p.id, p.name || ' -> ' || b.order_number
+              FROM stock_picking p
+              JOIN vtp_order_bill b ON b.order_id = p.id
+             WHERE p.vtp_id IS NULL
+        """,
+        'fix': """
+            UPDATE stock_picking p
+               SET vtp_id = b.id
+              FROM vtp_order_bill b
+             WHERE b.order_id = p.id
+               AND p.vtp_id IS NULL
+               AND p.id IN (%(ids_query)s)
+        """,
+    },
+    {
+        'code': 'bill_missing_picking',
+        'label': 'Vận đơn chưa gắn phiếu giao hàng nhưng tìm được theo mã vận đơn',
+        'select': """
+            SELECT b.id, b.order_number || ' -> ' || p.name
+              FROM vtp_order_bill b
+              JOIN stock_picking p ON p.vtp_order_number = b.order_number
+             WHERE b.order_id IS NULL
+               AND b.order_number IS NOT NULL
+        """,
+        'fix': """
+            UPDATE vtp_order_bill b
+               SET order_id = p.id, sale_id = p.sale_id
+              FROM stock_picking p
+             WHERE p.vtp_order_number = b.order_number
+               AND b.order_id IS NULL
+               AND b.id IN (%(ids_query)s)
+        """,
+    },
+    {
+        'code': 'picking_order_number_mismatch',
+        'label': 'Mã vận đơn trên phiếu giao hàng khác vận đơn liên kết',
+        'select': """
+            SELECT p.id, p.name || ': ' || COALESCE(p.vtp_order_number, '∅') || ' != ' || b.order_number
+              FROM stock_picking p
+              JOIN vtp_order_bill b ON b.id = p.vtp_id
+             WHERE b.order_number IS NOT NULL
+               AND p.vtp_order_number IS DISTINCT FROM b.order_number
+        """,
+        'fix': """
+            UPDATE stock_picking p
+               SET vtp_order_number = b.order_number
+              FROM vtp_order_bill b
+             WHERE b.id = p.vtp_id
+               AND b.order_number IS NOT NULL
+               AND p.id IN (%(ids_query)s)
+        """,
+    },
+    {
+        'code': 'picking_state_mismatch',
+        'label': 'Trạng thái VTP của phiếu giao hàng lệch trạng thái vận đơn',
+        'select': """
+            SELECT p.id, p.name || ': ' || COALESCE(p.vtp_state, '∅') || ' != ' || m.vtp_state
+                   || ' (' || b.vtp_order_status || ')'
+              FROM stock_picking p
+              JOIN vtp_order_bill b ON b.id = p.vtp_id
+              JOIN unnest(%(statuses)s::int[], %(states)s::varchar[]) AS m(status, vtp_state)
+                ON m.status = b.vtp_order_status
+             WHERE p.vtp_state IS DISTINCT FROM m.vtp_state
+        """,
+        'fix': """
+            UPDATE stock_picking p
+               SET vtp_state = m.vtp_state, vtp_status_name = COALESCE(b.status_name, p.vtp_status_name)
+              FROM vtp_order_bill b
+              JOIN unnest(%(statuses)s::int[], %(states)s::varchar[]) AS m(status, vtp_state)
+                ON m.status = b.vtp_order_status
+             WHERE b.id = p.vtp_id
+               AND p.id IN (%(ids_query)s)
+        """,
+    },
+    {
+        'code': 'sale_missing_bill_link',
+        'label': 'Đơn bán chưa liên kết vận đơn của phiếu giao hàng',
+        'select': """
+            SELECT DISTINCT ON (s.id) s.id, s.name || ' -> ' || b.order_number
+              FROM sale_order s
+              JOIN stock_picking p ON p.sale_id = s.id
+              JOIN vtp_order_bill b ON b.id = p.vtp_id
+             WHERE s.vtp_id IS NULL
+          ORDER BY s.id, p.id DESC
+        """,
+        'fix': """
+            UPDATE sale_order s
+               SET vtp_id = x.bill_id
+              FROM (
+                    SELECT DISTINCT ON (p.sale_id) p.sale_id, p.vtp_id AS bill_id
+                      FROM stock_picking p
+                     WHERE p.vtp_id IS NOT NULL AND p.sale_id IS NOT NULL
+                  ORDER BY p.sale_id, p.id DESC
+                   ) x
+             WHERE x.sale_id = s.id
+               AND s.vtp_id IS NULL
+               AND s.id IN (%(ids_query)s)
+        """,
+    },
+    {
+        'code': 'orphan_bill',
+        'label': 'Vận đơn không có phiếu giao hàng (chỉ báo cáo)',
+        'select': """
+            SELECT b.id, COALESCE(b.order_number, b.name)
+              FROM vtp_order_bill b
+             WHERE b.order_id IS NULL
+               AND NOT EXISTS (SELECT 1 FROM stock_picking p WHERE p.vtp_order_number = b.order_number)
+        """,
+    },
+    {
+        'code': 'picking_without_bill',
+        'label': 'Phiếu giao hàng có mã vận đơn nhưng không có vận đơn (chỉ báo cáo)',
+        'select': """
+            SELECT p.id, p.name || ': ' || p.vtp_order_number
+              FROM stock_picking p
+             WHERE p.vtp_order_number IS NOT NULL
+               AND p.vtp_id IS NULL
+               AND NOT EXISTS (SELECT 1 FROM vtp_order_bill b WHERE b.order_number = p.vtp_order_number)
+        """,
+    },
+]
+
+
+class VTPConsistencySweeper(models.AbstractModel):
+    _name = 'vtp.consistency.sweeper'
+    _description = 'ViettelPost Consistency Sweeper'
+
+    @api.model
+    def _sweep(self, dry_run=True, chunk_size=SWEEP_CHUNK_SIZE, max_chunks=SWEEP_MAX_CHUNKS, checks=None):
+        """
+        Chạy các kiểm tra nhất quán.
+
+        Args:
+            dry_run: bool - Chỉ đếm và lấy mẫu, không sửa
+            chunk_size: int - Số bản ghi sửa mỗi câu UPDATE
+            max_chunks: int - Giới hạn số chunk mỗi kiểm tra trong một lần chạy
+            checks: list[str] - Mã kiểm tra cần chạy (mặc định: tất cả)
+
+        Returns:
+            list[dict]: {'code', 'label', 'found', 'fixed', 'fixable', 'samples'}
+        """
+        self.env.flush_all()
+        cr = self.env.cr
+        statuses = list(PICKING_STATE_MAPPING)
+        base_params = {
+            'statuses': statuses,
+            'states': [PICKING_STATE_MAPPING[s] for s in statuses],
+        }
+
+        report = []
+        for check in CONSISTENCY_CHECKS:
+            if checks and check['code'] not in checks:
+                continue
+            cr.execute(f"SELECT count(*) FROM ({check['select']}) q", base_params)
+            found = cr.fetchone()[0]
+            cr.execute(f"SELECT * FROM ({check['select']}) q LIMIT %(sample)s",
+                       dict(base_params, sample=SWEEP_SAMPLE_SIZE))
+            samples = [detail for unused, detail in cr.fetchall()]
+
+            fixed = 0
+            if found and not dry_run and check.get('fix'):
+                ids_query = f"SELECT q.id FROM ({check['select']}) q LIMIT %(limit)s"
+                fix_query = check['fix'].replace('%(ids_query)s', ids_query)
+                for unused in range(max_chunks):
+                    cr.execute(fix_query, dict(base_params, limit=chunk_size))
+                    fixed += cr.rowcount
+                    if cr.rowcount < chunk_size:
+                        break
+
+            report.append({
+                'code': check['code'],
+                'label': check['label'],
+                'found': found,
+                'fixed': fixed,
+                'fixable': bool(check.get('fix')),
+                'samples': samples,
+            })
+
+        if not dry_run:
+            self.env.invalidate_all()
+        _logger.info("VTP Sweep (%s): %s", 'dry run' if dry_run else 'repair',
+                     ', '.join(f"{r['code']}={r['found']}/{r['fixed']}" for r in report))
+        return report
+
+    @api.model
+    def _cron_sweep(self):
+        """Cron: sửa các lệch dữ liệu có thể sửa tự động"""
+        return self._sweep(dry_run=False)
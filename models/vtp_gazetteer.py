@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Gazetteer - Tự động nhận diện tỉnh / quận / phường từ địa chỉ khách hàng
+
+Chỉ mục địa danh (services/address_gazetteer.py) được dựng một lần mỗi worker
+từ bảng vtp_province / vtp_district / vtp_ward và giữ trong ormcache theo phiên
+bản 'gazetteer' (vtp.cache.version), được tăng khi danh mục địa giới thay đổi.
+"""
+
+import logging
+
+from psycopg2.extras import execute_values
+
+from odoo import api, models, tools
+
+from ..services.address_gazetteer import Gazetteer
+
+_logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+class VTPGazetteer(models.AbstractModel):
+    _name = 'vtp.gazetteer'
+    _description = 'ViettelPost Address Gazetteer'
+
+    @api.model
+    def _get_gazetteer(self):
+        return self._build_gazetteer(self.env['vtp.cache.version']._get('gazetteer'))
+
+    @api.model
+    @tools.ormcache('version')
+    def _build_gazetteer(self, version):
+        cr = self.env.cr
+        cr.execute("SELECT id, province_name FROM vtp_province")
+        provinces = cr.fetchall()
+        cr.execute('SELECT id, district_name, "provinceId" FROM vtp_district')
+        districts = cr.fetchall()
+        cr.execute('SELECT id, ward_name, "districtId" FROM vtp_ward')
+        wards = cr.fetchall()
+        _logger.info(f"VTP Gazetteer: Dựng chỉ mục {len(provinces)} tỉnh, {len(districts)} quận, {len(wards)} phường")
+        return Gazetteer(provinces, districts, wards)
+
+    @api.model
+    def _get_province_by_state_code(self, state_code):
+        return self._lookup_province_by_state_code(state_code, self.env['vtp.cache.version']._get('gazetteer'))
+
+    @api.model
+    @tools.ormcache('state_code', 'version')
+    def _lookup_province_by_state_code(self, state_code, version):
+        self.env.cr.execute("SELECT id FROM vtp_province WHERE province_code = %s ORDER BY id LIMIT 1", (state_code,))
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
+
+    @api.model
+    def resolve_address(self, *texts, state_code=None):
+        """
+        Phân giải địa chỉ tự do thành id tỉnh / quận / phường.
+
+        Args:
+            texts: các phần địa chỉ (street, street2, city)
+            state_code: mã res.country.state của khách hàng (gợi ý tỉnh)
+
+        Returns:
+            dict: {'province_id', 'district_id', 'ward_id'} (None nếu không xác định)
+        """
+        hint = self._get_province_by_state_code(state_code) if state_code else None
+        return self._get_gazetteer().resolve(*texts, province_hint=hint)
+
+    @api.model
+    def resolve_partner(self, partner):
+        """Địa chỉ VTP của khách hàng: dùng kết quả đã lưu, nếu chưa có thì phân giải ngay"""
+        if partner.vtp_province_id:
+            return {
+                'province_id': partner.vtp_province_id.id,
+                'district_id': partner.vtp_district_id.id or None,
+                'ward_id': partner.vtp_ward_id.id or None,
+            }
+        return self.resolve_address(partner.street, partner.street2, partner.city,
+                                    state_code=partner.state_id.code)
+
+    # ============ Backfill ============
+
+    @api.model
+    def _cron_backfill_partners(self, batch_size=BACKFILL_BATCH_SIZE, max_batches=20):
+        """Phân giải địa chỉ cho các khách hàng chưa được xử lý, ghi kết quả bằng SQL theo batch"""
+        cr = self.env.cr
+        gazetteer = self._get_gazetteer()
+        total = 0
+        for unused in range(max_batches):
+            self.env['res.partner'].flush_model(['street', 'street2', 'city', 'state_id', 'vtp_address_checked'])
+            cr.execute("""
+                SELECT p.id, p.street, p.street2, p.city, s.code
+                  FROM res_partner p
+                  LEFT JOIN res_country_state s ON s.id = p.state_id
+                 WHERE p.vtp_address_checked IS NOT TRUE
+                   AND (p.street IS NOT NULL OR p.city IS NOT NULL)
+              ORDER BY p.id
+                 LIMIT %s
+            """, (batch_size,))
+            rows = cr.fetchall()
+            if not rows:
+                break
+
+            values = []
+            for partner_id, street, street2, city, state_code in rows:
+                hint = self._get_province_by_state_code(state_code) if state_code else None
+                resolved = gazetteer.resolve(street, street2, city, province_hint=hint)
+                values.append((partner_id, resolved['province_id'], resolved['district_id'], resolved['ward_id']))
+
+            execute_values(cr._obj, """
+                UPDATE res_partner p
+                   SET vtp_province_id = v.province_id,
+                       vtp_district_id = v.district_id,
+                       vtp_ward_id = v.ward_id,
+                       vtp_address_checked = TRUE
+                  FROM (VALUES %s) AS v(id, province_id, district_id, ward_id)
+                 WHERE p.id = v.id
+            """, values, template='(%s, %s::int, %s::int, %s::int)', page_size=1000)
+            self.env['res.partner'].invalidate_model(['vtp_province_id', 'vtp_district_id', 'vtp_ward_id', 'vtp_address_checked'])
+            total += len(rows)
+            cr.commit()
+
+        if total:
+            _logger.info(f"VTP Gazetteer: Đã phân giải địa chỉ {total} khách hàng")
+        return total
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Outbound Notifications - Gửi thay đổi trạng thái vận đơn tới hệ thống khác
+
+Luồng webhook chỉ ghi một câu INSERT ... SELECT vào outbox (một dòng cho mỗi
+subscriber phù hợp). Cron dispatcher gửi theo batch cho từng subscriber, ký
+HMAC-SHA256, giữ thứ tự theo id và retry với exponential backoff.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from datetime import timedelta
+
+import requests
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+NOTIFY_BATCH_SIZE = 100
+NOTIFY_MAX_ATTEMPTS = 10
+# Backoff: base * 2^(attempts - 1), tối đa NOTIFY_BACKOFF_MAX giây
+NOTIFY_BACKOFF_BASE = 30
+NOTIFY_BACKOFF_MAX = 6 * 3600
+# Giới hạn thời gian một lần chạy cron dispatcher (giây)
+NOTIFY_DISPATCH_BUDGET = 50
+
+SIGNATURE_HEADER = 'X-VTP-Signature'
+TIMESTAMP_HEADER = 'X-VTP-Timestamp'
+
+
+def sign_payload(secret, timestamp, body):
+    """Chữ ký HMAC-SHA256 của '<timestamp>.<body>'"""
+    message = f"{timestamp}.".encode('utf-8') + body
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+class VTPNotifySubscriber(models.Model):
+    _name = 'vtp.notify.subscriber'
+    _description = 'ViettelPost Status Notification Subscriber'
+    _order = 'name'
+
+    name = fields.Char(string='Tên', required=True)
+    url = fields.Char(string='Endpoint URL', required=True)
+    secret = fields.Char(
+        string='Secret ký HMAC', required=True, copy=False,
+        default=lambda self: secrets.token_urlsafe(32),
+        groups='viettel_ingration_odoo_18.group_viettel_post_admin',
+    )
+    account_id = fields.Many2one('vtp.account', string='Tài khoản VTP', ondelete='cascade',
+                                 help='Để trống: nhận sự kiện của mọi tài khoản')
+    active = fields.Boolean(default=True)
+    batch_size = fields.Integer(string='Số sự kiện mỗi batch', default=NOTIFY_BATCH_SIZE)
+    timeout = fields.Integer(string='Timeout (giây)', default=10)
+    max_attempts = fields.Integer(string='Số lần thử tối đa', default=NOTIFY_MAX_ATTEMPTS)
+    last_success_at = fields.Datetime(string='Gửi thành công lần cuối', readonly=True)
+    last_error = fields.Text(string='Lỗi gần nhất', readonly=True)
+    pending_count = fields.Integer(string='Đang chờ gửi', compute='_compute_pending_count')
+
+    def _compute_pending_count(self):
+        counts = dict(self.env['vtp.notify.outbox']._read_group(
+            [('subscriber_id', 'in', self.ids), ('state', '=', 'pending')], ['subscriber_id'], ['__count'],
+        ))
+        for subscriber in self:
+            subscriber.pending_count = counts.get(subscriber, 0)
+
+    def action_send_test(self):
+        """Gửi một sự kiện thử (không qua outbox)"""
+        self.ensure_one()
+        ok, error = self._post_events([{
+            'id': 0,
+            'test': True,
+            'order_number': 'TEST',
+            'order_status': 0,
+            'status_name': 'Test',
+        }])
+        if not ok:
+            raise UserError(_('Gửi thử thất bại: %s') % error)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Thành công'),
+                'message': _('Subscriber %s đã nhận sự kiện thử.') % self.name,
+                'type': 'success',
+                'sticky': False,
+            },
+        }
+
+    def _post_events(self, events):
+        """POST một batch đã ký; trả về (thành công, lỗi)"""
+        self.ensure_one()
+        body = json.dumps({'events': events}, ensure_ascii=False, default=str).encode('utf-8')
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            TIMESTAMP_HEADER: timestamp,
+            SIGNATURE_HEADER: sign_payload(self.sudo().secret, timestamp, body),
+        }
+        try:
+            response = requests.post(self.url, data=body, headers=headers, timeout=self.timeout or 10)
+        except requests.exceptions.RequestException as e:
+            return False, f"Lỗi kết nối: {e}"
+        if 200 <= response.status_code < 300:
+            return True, None
+        return False, f"HTTP {response.status_code}: {response.text[:500]}"
+
+
+class VTPNotifyOutbox(models.Model):
+    _name = 'vtp.notify.outbox'
+    _description = 'ViettelPost Status Notification Outbox'
+    _order = 'id'
+    _rec_name = 'order_number'
+
+    subscriber_id = fields.Many2one('vtp.notify.subscriber', string='Subscriber', required=True,
+                                    ondelete='cascade', index=True)
+    bill_id = fields.Many2one('vtp.order.bill', string='Vận đơn', ondelete='set null')
+    order_number = fields.Char(string='Mã vận đơn ViettelPost')
+    order_status = fields.Integer(string='Mã trạng thái')
+    payload = fields.Text(string='Payload', required=True)
+    state = fields.Selection([
+        ('pending', 'Chờ gửi'),
+        ('sent', 'Đã gửi'),
+        ('dead', 'Thất bại'),
+    ], string='Trạng thái', default='pending', required=True, index=True)
+    attempts = fields.Integer(string='Số lần thử', default=0)
+    next_attempt_at = fields.Datetime(string='Thử lại lúc')
+    sent_at = fields.Datetime(string='Gửi lúc')
+    last_error = fields.Text(string='Lỗi')
+
+    def init(self):
+        # Dispatcher đọc các sự kiện pending theo thứ tự cho từng subscriber
+        create_index(self.env.cr, 'vtp_notify_outbox_pending_idx',
+                     self._table, ['subscriber_id', 'id'], where="state = 'pending'")
+
+    # ============ Enqueue (webhook hot path) ============
+
+    @api.model
+    def _enqueue_status_change(self, bill, data):
+        """Một câu INSERT ... SELECT: nhân bản sự kiện cho mọi subscriber phù hợp"""
+        payload = json.dumps({
+            'order_number': bill.order_number,
+            'order_reference': data.get('ORDER_REFERENCE'),
+            'order_status': bill.vtp_order_status,
+            'status_name': bill.status_name,
+            'status_date': bill.vtp_bill_updated_date,
+            'location': data.get('LOCATION_CURRENTLY'),
+            'account_id': bill.account_id.id,
+        }, ensure_ascii=False, default=str)
+        self.env.cr.execute("""
+            INSERT INTO vtp_notify_outbox
+                (subscriber_id, bill_id, order_number, order_status, payload, state, attempts,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT s.id, %(bill)s, %(order_number)s, %(status)s, %(payload)s, 'pending', 0,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM vtp_notify_subscriber s
+             WHERE s.active
+               AND (s.account_id IS NULL OR s.account_id = %(account)s)
+        """, {
+            'bill': bill.id,
+            'order_number': bill.order_number,
+            'status': bill.vtp_order_status,
+            'payload': payload,
+            'uid': self.env.uid,
+            'account': bill.account_id.id or None,
+        })
+
+    # ============ Dispatch ============
+
+    @api.model
+    def _cron_dispatch(self, budget=NOTIFY_DISPATCH_BUDGET):
+        """Gửi batch cho từng subscriber cho tới khi hết việc hoặc hết thời gian"""
+        deadline = time.monotonic() + budget
+        sent = 0
+        subscribers = self.env['vtp.notify.subscriber'].search([])
+        while subscribers and time.monotonic() < deadline:
+            progressed = self.env['vtp.notify.subscriber']
+            for subscriber in subscribers:
+                count = self._dispatch_subscriber(subscriber)
+                self.env.cr.commit()
+                if count:
+                    sent += count
+                    progressed |= subscriber
+                if time.monotonic() >= deadline:
+                    break
+            subscribers = progressed
+        if sent:
+            _logger.info(f"VTP Notify: Đã gửi {sent} sự kiện")
+        return sent
+
+    @api.model
+    def _dispatch_subscriber(self, subscriber):
+        """
+        Gửi batch kế tiếp của một subscriber.
+
+        Thứ tự được giữ: nếu sự kiện đầu hàng đang chờ backoff thì không gửi các sự kiện sau.
+        Khóa dòng subscriber (SKIP LOCKED) để hai worker không gửi song song.
+        """
+        cr = self.env.cr
+        cr.execute("SELECT id FROM vtp_notify_subscriber WHERE id = %s FOR UPDATE SKIP LOCKED", (subscriber.id,))
+        if not cr.fetchone():
+            return 0
+
+        cr.execute("""
+            SELECT id, payload, attempts, next_attempt_at
+              FROM vtp_notify_outbox
+             WHERE subscriber_id = %s AND state = 'pending'
+          ORDER BY id
+             LIMIT %s
+        """, (subscriber.id, max(subscriber.batch_size, 1)))
+        rows = cr.fetchall()
+        now = fields.Datetime.now()
+        if not rows or (rows[0][3] and rows[0][3] > now):
+            return 0
+
+        events = []
+        for outbox_id, payload, unused_attempts, unused_next in rows:
+            event = json.loads(payload)
+            event['id'] = outbox_id
+            events.append(event)
+
+        ok, error = subscriber._post_events(events)
+        ids = [row[0] for row in rows]
+        if ok:
+            self.browse(ids).write({'state': 'sent', 'sent_at': now, 'last_error': False})
+            subscriber.write({'last_success_at': now, 'last_error': False})
+            return len(ids)
+
+        attempts = rows[0][2] + 1
+        if attempts >= (subscriber.max_attempts or NOTIFY_MAX_ATTEMPTS):
+            # Bỏ batch này để không chặn các sự kiện sau
+            vals = {'state': 'dead', 'attempts': attempts, 'last_error': error}
+        else:
+            delay = min(NOTIFY_BACKOFF_BASE * 2 ** (attempts - 1), NOTIFY_BACKOFF_MAX)
+            vals = {'attempts': attempts, 'next_attempt_at': now + timedelta(seconds=delay), 'last_error': error}
+        self.browse(ids).write(vals)
+        subscriber.write({'last_error': error})
+        _logger.warning(f"VTP Notify: Gửi tới {subscriber.name} thất bại (lần {attempts}): {error}")
+        return 0
+
+    def action_retry(self):
+        self.filtered(lambda r: r.state == 'dead').write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_attempt_at': False,
+        })
+
+    @api.autovacuum
+    def _gc_sent_events(self):
+        """Xóa sự kiện đã gửi quá 7 ngày"""
+        self.env.cr.execute("""
+            DELETE FROM vtp_notify_outbox
+            WHERE state = 'sent' AND sent_at < (now() at time zone 'UTC') - interval '7 days'
+        """)
+        return True
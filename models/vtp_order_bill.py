@@ -4,12 +4,21 @@ VTP Order Bill Models - Enhanced with:
 - Account relationship for multi-account support
 - Token usage tracking for audit
 - API audit log integration
+- Per-item savepoints for webhook batches
 """
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-from datetime import datetime
+from odoo.tools.sql import create_index
+from datetime import timedelta
+import hashlib
+import json
 import logging
+import secrets
+
+from psycopg2.extras import execute_values
+
+from ..services.webhook_decoder import map_webhook_data, unwrap_webhook_item
 
 _logger = logging.getLogger(__name__)
 
@@ -45,6 +54,89 @@ VALID_TRANSITIONS = {
 # Các trạng thái cuối - không cho phép cập nhật tiếp
 FINAL_STATES = [101, 201, 501, 503, 504]
 
+# Trạng thái VTP của phiếu giao hàng (stock.picking.vtp_state) theo mã trạng thái ViettelPost
+PICKING_STATE_MAPPING = {
+    101: 'canceled',        # ViettelPost yêu cầu hủy đơn hàng
+    102: 'waiting_webhook', # Đơn hàng chờ xử lý
+    103: 'created',         # Giao cho bưu cục
+    104: 'created',         # Giao cho Bưu tá đi nhận
+    105: 'created',         # Bưu tá đã nhận hàng
+    106: 'created',         # Đối tác yêu cầu lấy lại hàng
+    107: 'draft',           # Đối tác yêu cầu hủy qua API
+    200: 'created',         # Nhận từ bưu tá - Bưu cục gốc
+    201: 'canceled',        # Hủy nhập phiếu gửi
+    202: 'created',         # Sửa phiếu gửi
+    300: 'created',         # Khai thác đi
+    400: 'created',         # Khai thác đến
+    500: 'created',         # Giao bưu tá đi phát
+    501: 'done',            # Phát thành công
+    502: 'created',         # Chuyển hoàn bưu cục gốc
+    503: 'canceled',        # Hủy - Theo yêu cầu khách hàng
+    504: 'done',            # Thành công - Chuyển trả cho người gửi
+    505: 'created',         # Tồn - Thông báo chuyển hoàn bưu cục gốc
+    506: 'created',         # Tồn - Khách hàng nghỉ, không có nhà
+    507: 'created',         # Tồn - Khách hàng đến bưu cục nhận
+    508: 'created',         # Phát tiếp
+    509: 'created',         # Chuyển tiếp bưu cục khác
+    515: 'created',         # Duyệt hoàn
+    550: 'created',         # Phát tiếp
+}
+
+VTP_STATE_SELECTION = [
+    ('draft', 'Nháp'),
+    ('waiting_webhook', 'Đang chờ xử lý'),
+    ('created', 'Đã tạo'),
+    ('done', 'Đã hoàn thành'),
+    ('canceled', 'Đã hủy'),
+]
+
+# Các trường của vận đơn ảnh hưởng tới bảng KPI (vtp.shipment.kpi)
+KPI_FIELDS = ['store_id', 'account_id', 'vtp_order_status', 'vtp_money_collection', 'vtp_money_totalfee']
+
+# Kết quả xử lý một sự kiện webhook - không cần gửi lại
+WEBHOOK_OUTCOMES = ['updated', 'ignored', 'invalid_transition', 'unknown_order', 'invalid']
+# Kết quả cần người gửi gửi lại item
+WEBHOOK_RETRY_STATUSES = ['error', 'unauthorized']
+
+# Giải phóng cache ORM sau mỗi N item để bộ nhớ không tăng theo kích thước batch
+WEBHOOK_CACHE_RESET_EVERY = 200
+
+# ============ Live Shipment Board (bus) ============
+# Kênh bus theo tài khoản: vtp_board_<account_id>
+BOARD_CHANNEL_PREFIX = 'vtp_board_'
+BOARD_NOTIFICATION = 'vtp_board/update'
+# Quá số vận đơn này trong một thông báo thì client tải lại thay vì áp delta
+BOARD_MAX_DELTA = 200
+# ============ Public Tracking ============
+TRACKING_TOKEN_BYTES = 24
+# Các trường lịch sử được công khai qua trang tra cứu (không gồm tiền, người nhận)
+TRACKING_HISTORY_FIELDS = ['order_status', 'status_name', 'order_status_date', 'location_currently', 'note']
+
+BOARD_FIELDS = [
+    'name', 'order_number', 'store_id', 'vtp_order_status', 'status_name',
+    'vtp_bill_updated_date', 'vtp_receiver_fullname', 'vtp_money_collection',
+]
+
+# ============ Status Polling (fallback khi không nhận được webhook) ============
+# Khoảng thời gian (phút) giữa hai lần hỏi trạng thái, theo trạng thái hiện tại
+POLL_INTERVALS = {
+    None: 60,    # Chưa có trạng thái
+    102: 60,     # Chờ xử lý
+    103: 120,    # Giao cho bưu cục
+    104: 120,    # Giao bưu tá đi nhận
+    105: 180,    # Bưu tá đã nhận
+    200: 180,    # Nhận từ bưu tá - Bưu cục gốc
+    300: 720,    # Khai thác đi - ít thay đổi
+    400: 720,    # Khai thác đến - ít thay đổi
+    500: 30,     # Đang giao - hỏi thường xuyên
+    502: 360,    # Chuyển hoàn
+    506: 120,    # Tồn - KH nghỉ
+    507: 120,    # Tồn - KH đến nhận
+    508: 60,     # Phát tiếp
+    550: 60,     # Phát tiếp
+}
+DEFAULT_POLL_INTERVAL = 240
+
 
 class VtpOrderBill(models.Model):
     _name = 'vtp.order.bill'
@@ -88,7 +180,138 @@ class VtpOrderBill(models.Model):
     
     # API Audit logs
     api_audit_ids = fields.One2many('vtp.api.audit', 'order_bill_id', string='API Audit Logs')
-    
+
+    # Projection trạng thái mới nhất - tra cứu O(1) thay vì tìm trong lịch sử
+    last_history_id = fields.Many2one(
+        'vtp.order.bill.history',
+        string='Lịch sử mới nhất',
+        readonly=True,
+        copy=False,
+        ondelete='set null',
+        index='btree_not_null',
+    )
+
+    # Polling trạng thái - chỉ các vận đơn chưa kết thúc có vtp_next_poll_date
+    vtp_last_poll_date = fields.Datetime(string='Hỏi trạng thái lần cuối', readonly=True, copy=False)
+    vtp_next_poll_date = fields.Datetime(
+        string='Hỏi trạng thái lần tới',
+        compute='_compute_vtp_next_poll_date',
+        store=True,
+        readonly=True,
+        copy=False,
+        index='btree_not_null',
+    )
+
+    # Tra cứu công khai - snapshot dựng sẵn, chỉ làm mới khi webhook thay đổi vận đơn
+    # Sinh trong create() - không dùng default (default chỉ được tính một lần khi thêm cột
+    # và bị ghi giống nhau vào mọi dòng cũ). Ràng buộc UNIQUE đã tạo index.
+    tracking_token = fields.Char(
+        string='Mã tra cứu',
+        readonly=True,
+        copy=False,
+    )
+    tracking_snapshot = fields.Text(string='Snapshot tra cứu', readonly=True, copy=False)
+    tracking_etag = fields.Char(string='ETag tra cứu', readonly=True, copy=False)
+    tracking_modified = fields.Datetime(string='Snapshot cập nhật lúc', readonly=True, copy=False)
+    tracking_url = fields.Char(string='Link tra cứu', compute='_compute_tracking_url')
+
+    _sql_constraints = [
+        ('tracking_token_unique', 'UNIQUE(tracking_token)', 'Mã tra cứu đã tồn tại!'),
+    ]
+
+    def init(self):
+        # Sinh mã tra cứu riêng cho các vận đơn tạo trước khi có tính năng này
+        self.env.cr.execute("SELECT id FROM vtp_order_bill WHERE tracking_token IS NULL")
+        rows = [(bill_id, secrets.token_urlsafe(TRACKING_TOKEN_BYTES)) for (bill_id,) in self.env.cr.fetchall()]
+        if rows:
+            execute_values(self.env.cr._obj, """
+                UPDATE vtp_order_bill b SET tracking_token = v.token
+                  FROM (VALUES %s) AS v(id, token)
+                 WHERE b.id = v.id
+            """, rows, page_size=1000)
+            _logger.info(f"VTP Tracking: Sinh mã tra cứu cho {len(rows)} vận đơn")
+        # Lọc/sắp xếp vận đơn theo trạng thái và thời điểm cập nhật (polling, lưu trữ)
+        create_index(
+            self.env.cr,
+            'vtp_order_bill_status_updated_idx',
+            self._table,
+            ['vtp_order_status', 'vtp_bill_updated_date'],
+        )
+        # Khởi tạo projection cho các vận đơn đã có lịch sử - chỉ khi còn vận đơn chưa có
+        # projection (kiểm tra rẻ, tránh quét toàn bộ lịch sử ở mỗi lần nâng cấp module)
+        self.env.cr.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM vtp_order_bill b
+                 WHERE b.last_history_id IS NULL
+                   AND EXISTS (SELECT 1 FROM vtp_order_bill_history h WHERE h.bill_id = b.id)
+            )
+        """)
+        if not self.env.cr.fetchone()[0]:
+            return
+        self.env.cr.execute("""
+            UPDATE vtp_order_bill b
+               SET last_history_id = h.id
+              FROM (
+                    SELECT DISTINCT ON (bill_id) id, bill_id
+                      FROM vtp_order_bill_history
+                     WHERE bill_id IN (SELECT id FROM vtp_order_bill WHERE last_history_id IS NULL)
+                  ORDER BY bill_id, create_date DESC, id DESC
+                   ) h
+             WHERE b.id = h.bill_id
+               AND b.last_history_id IS NULL
+        """)
+
+    @api.depends('order_number', 'vtp_order_status', 'vtp_bill_updated_date', 'vtp_last_poll_date')
+    def _compute_vtp_next_poll_date(self):
+        """Lần hỏi tiếp theo = mốc mới nhất (webhook hoặc poll) + khoảng theo trạng thái"""
+        for record in self:
+            status = record.vtp_order_status or None
+            if not record.order_number or status in FINAL_STATES:
+                record.vtp_next_poll_date = False
+                continue
+            marks = [d for d in (record.vtp_bill_updated_date, record.vtp_last_poll_date, record.create_date) if d]
+            base = max(marks) if marks else fields.Datetime.now()
+            interval = POLL_INTERVALS.get(status, DEFAULT_POLL_INTERVAL)
+            record.vtp_next_poll_date = base + timedelta(minutes=interval)
+
+    # ============ KPI (incremental) ============
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if not vals.get('tracking_token'):
+                vals['tracking_token'] = secrets.token_urlsafe(TRACKING_TOKEN_BYTES)
+        bills = super().create(vals_list)
+        self.env['vtp.shipment.kpi']._apply_deltas(bills._kpi_rows(), sign=1)
+        return bills
+
+    def write(self, vals):
+        if not any(field in vals for field in KPI_FIELDS):
+            return super().write(vals)
+        before = self._kpi_rows()
+        res = super().write(vals)
+        Kpi = self.env['vtp.shipment.kpi']
+        Kpi._apply_deltas(before, sign=-1)
+        Kpi._apply_deltas(self._kpi_rows(), sign=1)
+        return res
+
+    def unlink(self):
+        rows = self._kpi_rows()
+        res = super().unlink()
+        self.env['vtp.shipment.kpi']._apply_deltas(rows, sign=-1)
+        return res
+
+    def _kpi_rows(self):
+        """Khóa KPI và số tiền của từng vận đơn: (account, store, day, status, cod, fee)"""
+        return [(
+            bill.account_id.id or None,
+            bill.store_id.id or None,
+            (bill.create_date or fields.Datetime.now()).date(),
+            bill.vtp_order_status or 0,
+            bill.vtp_money_collection or 0.0,
+            bill.vtp_money_totalfee or 0.0,
+        ) for bill in self]
+
     @api.depends('store_id', 'store_id.account_id')
     def _compute_account_id(self):
         """Đặt tài khoản từ store"""
@@ -119,8 +342,8 @@ class VtpOrderBill(models.Model):
             default_store = self.store_id
             default_account = self.store_id.account_id
         else:
-            # Tìm store mặc định
-            default_store = self.env['vtp.store'].search([
+            # Store theo bảng định tuyến, nếu không có thì store mặc định
+            default_store = self.env['vtp.store.route']._suggest_store(self.order_id) or self.env['vtp.store'].search([
                 ('is_default', '=', True),
                 ('active', '=', True)
             ], limit=1)
@@ -158,31 +381,50 @@ class VtpOrderBill(models.Model):
     def create_update_bill_from_webhook(self, data):
         """
         Tạo hoặc cập nhật vận đơn từ dữ liệu webhook.
+
+        Returns:
+            vtp.order.bill recordset or False nếu đơn bị từ chối
+        """
+        bill, status, unused_message = self._apply_webhook_data(data)
+        if status == 'updated' and bill:
+            bill._queue_board_update()
+        return bill
+
+    @api.model
+    def _apply_webhook_data(self, data, source_account=None):
+        """
+        Áp dụng một sự kiện webhook và trả về kết quả chi tiết.
+
+        source_account: tài khoản đã xác thực sự kiện (nếu có) - dùng để ghi audit log
+        khi vận đơn / phiếu xuất kho chưa xác định được tài khoản (đơn lạ).
         
         Checklist compliance:
         - Từ chối đơn lạ không có trong hệ thống
         - Block cập nhật nếu đã ở trạng thái cuối
         - Validate luồng chuyển trạng thái
         - Ghi UNIFIED Audit Log cho mọi sự kiện
+
+        Returns:
+            tuple: (bill or False, outcome, message) với outcome thuộc WEBHOOK_OUTCOMES
         """
         vtp_service = self.env['vtp.service']
         order_number = data.get('ORDER_NUMBER')
         order_reference = data.get('ORDER_REFERENCE')
-        new_status = data.get('ORDER_STATUS')
-        
-        if new_status:
-            new_status = int(new_status)
+
+        # Chuyển đổi một lần cho cả bill và history
+        mapped_bill_vals, history_vals = map_webhook_data(data)
+        new_status = mapped_bill_vals['vtp_order_status'] or None
 
         if not order_number:
             _logger.warning("VTP Webhook: ORDER_NUMBER not found in data.")
-            return False
+            return False, 'invalid', 'Missing ORDER_NUMBER'
 
         # Tìm bill và picking hiện có
         bill = self.search([('order_number', '=', order_number)], limit=1)
         picking = self.env['stock.picking'].search([('name', '=', order_reference)], limit=1)
         
         # Xác định account để ghi log
-        account = False
+        account = source_account or False
         if bill and bill.account_id:
             account = bill.account_id
         elif picking and picking.vtp_store_id and picking.vtp_store_id.account_id:
@@ -194,18 +436,18 @@ class VtpOrderBill(models.Model):
             _logger.warning(f"VTP Webhook: {msg} (Order: {order_number})")
             if account:
                 vtp_service.log_webhook_event(account, data, False, msg)
-            return False
+            return False, 'unknown_order', msg
         
         # ============ CHECKLIST 8: Block trạng thái cuối ============
         if bill and bill.vtp_order_status in FINAL_STATES:
             msg = f"Ignored: Bill is in final state {bill.vtp_order_status}"
             _logger.info(f"VTP Webhook: {msg} ({bill.name})")
             # Ghi history
-            self.env['vtp.order.bill.history'].create_bill_history_from_webhook(bill.id, data)
+            self.env['vtp.order.bill.history'].create_bill_history_from_webhook(bill.id, data, history_vals)
             # Ghi audit log
             if account:
                 vtp_service.log_webhook_event(account, data, True, msg, bill=bill)
-            return bill
+            return bill, 'ignored', msg
         
         # ============ CHECKLIST 7: Validate transition ============
         if bill and bill.vtp_order_status:
@@ -216,44 +458,26 @@ class VtpOrderBill(models.Model):
                 msg = f"Chuyển trạng thái không hợp lệ {current_status} -> {new_status}"
                 _logger.warning(f"VTP Webhook: {msg} (Bill: {bill.name})")
                 # Ghi history
-                self.env['vtp.order.bill.history'].create_bill_history_from_webhook(bill.id, data)
+                self.env['vtp.order.bill.history'].create_bill_history_from_webhook(bill.id, data, history_vals)
                 # Ghi audit log
                 if account:
                     vtp_service.log_webhook_event(account, data, False, msg, bill=bill)
-                return bill
+                return bill, 'invalid_transition', msg
 
         # ============ Xử lý bình thường ============
         store_id = picking.vtp_store_id.id if picking and picking.vtp_store_id else False
         if not store_id and bill and bill.store_id:
             store_id = bill.store_id.id
         
-        # Parse dates safely
-        def parse_vtp_date(date_str):
-            if not date_str:
-                return False
-            try:
-                return datetime.strptime(date_str, '%d/%m/%Y %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
-            except (ValueError, TypeError):
-                try:
-                    return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    return False
-        
-        bill_data = {
-            'name': order_reference or (bill.name if bill else order_number),
-            'order_number': order_number,
-            'store_id': store_id,
-            'order_id': picking.id if picking else (bill.order_id.id if bill and bill.order_id else False),
-            'status_name': data.get('STATUS_NAME'),
-            'vtp_order_status': new_status,
-            'vtp_bill_updated_date': parse_vtp_date(data.get('ORDER_STATUSDATE')),
-            'vtp_money_collection': data.get('MONEY_COLLECTION', 0.0),
-            'vtp_money_totalfee': data.get('MONEY_TOTALFEE', 0.0),
-            'vtp_money_total': data.get('MONEY_TOTAL', 0.0),
-            'vtp_receiver_fullname': data.get('RECEIVER_FULLNAME'),
-            'vtp_product_weight': data.get('PRODUCT_WEIGHT', 0.0),
-            'expected_delivery_date': parse_vtp_date(data.get('EXPECTED_DELIVERY_DATE')),
-        }
+        bill_data = dict(
+            mapped_bill_vals,
+            name=order_reference or (bill.name if bill else order_number),
+            store_id=store_id,
+            order_id=picking.id if picking else (bill.order_id.id if bill and bill.order_id else False),
+        )
+        # Không ghi đè ngày giao dự kiến đã có khi VTP không gửi EXPECTED_DELIVERY_DATE
+        if not bill_data.get('expected_delivery_date'):
+            bill_data.pop('expected_delivery_date', None)
 
         if bill:
             _logger.info(f"VTP Webhook: Cập nhật vận đơn {bill.name}")
@@ -266,51 +490,248 @@ class VtpOrderBill(models.Model):
                 account = bill.account_id
 
         # Log success audit
+        msg = f"Updated status to {new_status}"
         if account:
-            vtp_service.log_webhook_event(account, data, True, f"Updated status to {new_status}", bill=bill)
+            vtp_service.log_webhook_event(account, data, True, msg, bill=bill)
 
         # Cập nhật trạng thái của picking theo trạng thái của ViettelPost
         if picking:
-            status_mapping = {
-                101: 'canceled',        # ViettelPost yêu cầu hủy đơn hàng
-                102: 'waiting_webhook', # Đơn hàng chờ xử lý
-                103: 'created',         # Giao cho bưu cục
-                104: 'created',         # Giao cho Bưu tá đi nhận
-                105: 'created',         # Bưu tá đã nhận hàng
-                106: 'created',         # Đối tác yêu cầu lấy lại hàng
-                107: 'draft',           # Đối tác yêu cầu hủy qua API
-                200: 'created',         # Nhận từ bưu tá - Bưu cục gốc
-                201: 'canceled',        # Hủy nhập phiếu gửi
-                202: 'created',         # Sửa phiếu gửi
-                300: 'created',         # Khai thác đi
-                400: 'created',         # Khai thác đến
-                500: 'created',         # Giao bưu tá đi phát
-                501: 'done',            # Phát thành công
-                502: 'created',         # Chuyển hoàn bưu cục gốc
-                503: 'canceled',        # Hủy - Theo yêu cầu khách hàng
-                504: 'done',            # Thành công - Chuyển trả cho người gửi
-                505: 'created',         # Tồn - Thông báo chuyển hoàn bưu cục gốc
-                506: 'created',         # Tồn - Khách hàng nghỉ, không có nhà
-                507: 'created',         # Tồn - Khách hàng đến bưu cục nhận
-                508: 'created',         # Phát tiếp
-                509: 'created',         # Chuyển tiếp bưu cục khác
-                515: 'created',         # Duyệt hoàn
-                550: 'created',         # Phát tiếp
-            }
-
             vals = {
                 'vtp_order_number': order_number,
                 'vtp_status_name': data.get('STATUS_NAME')
             }
 
-            if new_status and new_status in status_mapping:
-                vals['vtp_state'] = status_mapping[new_status]
+            if new_status and new_status in PICKING_STATE_MAPPING:
+                vals['vtp_state'] = PICKING_STATE_MAPPING[new_status]
 
             picking.write(vals)
 
+        # VTP không gửi ngày giao dự kiến - ước tính từ thống kê thời gian vận chuyển theo tuyến
+        if not bill.expected_delivery_date and new_status not in FINAL_STATES:
+            eta = self.env['vtp.transit.stat']._estimate_delivery_date(bill, history_vals.get('order_service'))
+            if eta:
+                bill.expected_delivery_date = eta
+
         # Create bill history
-        self.env['vtp.order.bill.history'].create_bill_history_from_webhook(bill.id, data)
-        return bill
+        self.env['vtp.order.bill.history'].create_bill_history_from_webhook(bill.id, data, history_vals)
+
+        # Outbox cho hệ thống khác (một câu INSERT, gửi bất đồng bộ bởi cron)
+        self.env['vtp.notify.outbox']._enqueue_status_change(bill, data)
+        return bill, 'updated', msg
+
+    # ============ Public Tracking ============
+
+    def _compute_tracking_url(self):
+        base_url = self.get_base_url() if self else ''
+        for record in self:
+            record.tracking_url = f"{base_url}/vtp/tracking/{record.tracking_token}" if record.tracking_token else False
+
+    def _refresh_tracking_snapshot(self):
+        """Dựng lại snapshot tra cứu (trạng thái + timeline); chỉ ghi khi nội dung thay đổi"""
+        History = self.env['vtp.order.bill.history'].sudo()
+        for bill in self:
+            timeline = History.search_read(
+                [('bill_id', '=', bill.id)], TRACKING_HISTORY_FIELDS, order='order_status_date, id',
+            )
+            snapshot = json.dumps({
+                'order_number': bill.order_number,
+                'status': bill.vtp_order_status,
+                'status_name': bill.status_name,
+                'updated': bill.vtp_bill_updated_date,
+                'expected_delivery_date': bill.expected_delivery_date,
+                'timeline': [{key: row[key] for key in TRACKING_HISTORY_FIELDS} for row in timeline],
+            }, ensure_ascii=False, sort_keys=True, default=str)
+            etag = hashlib.sha1(snapshot.encode('utf-8')).hexdigest()
+            if etag != bill.tracking_etag:
+                bill.write({
+                    'tracking_snapshot': snapshot,
+                    'tracking_etag': etag,
+                    'tracking_modified': fields.Datetime.now(),
+                })
+
+    # ============ Live Shipment Board ============
+
+    def _queue_board_update(self):
+        """
+        Gom các vận đơn thay đổi theo tài khoản trong transaction hiện tại; khi commit
+        chúng được chuyển cho vtp.board.channel (giới hạn tần suất theo kênh tài khoản).
+        """
+        pending = self.env.cr.precommit.data.setdefault('vtp_board.pending', {})
+        if not pending:
+            self.env.cr.precommit.add(self._send_board_updates)
+        for bill in self:
+            if bill.account_id:
+                pending.setdefault(bill.account_id.id, set()).add(bill.id)
+
+    @api.model
+    def _send_board_updates(self):
+        pending = self.env.cr.precommit.data.pop('vtp_board.pending', {})
+        if pending:
+            self.env['vtp.board.channel'].sudo()._enqueue(pending)
+
+    @api.model
+    def _send_board_payloads(self, bills_by_account):
+        """
+        Một thông báo bus cho mỗi tài khoản. Vận đơn đã kết thúc hoặc bị xóa được gửi
+        trong 'removed' để client bỏ khỏi board.
+
+        Args:
+            bills_by_account: dict {account_id: [bill_id]}
+        """
+        Bus = self.env['bus.bus'].sudo()
+        for account_id, bill_ids in bills_by_account.items():
+            if len(bill_ids) > BOARD_MAX_DELTA:
+                payload = {'account_id': account_id, 'reload': True}
+            else:
+                bills = self.sudo().browse(bill_ids).exists()
+                active = bills.filtered(lambda b: b.vtp_order_status not in FINAL_STATES)
+                payload = {
+                    'account_id': account_id,
+                    'bills': active.read(BOARD_FIELDS),
+                    'removed': sorted(set(bill_ids) - set(active.ids)),
+                }
+            Bus._sendone(f'{BOARD_CHANNEL_PREFIX}{account_id}', BOARD_NOTIFICATION, payload)
+
+    @api.model
+    def get_board_data(self, limit=200):
+        """Dữ liệu ban đầu cho board: vận đơn chưa kết thúc mới cập nhật và kênh bus được phép"""
+        bills = self.search(
+            [('vtp_order_status', 'not in', FINAL_STATES), ('order_number', '!=', False)],
+            order='vtp_bill_updated_date desc, id desc',
+            limit=limit,
+        )
+        accounts = self.env['vtp.account'].search([])
+        return {
+            'bills': bills.read(BOARD_FIELDS + ['account_id']),
+            'channels': [f'{BOARD_CHANNEL_PREFIX}{account.id}' for account in accounts],
+            'limit': limit,
+        }
+
+    # ============ Batch Webhook Processing ============
+
+    @api.model
+    def process_webhook_batch(self, items, check_token=True, account_ids=None):
+        """
+        Xử lý một batch webhook, mỗi item trong một savepoint riêng.
+
+        Một item lỗi chỉ rollback chính nó; các item khác vẫn được ghi nhận.
+        Kết quả từng item cho phép người gửi chỉ gửi lại các item thất bại.
+
+        Args:
+            items: iterable - Các item thô (đã giải mã JSON, chưa unwrap)
+            check_token: bool - Kiểm tra TOKEN với webhook_token của tài khoản
+            account_ids: list - Tài khoản đã xác thực của từng item (song song với items, None
+                         nếu không có); vận đơn phải thuộc đúng tài khoản này
+
+        Returns:
+            list[dict]: {'index', 'order_number', 'status', 'message'} cho từng item,
+            status thuộc WEBHOOK_OUTCOMES hoặc 'unauthorized' / 'error'
+        """
+        results = []
+        for index, item in enumerate(items):
+            data_dict, token = unwrap_webhook_item(item)
+            if not (data_dict and isinstance(data_dict, dict) and data_dict.get('ORDER_NUMBER')):
+                _logger.warning(f"VTP Webhook: Item structure not recognized or missing ORDER_NUMBER: {item}")
+                results.append({
+                    'index': index,
+                    'order_number': False,
+                    'status': 'invalid',
+                    'message': 'Item structure not recognized or missing ORDER_NUMBER',
+                })
+                continue
+
+            order_number = data_dict.get('ORDER_NUMBER')
+            _logger.info("VTP Webhook đang xử lý đơn hàng: %s (Status: %s)",
+                         order_number, data_dict.get('STATUS_NAME'))
+            account_id = account_ids[index] if account_ids else None
+            try:
+                bill = False
+                with self.env.cr.savepoint():
+                    if check_token and token and not self._check_webhook_token(order_number, token):
+                        status, message = 'unauthorized', 'Token không hợp lệ'
+                    elif account_id and not self._check_webhook_account(data_dict, account_id):
+                        status, message = 'unauthorized', 'Token không thuộc tài khoản của vận đơn'
+                    else:
+                        bill, status, message = self._apply_webhook_data(
+                            data_dict, source_account=self.env['vtp.account'].browse(account_id or []))
+                # Chỉ thông báo khi savepoint đã được giữ lại
+                if status == 'updated' and bill:
+                    bill._queue_board_update()
+            except Exception as e:
+                _logger.exception(f"VTP Webhook: Lỗi xử lý đơn hàng {order_number}")
+                status, message = 'error', str(e)
+                self._log_webhook_error(data_dict, message,
+                                        source_account=self.env['vtp.account'].browse(account_id or []))
+
+            results.append({
+                'index': index,
+                'order_number': order_number,
+                'status': status,
+                'message': message,
+            })
+
+            # Giải phóng cache ORM định kỳ để bộ nhớ không tăng theo kích thước batch
+            if (index + 1) % WEBHOOK_CACHE_RESET_EVERY == 0:
+                self.env.flush_all()
+                self.env.invalidate_all()
+        return results
+
+    @api.model
+    def _check_webhook_account(self, data, account_id):
+        """
+        Vận đơn (hoặc phiếu xuất kho theo ORDER_REFERENCE nếu chưa có vận đơn) phải
+        thuộc tài khoản có token đã xác thực sự kiện
+        """
+        order_number = data.get('ORDER_NUMBER')
+        bill = self.search([('order_number', '=', order_number)], limit=1)
+        owner = bill.account_id
+        if not bill and data.get('ORDER_REFERENCE'):
+            owner = self.env['stock.picking'].search(
+                [('name', '=', data['ORDER_REFERENCE'])], limit=1).vtp_store_id.account_id
+        if owner and owner.id != account_id:
+            _logger.warning(
+                f"VTP Webhook: Token của tài khoản {account_id} không được cập nhật "
+                f"đơn hàng {order_number} (tài khoản {owner.name})"
+            )
+            return False
+        return True
+
+    @api.model
+    def _check_webhook_token(self, order_number, token):
+        """Kiểm tra TOKEN của webhook với webhook_token của tài khoản sở hữu vận đơn"""
+        bill = self.search([('order_number', '=', order_number)], limit=1)
+        account = bill.account_id
+        if not account or not account.webhook_token:
+            return True
+        if token != account.webhook_token:
+            _logger.warning(
+                f"VTP Webhook: Token không hợp lệ cho tài khoản {account.name}, "
+                f"đơn hàng {order_number}"
+            )
+            return False
+        return True
+
+    @api.model
+    def _log_webhook_error(self, data, message, source_account=None):
+        """
+        Ghi audit log cho item lỗi (sau khi savepoint của item đã rollback).
+
+        Chạy trong savepoint riêng: lỗi khi ghi log (transaction đang lỗi, ràng buộc...)
+        chỉ rollback chính nó, không làm hỏng các item còn lại của batch.
+        """
+        try:
+            with self.env.cr.savepoint():
+                bill = self.search([('order_number', '=', data.get('ORDER_NUMBER'))], limit=1)
+                account = bill.account_id
+                if not account and data.get('ORDER_REFERENCE'):
+                    picking = self.env['stock.picking'].search([('name', '=', data['ORDER_REFERENCE'])], limit=1)
+                    account = picking.vtp_store_id.account_id
+                account = account or source_account
+                if account:
+                    self.env['vtp.service'].log_webhook_event(account, data, False, f"Error: {message}",
+                                                              bill=bill or None)
+        except Exception as e:
+            _logger.error(f"VTP Webhook: Không thể ghi audit log lỗi: {e}")
 
 
 class VtpOrderBillHistory(models.Model):
@@ -341,50 +762,41 @@ class VtpOrderBillHistory(models.Model):
     order_service = fields.Char("Dịch vụ")
     is_returning = fields.Boolean("Trả hàng")
 
+    def init(self):
+        # Index khớp với các truy vấn thực tế:
+        # - lịch sử mới nhất theo mã vận đơn (order='create_date desc')
+        # - timeline của vận đơn / phiếu giao hàng (order='order_status_date desc')
+        create_index(self.env.cr, 'vtp_order_bill_history_order_number_create_date_idx',
+                     self._table, ['order_number', 'create_date DESC'])
+        create_index(self.env.cr, 'vtp_order_bill_history_bill_status_date_idx',
+                     self._table, ['bill_id', 'order_status_date DESC'])
+        create_index(self.env.cr, 'vtp_order_bill_history_picking_status_date_idx',
+                     self._table, ['order_id', 'order_status_date DESC'])
+
     @api.model
-    def create_bill_history_from_webhook(self, bill_id, data):
-        """Tạo lịch sử vận đơn từ dữ liệu webhook"""
-        order_number = data.get('ORDER_NUMBER')
-        order_reference = data.get('ORDER_REFERENCE')
+    def create_bill_history_from_webhook(self, bill_id, data, history_vals=None):
+        """
+        Tạo lịch sử vận đơn từ dữ liệu webhook.
+
+        Args:
+            bill_id: int - ID vtp.order.bill
+            data: dict - DATA của webhook
+            history_vals: dict - Giá trị đã ánh xạ sẵn bởi map_webhook_data (tùy chọn)
+        """
+        if history_vals is None:
+            unused_bill_vals, history_vals = map_webhook_data(data)
 
         bill = self.env['vtp.order.bill'].browse(bill_id)
-        
-        # Parse dates safely
-        def parse_vtp_date(date_str):
-            if not date_str:
-                return False
-            try:
-                return datetime.strptime(date_str, '%d/%m/%Y %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
-            except (ValueError, TypeError):
-                try:
-                    return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    return False
-
-        history_data = {
-            'bill_id': bill.id,
-            'name': order_number,
-            'order_id': bill.order_id.id if bill.order_id else False,
-            'order_number': order_number,
-            'order_reference': order_reference,
-            'order_status_date': parse_vtp_date(data.get('ORDER_STATUSDATE')),
-            'order_status': data.get('ORDER_STATUS'),
-            'status_name': data.get('STATUS_NAME'),
-            'location_currently': data.get('LOCATION_CURRENTLY'),
-            'note': data.get('NOTE'),
-            'money_collection': data.get('MONEY_COLLECTION', 0.0),
-            'money_feecod': data.get('MONEY_FEECOD', 0.0),
-            'money_totalfee': data.get('MONEY_TOTALFEE', 0.0),
-            'money_totalvat': data.get('MONEY_TOTALVAT', 0.0),
-            'money_total': data.get('MONEY_TOTAL', 0.0),
-            'product_weight': data.get('PRODUCT_WEIGHT', 0.0),
-            'order_service': data.get('ORDER_SERVICE'),
-            'order_payment': data.get('ORDER_PAYMENT', 0),
-            'expected_delivery_date': parse_vtp_date(data.get('EXPECTED_DELIVERY_DATE')),
-            'is_returning': data.get('IS_RETURNING', False),
-            'receiver_fullname': data.get('RECEIVER_FULLNAME'),
-        }
-        self.create(history_data)
+        history = self.create(dict(
+            history_vals,
+            bill_id=bill.id,
+            name=history_vals['order_number'],
+            order_id=bill.order_id.id if bill.order_id else False,
+        ))
+        # Cập nhật projection trạng thái mới nhất
+        bill.last_history_id = history
+        # Timeline thay đổi - làm mới snapshot tra cứu công khai
+        bill._refresh_tracking_snapshot()
 
         return bill
 
@@ -405,15 +817,12 @@ class VtpStockPicking(models.Model):
         readonly=True
     )
     
-    vtp_state = fields.Selection([
-        ('draft', 'Nháp'),
-        ('waiting_webhook', 'Đang chờ xử lý'),
-        ('created', 'Đã tạo'),
-        ('done', 'Đã hoàn thành'),
-        ('canceled', 'Đã hủy'),
-    ], string='Trạng thái VTP', default='draft')
+    vtp_state = fields.Selection(VTP_STATE_SELECTION, string='Trạng thái VTP', default='draft')
     vtp_order_number = fields.Char(string='Mã vận đơn ViettelPost', copy=False, readonly=True, index=True)
     vtp_status_name = fields.Char(string='Trạng thái vận đơn', copy=False, readonly=True)
+    # Tuyến giao hàng - dùng cho thống kê thời gian vận chuyển (vtp.transit.stat)
+    vtp_receiver_district_id = fields.Many2one('vtp.district', string='Quận/Huyện nhận', copy=False, readonly=True)
+    vtp_service_code = fields.Char(string='Dịch vụ VTP', copy=False, readonly=True)
 
 
 class VtpSaleOrder(models.Model):
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Order Bill Archive - Cold storage cho vận đơn đã kết thúc
+
+Vận đơn ở trạng thái cuối (FINAL_STATES) quá N tháng được chuyển khỏi các
+bảng nóng vtp_order_bill / vtp_order_bill_history: mỗi vận đơn cùng toàn bộ
+lịch sử được nén (zlib + JSON) thành một dòng archive.
+"""
+
+import base64
+import json
+import logging
+import zlib
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+from .vtp_order_bill import FINAL_STATES
+
+_logger = logging.getLogger(__name__)
+
+# Mặc định lưu trữ sau 12 tháng; cấu hình qua ir.config_parameter
+DEFAULT_ARCHIVE_AFTER_MONTHS = 12
+# Số vận đơn lưu trữ trong một transaction
+ARCHIVE_BATCH_SIZE = 1000
+
+# Các cột không khôi phục khi restore (do ORM tự sinh)
+_RESTORE_SKIP_COLUMNS = {'id', 'create_uid', 'create_date', 'write_uid', 'write_date', 'last_history_id', 'bill_id'}
+
+
+def _json_datetime(value):
+    """Timestamp của row_to_json ('2024-12-31T10:11:12.123') -> chuỗi Datetime của Odoo"""
+    if not value:
+        return False
+    return fields.Datetime.to_string(fields.Datetime.to_datetime(value.replace('T', ' ')[:19]))
+
+
+class VTPOrderBillArchive(models.Model):
+    _name = 'vtp.order.bill.archive'
+    _description = 'ViettelPost Order Bill Archive'
+    _order = 'archived_at desc, id desc'
+    _rec_name = 'order_number'
+
+    order_number = fields.Char(string='Mã vận đơn ViettelPost', index=True, readonly=True)
+    name = fields.Char(string='Mã đơn hàng', index=True, readonly=True)
+    account_id = fields.Many2one('vtp.account', string='Tài khoản VTP', ondelete='set null', index=True, readonly=True)
+    store_id = fields.Many2one('vtp.store', string='Store ViettelPost', ondelete='set null', readonly=True)
+    vtp_order_status = fields.Integer(string='Trạng thái cuối', readonly=True)
+    vtp_bill_updated_date = fields.Datetime(string='Cập nhật lần cuối', readonly=True)
+    history_count = fields.Integer(string='Số dòng lịch sử', readonly=True)
+    archived_at = fields.Datetime(string='Thời điểm lưu trữ', readonly=True, default=fields.Datetime.now)
+    data = fields.Binary(string='Dữ liệu nén', attachment=False, readonly=True)
+
+    # ============ Archival ============
+
+    @api.model
+    def _get_archive_after_months(self):
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'viettel_ingration_odoo_18.archive_after_months', DEFAULT_ARCHIVE_AFTER_MONTHS
+        )
+        try:
+            return max(int(value), 1)
+        except (TypeError, ValueError):
+            return DEFAULT_ARCHIVE_AFTER_MONTHS
+
+    @api.model
+    def _cron_archive_final_bills(self, batch_size=ARCHIVE_BATCH_SIZE, max_batches=50):
+        """Chuyển vận đơn đã kết thúc quá N tháng sang cold storage, commit theo batch"""
+        months = self._get_archive_after_months()
+        total = 0
+        for unused in range(max_batches):
+            archived = self._archive_batch(months, batch_size)
+            self.env.cr.commit()
+            total += archived
+            if archived < batch_size:
+                break
+        if total:
+            _logger.info(f"VTP Archive: Đã lưu trữ {total} vận đơn (> {months} tháng)")
+        return total
+
+    @api.model
+    def _archive_batch(self, months, batch_size):
+        """Lưu trữ một batch vận đơn; toàn bộ đọc/xóa bằng SQL theo tập"""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT b.id, b.order_number, b.name, b.account_id, b.store_id,
+                   b.vtp_order_status, b.vtp_bill_updated_date,
+                   b.create_date, b.vtp_money_collection, b.vtp_money_totalfee,
+                   row_to_json(b)::text,
+                   COALESCE(h.rows, '[]')::text,
+                   COALESCE(h.cnt, 0)
+              FROM vtp_order_bill b
+              LEFT JOIN LATERAL (
+                    SELECT json_agg(h ORDER BY h.order_status_date, h.id) AS rows, count(*) AS cnt
+                      FROM vtp_order_bill_history h
+                     WHERE h.bill_id = b.id
+                   ) h ON TRUE
+             WHERE b.vtp_order_status IN %s
+               AND b.vtp_bill_updated_date < (now() at time zone 'UTC') - make_interval(months => %s)
+             ORDER BY b.vtp_bill_updated_date
+             LIMIT %s
+        """, (tuple(FINAL_STATES), months, batch_size))
+        rows = cr.fetchall()
+        if not rows:
+            return 0
+
+        vals_list = []
+        bill_ids = []
+        kpi_rows = []
+        for (bill_id, order_number, name, account_id, store_id, status, updated,
+             create_date, money_collection, money_totalfee,
+             bill_json, history_json, history_count) in rows:
+            # Cùng khóa với vtp.order.bill._kpi_rows
+            kpi_rows.append((account_id, store_id, (create_date or fields.Datetime.now()).date(),
+                             status or 0, money_collection or 0.0, money_totalfee or 0.0))
+            payload = '{"bill": %s, "history": %s}' % (bill_json, history_json)
+            vals_list.append({
+                'order_number': order_number,
+                'name': name,
+                'account_id': account_id,
+                'store_id': store_id,
+                'vtp_order_status': status,
+                'vtp_bill_updated_date': updated,
+                'history_count': history_count,
+                'data': base64.b64encode(zlib.compress(payload.encode('utf-8'), 9)),
+            })
+            bill_ids.append(bill_id)
+
+        self.create(vals_list)
+
+        # Xóa lịch sử trước để tránh cascade từng dòng, sau đó xóa vận đơn. Xóa bằng SQL
+        # bỏ qua unlink() nên KPI được trừ tại đây (cùng delta như vtp.order.bill.unlink)
+        cr.execute("DELETE FROM vtp_order_bill_history WHERE bill_id IN %s", (tuple(bill_ids),))
+        cr.execute("DELETE FROM vtp_order_bill WHERE id IN %s", (tuple(bill_ids),))
+        self.env['vtp.shipment.kpi']._apply_deltas(kpi_rows, sign=-1)
+        self.env.invalidate_all()
+        return len(bill_ids)
+
+    # ============ Access ============
+
+    def _get_payload(self):
+        self.ensure_one()
+        if not self.data:
+            return {'bill': {}, 'history': []}
+        raw = zlib.decompress(base64.b64decode(self.data))
+        return json.loads(raw.decode('utf-8'))
+
+    def action_restore(self):
+        """Khôi phục vận đơn và lịch sử về bảng nóng"""
+        Bill = self.env['vtp.order.bill']
+        History = self.env['vtp.order.bill.history']
+        for archive in self:
+            if Bill.search_count([('order_number', '=', archive.order_number)], limit=1):
+                raise UserError(_('Vận đơn %s đã tồn tại, không thể khôi phục.') % archive.order_number)
+
+            payload = archive._get_payload()
+            bill_row = payload.get('bill') or {}
+            bill_vals = self._restore_vals(Bill, bill_row)
+            bill = Bill.create(bill_vals)
+            self._restore_create_date(bill, bill_row.get('create_date'))
+
+            history_vals = []
+            for row in payload.get('history') or []:
+                vals = self._restore_vals(History, row)
+                vals['bill_id'] = bill.id
+                history_vals.append(vals)
+            histories = History.create(history_vals)
+            if histories:
+                bill.last_history_id = histories[-1]
+        self.unlink()
+        return True
+
+    @api.model
+    def _restore_create_date(self, bill, create_date):
+        """Giữ ngày tạo gốc - KPI theo ngày tạo nên chuyển delta từ ngày khôi phục về ngày gốc"""
+        create_date = _json_datetime(create_date)
+        if not create_date:
+            return
+        Kpi = self.env['vtp.shipment.kpi']
+        Kpi._apply_deltas(bill._kpi_rows(), sign=-1)
+        bill.flush_recordset()
+        self.env.cr.execute("UPDATE vtp_order_bill SET create_date = %s WHERE id = %s", (create_date, bill.id))
+        bill.invalidate_recordset(['create_date'])
+        Kpi._apply_deltas(bill._kpi_rows(), sign=1)
+
+    @api.model
+    def _restore_vals(self, model, row):
+        """Chỉ giữ các cột là field lưu trữ của model (bỏ id/log access)"""
+        vals = {}
+        for column, value in row.items():
+            field = model._fields.get(column)
+            if not field or not field.store or column in _RESTORE_SKIP_COLUMNS or field.compute:
+                continue
+            if field.type == 'many2one' and value:
+                if not model.env[field.comodel_name].browse(value).exists():
+                    value = False
+            elif field.type == 'datetime' and value:
+                value = _json_datetime(value)
+            elif field.type == 'date' and value:
+                value = value[:10]
+            vals[column] = value
+        return vals
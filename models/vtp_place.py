@@ -1,15 +1,74 @@
 from odoo import models, fields, api
+from odoo.tools import SQL
 from .vtp_store import VTPStore
+from ..services.address_gazetteer import normalize_name
 import logging
 
 _logger = logging.getLogger(__name__)
 
+class VTPPlaceMixin(models.AbstractModel):
+    _name = 'vtp.place.mixin'
+    _description = 'ViettelPost Place Mixin'
+
+    # Tên không dấu, đã mở rộng viết tắt ("Phường 12" -> "phuong 12"); index trigram cho LIKE '%...%'
+    search_name = fields.Char(string='Tên tìm kiếm', compute='_compute_search_name', store=True,
+                              index='trigram', unaccent=False)
+
+    @api.depends(lambda self: [self._rec_name])
+    def _compute_search_name(self):
+        for record in self:
+            record.search_name = normalize_name(record[self._rec_name])
+
+    @api.model
+    def _name_search(self, name, domain=None, operator='ilike', limit=None, order=None):
+        """
+        Tìm không dấu trên search_name, xếp hạng: khớp hoàn toàn, khớp đầu tên,
+        khớp đầu một từ, rồi tên ngắn hơn.
+        """
+        key = normalize_name(name) if operator in ('ilike', 'like', '=ilike', '=like') else ''
+        if not key:
+            return super()._name_search(name, domain, operator, limit, order)
+        query = self._search(list(domain or []) + [('search_name', 'like', key)], limit=limit)
+        column = SQL.identifier(self._table, 'search_name')
+        query.order = SQL(
+            "%s = %s DESC, %s LIKE %s DESC, %s LIKE %s DESC, length(%s), %s",
+            column, key,
+            column, f'{key}%',
+            column, f'% {key}%',
+            column, SQL.identifier(self._table, 'id'),
+        )
+        return query
+
+    # Gazetteer địa chỉ được cache theo worker (ormcache, khóa theo phiên bản 'gazetteer');
+    # chỉ tăng phiên bản khi tên / mã / cấp cha thay đổi
+    _gazetteer_fields = ()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['vtp.cache.version']._bump('gazetteer')
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        if not vals.keys().isdisjoint(self._gazetteer_fields):
+            self.env['vtp.cache.version']._bump('gazetteer')
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env['vtp.cache.version']._bump('gazetteer')
+        return result
+
+
 class VTPProvince(models.Model):
     _name = 'vtp.province'
+    _inherit = ['vtp.place.mixin']
     _description = 'ViettelPost Province'
     _rec_name = 'province_name'
+    _gazetteer_fields = ('province_name', 'province_code')
 
-    provinceId = fields.Integer(string='ID Tỉnh/Thành phố')
+    provinceId = fields.Integer(string='ID Tỉnh/Thành phố', index=True)
     province_name = fields.Char(string='Tên Tỉnh/Thành phố', required=True)
     province_code = fields.Char(string='Mã Tỉnh/Thành phố', required=True)
     districtIds = fields.One2many('vtp.district', 'provinceId', string='Quận/Huyện')
@@ -22,10 +81,12 @@ class VTPProvince(models.Model):
     
 class VTPDistrict(models.Model):
     _name = 'vtp.district'
+    _inherit = ['vtp.place.mixin']
     _description = 'ViettelPost District'
     _rec_name = 'district_name'
+    _gazetteer_fields = ('district_name', 'provinceId')
 
-    districtId = fields.Integer(string='ID Quận/Huyện')
+    districtId = fields.Integer(string='ID Quận/Huyện', index=True)
     district_name = fields.Char(string='Tên Quận/Huyện', required=True)
     district_value = fields.Integer(string='Mã Quận/Huyện', required=True)
     provinceId = fields.Many2one('vtp.province', string='Tỉnh/Thành phố')
@@ -39,10 +100,12 @@ class VTPDistrict(models.Model):
     
 class VTPWard(models.Model):
     _name = 'vtp.ward'
+    _inherit = ['vtp.place.mixin']
     _description = 'ViettelPost Ward'
     _rec_name = 'ward_name'
+    _gazetteer_fields = ('ward_name', 'districtId')
 
-    wardId = fields.Integer(string='ID Phường/Xã')
+    wardId = fields.Integer(string='ID Phường/Xã', index=True)
     ward_name = fields.Char(string='Tên Phường/Xã', required=True)
     districtId = fields.Many2one('vtp.district', string='Quận/Huyện')
     
@@ -52,15 +115,22 @@ class VTPWard(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         """Auto-map district_name_temp to districtId during import"""
+        # Nạp map tên -> id quận/huyện một lần cho cả batch import
+        names = {
+            vals['district_name_temp'].strip()
+            for vals in vals_list
+            if vals.get('district_name_temp') and not vals.get('districtId')
+        }
+        district_map = {}
+        if names:
+            for district in self.env['vtp.district'].search_read([('district_name', 'in', list(names))], ['district_name'], order='id'):
+                district_map.setdefault(district['district_name'], district['id'])
+
         for vals in vals_list:
             if vals.get('district_name_temp') and not vals.get('districtId'):
                 district_name = vals['district_name_temp'].strip()
-                district = self.env['vtp.district'].search([
-                    ('district_name', '=', district_name)
-                ], limit=1)
-                
-                if district:
-                    vals['districtId'] = district.id
+                if district_name in district_map:
+                    vals['districtId'] = district_map[district_name]
                 else:
                     # Log warning but don't fail
                     _logger.warning(f"District not found: {district_name} for ward {vals.get('ward_name')}")
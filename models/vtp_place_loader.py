@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Place Loader - Nạp danh mục địa giới (tỉnh / quận / phường) hàng loạt
+
+Nguồn dữ liệu: API danh mục của ViettelPost hoặc file nén đi kèm module
+(data/vtp_places.json.gz). Mỗi cấp được so sánh với dữ liệu hiện có qua một
+map {ID VTP: (id, giá trị)} nạp một lần; chỉ dòng mới được INSERT và dòng
+thay đổi được UPDATE, đều bằng câu SQL nhiều dòng (execute_values).
+
+Định dạng file nén (JSON, dạng cột gọn):
+    {"provinces": [[PROVINCE_ID, PROVINCE_CODE, PROVINCE_NAME], ...],
+     "districts": [[DISTRICT_ID, DISTRICT_VALUE, DISTRICT_NAME, PROVINCE_ID], ...],
+     "wards": [[WARDS_ID, WARDS_NAME, DISTRICT_ID], ...]}
+"""
+
+import gzip
+import json
+import logging
+import os
+
+from psycopg2.extras import execute_values
+
+from odoo import _, api, models
+from odoo.exceptions import UserError
+from odoo.modules.module import get_module_path
+
+from ..services.address_gazetteer import normalize_name
+
+_logger = logging.getLogger(__name__)
+
+BUNDLED_PLACES_FILE = os.path.join('data', 'vtp_places.json.gz')
+
+# Cấu hình từng cấp: bảng, cột ID VTP, các cột giá trị, cột tên (dựng search_name), cột cha (id Odoo của cấp trên)
+PLACE_LEVELS = {
+    'provinces': {
+        'table': 'vtp_province',
+        'key': 'provinceId',
+        'columns': ['province_code', 'province_name'],
+        'name': 'province_name',
+        'parent': None,
+    },
+    'districts': {
+        'table': 'vtp_district',
+        'key': 'districtId',
+        'columns': ['district_value', 'district_name'],
+        'name': 'district_name',
+        'parent': ('provinceId', 'provinces'),
+    },
+    'wards': {
+        'table': 'vtp_ward',
+        'key': 'wardId',
+        'columns': ['ward_name'],
+        'name': 'ward_name',
+        'parent': ('districtId', 'districts'),
+    },
+}
+PLACE_LEVEL_ORDER = ['provinces', 'districts', 'wards']
+PLACE_MODELS = {'provinces': 'vtp.province', 'districts': 'vtp.district', 'wards': 'vtp.ward'}
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class VTPPlaceLoader(models.AbstractModel):
+    _name = 'vtp.place.loader'
+    _description = 'ViettelPost Place Master Data Loader'
+
+    # ============ Normalization ============
+
+    @api.model
+    def _rows_from_api(self, provinces, districts, wards):
+        """Chuyển phản hồi API danh mục sang dạng cột gọn (giống file đi kèm)"""
+        return {
+            'provinces': [
+                [_to_int(p.get('PROVINCE_ID')), p.get('PROVINCE_CODE') or '', p.get('PROVINCE_NAME') or '']
+                for p in provinces if isinstance(p, dict) and p.get('PROVINCE_ID')
+            ],
+            'districts': [
+                [_to_int(d.get('DISTRICT_ID')), _to_int(d.get('DISTRICT_VALUE')),
+                 d.get('DISTRICT_NAME') or '', _to_int(d.get('PROVINCE_ID'))]
+                for d in districts if isinstance(d, dict) and d.get('DISTRICT_ID')
+            ],
+            'wards': [
+                [_to_int(w.get('WARDS_ID')), w.get('WARDS_NAME') or '', _to_int(w.get('DISTRICT_ID'))]
+                for w in wards if isinstance(w, dict) and w.get('WARDS_ID')
+            ],
+        }
+
+    # ============ Upsert ============
+
+    @api.model
+    def _load_id_map(self, level):
+        """{ID VTP: (id, giá trị cột..., id cha)} của một cấp, một truy vấn"""
+        config = PLACE_LEVELS[level]
+        columns = [f'"{config["key"]}"'] + [f'"{c}"' for c in config['columns']]
+        if config['parent']:
+            columns.append(f'"{config["parent"][0]}"')
+        self.env.cr.execute(f"""
+            SELECT id, {', '.join(columns)} FROM {config['table']}
+             WHERE "{config['key']}" IS NOT NULL
+          ORDER BY id
+        """)
+        result = {}
+        for row in self.env.cr.fetchall():
+            # Giữ bản ghi đầu tiên nếu dữ liệu import cũ bị trùng ID
+            result.setdefault(row[1], (row[0],) + tuple(row[2:]))
+        return result
+
+    @api.model
+    def _upsert_places(self, data):
+        """
+        Ghi dữ liệu địa giới theo từng cấp, chỉ chạm vào dòng mới hoặc thay đổi.
+
+        Args:
+            data: dict - {'provinces': [...], 'districts': [...], 'wards': [...]} dạng cột gọn
+
+        Returns:
+            dict: {cấp: {'created': n, 'updated': n, 'unchanged': n, 'orphan': n}}
+        """
+        self.env.flush_all()
+        cr = self.env.cr
+        uid = int(self.env.uid)
+        stats = {}
+        parent_maps = {}
+
+        for level in PLACE_LEVEL_ORDER:
+            config = PLACE_LEVELS[level]
+            existing = self._load_id_map(level)
+            value_count = len(config['columns'])
+            to_insert, to_update = [], []
+            orphan = unchanged = 0
+            seen = set()
+
+            for row in data.get(level) or []:
+                vtp_id = _to_int(row[0])
+                if not vtp_id or vtp_id in seen:
+                    continue
+                seen.add(vtp_id)
+                values = tuple(row[1:1 + value_count])
+                if config['parent']:
+                    parent = parent_maps[config['parent'][1]].get(_to_int(row[1 + value_count]))
+                    if not parent:
+                        orphan += 1
+                        continue
+                    values += (parent[0],)
+                current = existing.get(vtp_id)
+                if current is None:
+                    to_insert.append((vtp_id,) + values)
+                elif tuple(current[1:]) != values:
+                    to_update.append((current[0],) + values)
+                else:
+                    unchanged += 1
+
+            # search_name (compute stored) không được ORM tính khi ghi bằng SQL - dựng tại đây
+            name_index = config['columns'].index(config['name']) + 1
+            to_insert = [row + (normalize_name(row[name_index]),) for row in to_insert]
+            to_update = [row + (normalize_name(row[name_index]),) for row in to_update]
+            columns = list(config['columns']) + ([config['parent'][0]] if config['parent'] else []) + ['search_name']
+            quoted = ', '.join(f'"{c}"' for c in columns)
+            placeholders = ', '.join(['%s'] * len(columns))
+            if to_insert:
+                execute_values(cr._obj, f"""
+                    INSERT INTO {config['table']}
+                        ("{config['key']}", {quoted}, create_uid, create_date, write_uid, write_date)
+                    VALUES %s
+                """, to_insert, template=(
+                    f"(%s, {placeholders}, {uid}, now() at time zone 'UTC', {uid}, now() at time zone 'UTC')"
+                ), page_size=1000)
+            if to_update:
+                assignments = ', '.join(f'"{c}" = v."{c}"' for c in columns)
+                execute_values(cr._obj, f"""
+                    UPDATE {config['table']} t
+                       SET {assignments}, write_uid = {uid}, write_date = now() at time zone 'UTC'
+                      FROM (VALUES %s) AS v(id, {quoted})
+                     WHERE t.id = v.id
+                """, to_update, page_size=1000)
+
+            # Cấp dưới cần id của các dòng vừa tạo
+            parent_maps[level] = self._load_id_map(level) if to_insert else existing
+            stats[level] = {
+                'created': len(to_insert),
+                'updated': len(to_update),
+                'unchanged': unchanged,
+                'orphan': orphan,
+            }
+
+        for model in PLACE_MODELS.values():
+            self.env[model].invalidate_model()
+        if any(level_stats['created'] or level_stats['updated'] for level_stats in stats.values()):
+            self.env['vtp.cache.version']._bump('gazetteer')
+        _logger.info(f"VTP Places: {stats}")
+        return stats
+
+    # ============ Sources ============
+
+    @api.model
+    def _sync_from_api(self, account=None):
+        """Đồng bộ gia tăng từ API danh mục ViettelPost"""
+        account = account or self.env['vtp.account'].search([('active', '=', True)], limit=1)
+        if not account:
+            raise UserError(_('Không có tài khoản ViettelPost nào đang hoạt động.'))
+        VTPService = self.env['vtp.service']
+
+        provinces = VTPService.fetch_provinces(account)
+        districts = VTPService.fetch_districts(account)
+        for result in (provinces, districts):
+            if isinstance(result, dict) and result.get('error'):
+                raise UserError(result['error'])
+
+        district_ids = [d.get('DISTRICT_ID') for d in districts if isinstance(d, dict) and d.get('DISTRICT_ID')]
+        wards = []
+        for district_id, result in zip(district_ids, VTPService.fetch_wards(account, district_ids)):
+            if isinstance(result, list):
+                wards.extend(dict(w, DISTRICT_ID=w.get('DISTRICT_ID') or district_id) for w in result)
+            else:
+                _logger.warning(f"VTP Places: Không lấy được phường/xã của quận {district_id}: {result}")
+
+        return self._upsert_places(self._rows_from_api(provinces, districts, wards))
+
+    @api.model
+    def _load_bundled_dataset(self, path=None):
+        """Nạp file địa giới đi kèm module (dùng khi cài đặt không có mạng)"""
+        path = path or os.path.join(get_module_path('viettel_ingration_odoo_18'), BUNDLED_PLACES_FILE)
+        if not os.path.exists(path):
+            _logger.info(f"VTP Places: Không có file dữ liệu {path}, bỏ qua")
+            return {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        return self._upsert_places(data)
+
+    @api.model
+    def _export_dataset(self, path=None):
+        """
+        Xuất danh mục hiện tại ra định dạng file đi kèm (JSON nén gzip).
+
+        Returns:
+            bytes: nội dung nén (đồng thời ghi ra path nếu có)
+        """
+        data = {}
+        names = {}
+        for level in PLACE_LEVEL_ORDER:
+            config = PLACE_LEVELS[level]
+            rows = sorted(self._load_id_map(level).items())
+            names[level] = {values[0]: vtp_id for vtp_id, values in rows}
+            if config['parent']:
+                parent_ids = names[config['parent'][1]]
+                data[level] = [[vtp_id] + list(values[1:-1]) + [parent_ids.get(values[-1], 0)]
+                               for vtp_id, values in rows]
+            else:
+                data[level] = [[vtp_id] + list(values[1:]) for vtp_id, values in rows]
+        content = gzip.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        if path:
+            with open(path, 'wb') as f:
+                f.write(content)
+        return content
+
+    # ============ Entry points ============
+
+    @api.model
+    def action_sync_places(self):
+        stats = self._sync_from_api()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Thành công'),
+                'message': _(
+                    'Tỉnh: +%(p_new)s/~%(p_upd)s, Quận/Huyện: +%(d_new)s/~%(d_upd)s, Phường/Xã: +%(w_new)s/~%(w_upd)s',
+                    p_new=stats['provinces']['created'], p_upd=stats['provinces']['updated'],
+                    d_new=stats['districts']['created'], d_upd=stats['districts']['updated'],
+                    w_new=stats['wards']['created'], w_upd=stats['wards']['updated'],
+                ),
+                'sticky': False,
+                'type': 'success',
+            },
+        }
+
+    @api.model
+    def _cron_sync_places(self):
+        """Cron: đồng bộ gia tăng danh mục địa giới"""
+        if not self.env['vtp.account'].search_count([('active', '=', True)], limit=1):
+            return {}
+        return self._sync_from_api()
@@ -10,6 +10,9 @@ class VtpPricing(models.Model):
     # Liên kết trực tiếp với Sales Order (không phụ thuộc vào vtp.order.bill)
     sale_order_id = fields.Many2one('sale.order', string='Đơn bán', index=True)
     order_id = fields.Many2one('vtp.order.bill', string='Phiếu giao hàng')
+    # Địa chỉ nhận của lần tra cước - dữ liệu cước theo tuyến cho định tuyến store
+    receiver_province_id = fields.Many2one('vtp.province', string='Tỉnh nhận')
+    receiver_district_id = fields.Many2one('vtp.district', string='Quận/Huyện nhận')
     
     name = fields.Char(string='Tên', required=True)
     money_total_old = fields.Integer(string='Tổng tiền trước khi áp dụng phí')
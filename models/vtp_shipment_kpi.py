@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Shipment KPI - Bảng tổng hợp vận đơn theo tài khoản / store / ngày / trạng thái
+
+Bảng được cập nhật tăng dần (delta) khi vận đơn thay đổi (create/write/unlink
+trên vtp.order.bill, bao gồm luồng webhook và polling) và được đối soát định
+kỳ bằng cron tính lại từ vtp_order_bill. Dashboard chỉ đọc bảng này nên thời
+gian tải không phụ thuộc số lượng vận đơn.
+"""
+
+import logging
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+from odoo import api, fields, models
+from odoo.tools.sql import create_unique_index
+
+from .vtp_order_bill import FINAL_STATES, PICKING_STATE_MAPPING, VTP_STATE_SELECTION
+
+_logger = logging.getLogger(__name__)
+
+# Số ngày gần nhất được cron đối soát tính lại
+DEFAULT_RECONCILE_DAYS = 35
+
+_KPI_KEY_EXPRESSIONS = ('COALESCE(account_id, 0)', 'COALESCE(store_id, 0)', 'day', 'vtp_order_status')
+_KPI_CONFLICT_KEY = f"({', '.join(_KPI_KEY_EXPRESSIONS)})"
+
+
+class VTPShipmentKpi(models.Model):
+    _name = 'vtp.shipment.kpi'
+    _description = 'ViettelPost Shipment KPI'
+    _order = 'day desc, account_id, store_id, vtp_order_status'
+
+    account_id = fields.Many2one('vtp.account', string='Tài khoản VTP', ondelete='cascade', index=True, readonly=True)
+    store_id = fields.Many2one('vtp.store', string='Store ViettelPost', ondelete='cascade', readonly=True)
+    day = fields.Date(string='Ngày tạo vận đơn', required=True, index=True, readonly=True)
+    vtp_order_status = fields.Integer(string='Mã trạng thái', required=True, default=0, readonly=True)
+    vtp_state = fields.Selection(VTP_STATE_SELECTION, string='Trạng thái VTP', readonly=True)
+    is_final = fields.Boolean(string='Đã kết thúc', readonly=True)
+    bill_count = fields.Integer(string='Số vận đơn', readonly=True)
+    money_collection = fields.Float(string='Tiền thu hộ (COD)', readonly=True)
+    money_totalfee = fields.Float(string='Phí tổng', readonly=True)
+
+    def init(self):
+        create_unique_index(self.env.cr, 'vtp_shipment_kpi_key_uniq',
+                            self._table, list(_KPI_KEY_EXPRESSIONS))
+
+    # ============ Incremental Maintenance ============
+
+    @api.model
+    def _status_attrs(self, status):
+        return PICKING_STATE_MAPPING.get(status) or None, status in FINAL_STATES
+
+    @api.model
+    def _apply_deltas(self, rows, sign=1):
+        """
+        Cộng dồn delta vào bảng KPI bằng một câu INSERT ... ON CONFLICT.
+
+        Args:
+            rows: list of (account_id, store_id, day, status, cod, fee) - xem vtp.order.bill._kpi_rows
+            sign: 1 khi thêm vận đơn vào nhóm, -1 khi bỏ ra
+        """
+        deltas = {}
+        for account_id, store_id, day, status, cod, fee in rows:
+            delta = deltas.setdefault((account_id, store_id, day, status), [0, 0.0, 0.0])
+            delta[0] += sign
+            delta[1] += sign * cod
+            delta[2] += sign * fee
+        values = []
+        for (account_id, store_id, day, status), (count, cod, fee) in deltas.items():
+            vtp_state, is_final = self._status_attrs(status)
+            values.append((account_id, store_id, day, status, vtp_state, is_final, count, cod, fee))
+        if not values:
+            return
+
+        execute_values(self.env.cr._obj, f"""
+            INSERT INTO vtp_shipment_kpi
+                (account_id, store_id, day, vtp_order_status, vtp_state, is_final,
+                 bill_count, money_collection, money_totalfee,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT {_KPI_CONFLICT_KEY} DO UPDATE SET
+                bill_count = vtp_shipment_kpi.bill_count + EXCLUDED.bill_count,
+                money_collection = vtp_shipment_kpi.money_collection + EXCLUDED.money_collection,
+                money_totalfee = vtp_shipment_kpi.money_totalfee + EXCLUDED.money_totalfee,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, values, template=(
+            "(%s, %s, %s, %s, %s, %s, %s, %s, %s, "
+            f"{int(self.env.uid)}, now() at time zone 'UTC', {int(self.env.uid)}, now() at time zone 'UTC')"
+        ))
+        self.invalidate_model()
+
+    # ============ Reconciliation ============
+
+    @api.model
+    def _cron_reconcile(self, days=DEFAULT_RECONCILE_DAYS):
+        """
+        Tính lại KPI của N ngày gần nhất từ vtp_order_bill (sửa sai lệch do ghi SQL
+        trực tiếp, lưu trữ/khôi phục...). Khóa bảng KPI trong lúc thay thế để các
+        delta đồng thời được cộng vào kết quả mới sau khi commit.
+        """
+        cr = self.env.cr
+        self.env.flush_all()
+        since = fields.Date.today() - timedelta(days=days)
+        statuses = list(PICKING_STATE_MAPPING)
+
+        cr.execute("LOCK TABLE vtp_shipment_kpi IN SHARE ROW EXCLUSIVE MODE")
+        cr.execute("DELETE FROM vtp_shipment_kpi WHERE day >= %s", (since,))
+        cr.execute("""
+            INSERT INTO vtp_shipment_kpi
+                (account_id, store_id, day, vtp_order_status, vtp_state, is_final,
+                 bill_count, money_collection, money_totalfee,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT b.account_id, b.store_id, b.create_date::date, COALESCE(b.vtp_order_status, 0),
+                   m.vtp_state, COALESCE(b.vtp_order_status, 0) = ANY(%(final)s),
+                   count(*), COALESCE(sum(b.vtp_money_collection), 0), COALESCE(sum(b.vtp_money_totalfee), 0),
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM vtp_order_bill b
+              LEFT JOIN unnest(%(statuses)s::int[], %(states)s::varchar[]) AS m(status, vtp_state)
+                     ON m.status = b.vtp_order_status
+             WHERE b.create_date >= %(since)s
+          GROUP BY b.account_id, b.store_id, b.create_date::date, COALESCE(b.vtp_order_status, 0), m.vtp_state
+        """, {
+            'final': FINAL_STATES,
+            'uid': self.env.uid,
+            'statuses': statuses,
+            'states': [PICKING_STATE_MAPPING[s] for s in statuses],
+            'since': since,
+        })
+        self.invalidate_model()
+        _logger.info(f"VTP KPI: Đã đối soát {cr.rowcount} dòng KPI từ {since}")
+        return True
@@ -13,6 +13,9 @@ from datetime import datetime, timedelta
 import logging
 import time
 import hashlib
+import json
+
+from .vtp_store_route import ROUTE_STORE_FIELDS
 
 _logger = logging.getLogger(__name__)
 
@@ -61,6 +64,10 @@ class VTPAccount(models.Model):
     # Relationships
     store_ids = fields.One2many('vtp.store', 'account_id', string='Danh sách Store')
     api_audit_ids = fields.One2many('vtp.api.audit', 'account_id', string='API Audit Logs')
+    stores_payload_hash = fields.Char(
+        string='Hash danh sách store', readonly=True, copy=False,
+        help='SHA1 của payload listInventory lần đồng bộ gần nhất - dùng để bỏ qua khi không đổi'
+    )
     
     # Webhook Security
     webhook_token = fields.Char(
@@ -304,12 +311,12 @@ class VTPAccount(models.Model):
         # Không có token - lấy token mới
         return self.refresh_token(force=True)
     
-    def log_api_call(self, endpoint, success=True, error=None):
-        """Cập nhật thông tin API"""
+    def log_api_call(self, endpoint, success=True, error=None, count=1):
+        """Cập nhật thông tin API (count > 1 khi ghi nhận một batch gọi đồng thời)"""
         self.ensure_one()
         vals = {
             'last_api_call': fields.Datetime.now(),
-            'api_call_count': self.api_call_count + 1,
+            'api_call_count': self.api_call_count + count,
         }
         if not success and error:
             vals['last_error'] = str(error)[:1000]
@@ -353,11 +360,8 @@ class VTPAccount(models.Model):
         """Đồng bộ hóa dữ liệu từ API ViettelPost"""
         self.ensure_one()
         
-        VTPService = self.env['vtp.service']
-        Store = self.env['vtp.store']
-        
         # Fetch stores using this account
-        stores = VTPService.fetch_stores(self)
+        stores = self.env['vtp.service'].fetch_stores(self)
         
         if not stores or (isinstance(stores, dict) and stores.get('error')):
             error_msg = stores.get('error') if isinstance(stores, dict) else 'Không lấy được danh sách store'
@@ -372,66 +376,149 @@ class VTPAccount(models.Model):
                 }
             }
         
-        # Process stores
-        existing_stores = Store.search([('account_id', '=', self.id)])
-        existing_store_ids = existing_stores.mapped('groupaddressId')
-        processed_store_ids = set()
+        # Đồng bộ thủ công luôn áp dụng lại (sửa tay / store bị lưu trữ dù payload không đổi)
+        result = self._sync_stores_payload(stores, force=True)
+        if result['skipped']:
+            message = _('Danh sách store không thay đổi kể từ lần đồng bộ trước')
+        else:
+            message = _('Đã đồng bộ %(total)d store (tạo mới %(created)d, cập nhật %(updated)d, lưu trữ %(archived)d)') % result
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Thành công'),
+                'message': message,
+                'sticky': False,
+                'type': 'success',
+            }
+        }
+    
+    @api.model
+    def _hash_stores_payload(self, stores):
+        """Băm payload listInventory ở dạng chuẩn hóa (không phụ thuộc thứ tự key)"""
+        canonical = json.dumps(stores, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+    
+    @api.model
+    def _get_location_maps(self, stores):
+        """
+        Nạp map ID VTP -> id Odoo cho tỉnh/quận/phường, mỗi model một truy vấn.
+        
+        Returns:
+            tuple: (provinces, districts, wards) - dict {ID VTP: id bản ghi}
+        """
+        maps = []
+        for model, key in (('vtp.province', 'provinceId'), ('vtp.district', 'districtId'), ('vtp.ward', 'wardId')):
+            vtp_ids = {store.get(key) for store in stores if store.get(key)}
+            records = self.env[model].search_read([(key, 'in', list(vtp_ids))], [key]) if vtp_ids else []
+            location_map = {}
+            for record in records:
+                # Giữ bản ghi đầu tiên giống search(limit=1)
+                location_map.setdefault(record[key], record['id'])
+            maps.append(location_map)
+        return tuple(maps)
+    
+    def _sync_stores_payload(self, stores, force=False):
+        """
+        Áp dụng danh sách store từ API: so khớp theo groupaddressId bằng dict,
+        tạo mới một lần, ghi theo nhóm giá trị giống nhau, lưu trữ store đã bị xóa.
+        Bỏ qua hoàn toàn khi payload không đổi so với lần đồng bộ trước.
+        
+        Returns:
+            dict: {'skipped', 'total', 'created', 'updated', 'archived'}
+        """
+        self.ensure_one()
+        stores = [store for store in stores if isinstance(store, dict) and store.get('groupaddressId')]
+        payload_hash = self._hash_stores_payload(stores)
+        result = {'skipped': False, 'total': len(stores), 'created': 0, 'updated': 0, 'archived': 0}
+        if not force and payload_hash == self.stores_payload_hash:
+            result['skipped'] = True
+            return result
+        
+        Store = self.env['vtp.store'].with_context(active_test=False)
+        provinces, districts, wards = self._get_location_maps(stores)
+        existing = {
+            store.groupaddressId: store
+            for store in Store.search([('account_id', '=', self.id)])
+        }
         
+        to_create = []
+        to_write = {}
+        seen = set()
         for store_data in stores:
-            store_id = store_data.get('groupaddressId')
-            if not store_id:
+            store_id = str(store_data['groupaddressId'])
+            if store_id in seen:
                 continue
-            processed_store_ids.add(store_id)
-            
-            # Map location IDs
-            province = self.env['vtp.province'].search(
-                [('provinceId', '=', store_data.get('provinceId'))], limit=1
-            )
-            district = self.env['vtp.district'].search(
-                [('districtId', '=', store_data.get('districtId'))], limit=1
-            )
-            ward = self.env['vtp.ward'].search(
-                [('wardId', '=', store_data.get('wardId'))], limit=1
-            )
-            
+            seen.add(store_id)
             store_vals = {
                 'groupaddressId': store_id,
-                'cusId': store_data.get('cusId', 0),
-                'name': store_data.get('name', ''),
-                'phone': store_data.get('phone', ''),
-                'address': store_data.get('address', ''),
-                'provinceId': province.id or False,
-                'districtId': district.id or False,
-                'wardId': ward.id or False,
+                'cusId': str(store_data['cusId']) if store_data.get('cusId') else False,
+                'name': store_data.get('name') or '',
+                'phone': store_data.get('phone') or False,
+                'address': store_data.get('address') or False,
+                'provinceId': provinces.get(store_data.get('provinceId'), False),
+                'districtId': districts.get(store_data.get('districtId'), False),
+                'wardId': wards.get(store_data.get('wardId'), False),
                 'account_id': self.id,
+                'active': True,
             }
             
-            # Update or create
-            existing_store = existing_stores.filtered(lambda s: s.groupaddressId == store_id)
-            if existing_store:
-                diff_vals = {k: v for k, v in store_vals.items() if existing_store[k] != v}
-                if diff_vals:
-                    existing_store.write(diff_vals)
-            else:
-                Store.create(store_vals)
+            store = existing.get(store_id)
+            if not store:
+                to_create.append(store_vals)
+                continue
+            diff_vals = {}
+            for key, value in store_vals.items():
+                current = store[key]
+                if isinstance(current, models.BaseModel):
+                    current = current.id
+                if (current or False) != (value or False):
+                    diff_vals[key] = value
+            if diff_vals:
+                # Gom các store có cùng thay đổi (vd: kích hoạt lại) vào một lần write
+                to_write.setdefault(tuple(sorted(diff_vals.items())), []).append(store.id)
         
-        # Archive removed stores
-        stores_to_archive = set(existing_store_ids) - processed_store_ids
-        if stores_to_archive:
-            existing_stores.filtered(
-                lambda s: s.groupaddressId in stores_to_archive
-            ).write({'active': False})
+        if to_create:
+            Store.create(to_create)
+        for diff_items, store_ids in to_write.items():
+            Store.browse(store_ids).write(dict(diff_items))
         
-        return {
-            'type': 'ir.actions.client',
-            'tag': 'display_notification',
-            'params': {
-                'title': _('Thành công'),
-                'message': _('Đã đồng bộ %d store thành công') % len(processed_store_ids),
-                'sticky': False,
-                'type': 'success',
-            }
-        }
+        to_archive = [store.id for store_id, store in existing.items() if store_id not in seen and store.active]
+        if to_archive:
+            Store.browse(to_archive).write({'active': False})
+        
+        self.stores_payload_hash = payload_hash
+        result.update({
+            'created': len(to_create),
+            'updated': sum(len(ids) for ids in to_write.values()),
+            'archived': len(to_archive),
+        })
+        _logger.info(f"VTP Store Sync: Tài khoản {self.id}: {result}")
+        return result
+    
+    @api.model
+    def _cron_sync_all_stores(self):
+        """Cron: lấy listInventory của mọi tài khoản hoạt động song song, áp dụng trong thread chính"""
+        accounts = self.search([('active', '=', True)])
+        if not accounts:
+            return 0
+        responses = self.env['vtp.service']._make_api_calls_concurrently([
+            {'account': account, 'endpoint': 'user/listInventory', 'method': 'GET'}
+            for account in accounts
+        ])
+        synced = 0
+        for account, stores in zip(accounts, responses):
+            if not stores or not isinstance(stores, list):
+                error = stores.get('error') if isinstance(stores, dict) else None
+                _logger.warning(f"VTP Store Sync: Không lấy được store của tài khoản {account.id}: {error}")
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    if not account._sync_stores_payload(stores)['skipped']:
+                        synced += 1
+            except Exception as e:
+                _logger.exception(f"VTP Store Sync: Lỗi đồng bộ tài khoản {account.id}: {e}")
+        return synced
     
     def action_view_audit_logs(self):
         """View audit logs for this account"""
@@ -478,6 +565,8 @@ class VTPStore(models.Model):
 
     is_default = fields.Boolean(string='Mặc định', default=False)
     active = fields.Boolean(string='Hoạt động', default=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string='Kho xuất hàng', ondelete='set null',
+                                   help='Kho Odoo gửi hàng qua store này - dùng cho định tuyến store tự động')
     
     _sql_constraints = [
         ('groupaddress_account_unique', 
@@ -496,7 +585,9 @@ class VTPStore(models.Model):
                     ('account_id', '=', vals['account_id']),
                     ('is_default', '=', True)
                 ]).write({'is_default': False})
-        return super(VTPStore, self).create(vals_list)
+        stores = super(VTPStore, self).create(vals_list)
+        self.env['vtp.store.route']._queue_rebuild(stores.warehouse_id.ids)
+        return stores
 
     def write(self, vals):
         if vals.get('is_default'):
@@ -507,7 +598,20 @@ class VTPStore(models.Model):
                     ('account_id', '=', record.account_id.id),
                     ('is_default', '=', True)
                 ]).write({'is_default': False})
-        return super(VTPStore, self).write(vals)
+        route_changed = bool(ROUTE_STORE_FIELDS.intersection(vals))
+        # Kho cũ và kho mới đều phải dựng lại tuyến
+        warehouse_ids = set(self.warehouse_id.ids) if route_changed else set()
+        result = super(VTPStore, self).write(vals)
+        if route_changed:
+            warehouse_ids.update(self.warehouse_id.ids)
+            self.env['vtp.store.route']._queue_rebuild(list(warehouse_ids))
+        return result
+
+    def unlink(self):
+        warehouse_ids = self.warehouse_id.ids
+        result = super().unlink()
+        self.env['vtp.store.route']._queue_rebuild(warehouse_ids)
+        return result
 
     def action_set_default(self):
         """Set this store as default for its account"""
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Store Route - Chọn store gửi hàng theo địa lý và lịch sử cước
+
+Bảng dựng sẵn (kho, tỉnh nhận, quận nhận) -> các store ứng viên đã xếp hạng:
+1. Mức gần: cùng quận (0), cùng tỉnh (1), khác tỉnh (2)
+2. Cước trung bình trong lịch sử tra cước (vtp.pricing) của store trên tuyến, rẻ trước
+Dòng có warehouse_id trống áp dụng cho mọi kho; dòng có receiver_district_id
+trống dùng khi chưa biết quận nhận.
+
+Bảng được dựng bằng một câu INSERT ... SELECT (window function) cho từng nhóm kho;
+khi store thay đổi chỉ nhóm kho liên quan được dựng lại (một lần khi commit).
+Tra cứu được cache (ormcache) theo phiên bản 'store_route' của vtp.cache.version.
+"""
+
+import logging
+
+from odoo import api, fields, models, tools
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+# Số store ứng viên giữ lại cho mỗi khóa tuyến
+ROUTE_CANDIDATES = 5
+# Số lần tra cước tối thiểu để dùng cước trung bình của store trên tuyến
+ROUTE_MIN_FEE_SAMPLES = 3
+ROUTE_FEE_LOOKBACK_DAYS = 180
+# Trường store làm thay đổi bảng tuyến
+ROUTE_STORE_FIELDS = {'active', 'provinceId', 'districtId', 'warehouse_id', 'account_id'}
+
+
+class VTPStoreRoute(models.Model):
+    _name = 'vtp.store.route'
+    _description = 'ViettelPost Store Routing Table'
+    _order = 'warehouse_id, receiver_province_id, receiver_district_id, rank'
+
+    warehouse_id = fields.Many2one('stock.warehouse', string='Kho', ondelete='cascade', readonly=True,
+                                   help='Để trống: áp dụng cho mọi kho')
+    receiver_province_id = fields.Many2one('vtp.province', string='Tỉnh nhận', ondelete='cascade', readonly=True)
+    receiver_district_id = fields.Many2one('vtp.district', string='Quận/Huyện nhận', ondelete='cascade', readonly=True)
+    store_id = fields.Many2one('vtp.store', string='Store', ondelete='cascade', readonly=True)
+    rank = fields.Integer(string='Thứ hạng', readonly=True)
+    distance_tier = fields.Selection([
+        ('0', 'Cùng quận/huyện'),
+        ('1', 'Cùng tỉnh'),
+        ('2', 'Khác tỉnh'),
+    ], string='Khoảng cách', readonly=True)
+    avg_fee = fields.Float(string='Cước trung bình', readonly=True)
+    fee_samples = fields.Integer(string='Số lần tra cước', readonly=True)
+
+    def init(self):
+        create_index(self.env.cr, 'vtp_store_route_lookup_idx',
+                     self._table, ['receiver_province_id', 'receiver_district_id',
+                                   'warehouse_id', 'rank'])
+
+    # ============ Build ============
+
+    @api.model
+    def _rebuild(self, warehouse_ids=None):
+        """
+        Dựng lại bảng tuyến.
+
+        Args:
+            warehouse_ids: list[int] - chỉ dựng lại các nhóm kho này (kèm nhóm 'mọi kho');
+                           None: dựng lại toàn bộ
+        """
+        self.env.flush_all()
+        cr = self.env.cr
+        if warehouse_ids is None:
+            cr.execute("DELETE FROM vtp_store_route")
+            cr.execute("SELECT DISTINCT warehouse_id FROM vtp_store WHERE warehouse_id IS NOT NULL")
+            warehouse_ids = [row[0] for row in cr.fetchall()]
+        else:
+            warehouse_ids = [wid for wid in warehouse_ids if wid]
+            cr.execute("""
+                DELETE FROM vtp_store_route WHERE warehouse_id IS NULL OR warehouse_id = ANY(%s)
+            """, (warehouse_ids,))
+
+        params = {
+            'warehouses': warehouse_ids,
+            'candidates': ROUTE_CANDIDATES,
+            'min_samples': ROUTE_MIN_FEE_SAMPLES,
+            'lookback': ROUTE_FEE_LOOKBACK_DAYS,
+            'uid': self.env.uid,
+        }
+        # Khóa kho: NULL (mọi kho) + các kho cần dựng lại
+        common = """
+            WITH stores AS (
+                SELECT s.id, s."provinceId" AS province_id, s."districtId" AS district_id, s.warehouse_id
+                  FROM vtp_store s
+                  JOIN vtp_account a ON a.id = s.account_id
+                 WHERE s.active AND a.active AND s."provinceId" IS NOT NULL
+            ),
+            warehouse_keys AS (
+                SELECT NULL::int AS warehouse_id
+                UNION ALL
+                SELECT unnest(%(warehouses)s::int[])
+            ),
+            store_keys AS (
+                SELECT k.warehouse_id AS key_warehouse, s.*
+                  FROM warehouse_keys k
+                  JOIN stores s ON k.warehouse_id IS NULL OR s.warehouse_id = k.warehouse_id
+            )
+        """
+        # Dòng theo quận nhận
+        cr.execute(common + """,
+            fees AS (
+                SELECT store_id, receiver_district_id AS district_id, avg(money_total_fee) AS fee, count(*) AS samples
+                  FROM vtp_pricing
+                 WHERE receiver_district_id IS NOT NULL AND money_total_fee > 0
+                   AND create_date >= (now() at time zone 'UTC') - make_interval(days => %(lookback)s)
+              GROUP BY store_id, receiver_district_id
+            ),
+            ranked AS (
+                SELECT sk.key_warehouse, d."provinceId" AS province_id, d.id AS district_id, sk.id AS store_id,
+                       CASE WHEN sk.district_id = d.id THEN 0 WHEN sk.province_id = d."provinceId" THEN 1 ELSE 2 END AS tier,
+                       CASE WHEN f.samples >= %(min_samples)s THEN f.fee END AS fee,
+                       COALESCE(f.samples, 0) AS samples
+                  FROM vtp_district d
+                  JOIN store_keys sk ON TRUE
+                  LEFT JOIN fees f ON f.store_id = sk.id AND f.district_id = d.id
+                 WHERE d."provinceId" IS NOT NULL
+            ),
+            numbered AS (
+                SELECT *, row_number() OVER (
+                           PARTITION BY key_warehouse, district_id
+                           ORDER BY tier, fee NULLS LAST, store_id) AS rank
+                  FROM ranked
+            )
+            INSERT INTO vtp_store_route
+                (warehouse_id, receiver_province_id, receiver_district_id, store_id, rank, distance_tier,
+                 avg_fee, fee_samples, create_uid, create_date, write_uid, write_date)
+            SELECT key_warehouse, province_id, district_id, store_id, rank, tier::varchar, fee, samples,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM numbered
+             WHERE rank <= %(candidates)s
+        """, params)
+        district_rows = cr.rowcount
+        # Dòng theo tỉnh nhận (chưa biết quận)
+        cr.execute(common + """,
+            fees AS (
+                SELECT store_id, receiver_province_id AS province_id, avg(money_total_fee) AS fee, count(*) AS samples
+                  FROM vtp_pricing
+                 WHERE receiver_province_id IS NOT NULL AND money_total_fee > 0
+                   AND create_date >= (now() at time zone 'UTC') - make_interval(days => %(lookback)s)
+              GROUP BY store_id, receiver_province_id
+            ),
+            ranked AS (
+                SELECT sk.key_warehouse, p.id AS province_id, sk.id AS store_id,
+                       CASE WHEN sk.province_id = p.id THEN 1 ELSE 2 END AS tier,
+                       CASE WHEN f.samples >= %(min_samples)s THEN f.fee END AS fee,
+                       COALESCE(f.samples, 0) AS samples
+                  FROM vtp_province p
+                  JOIN store_keys sk ON TRUE
+                  LEFT JOIN fees f ON f.store_id = sk.id AND f.province_id = p.id
+            ),
+            numbered AS (
+                SELECT *, row_number() OVER (
+                           PARTITION BY key_warehouse, province_id
+                           ORDER BY tier, fee NULLS LAST, store_id) AS rank
+                  FROM ranked
+            )
+            INSERT INTO vtp_store_route
+                (warehouse_id, receiver_province_id, receiver_district_id, store_id, rank, distance_tier,
+                 avg_fee, fee_samples, create_uid, create_date, write_uid, write_date)
+            SELECT key_warehouse, province_id, NULL, store_id, rank, tier::varchar, fee, samples,
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM numbered
+             WHERE rank <= %(candidates)s
+        """, params)
+
+        self.invalidate_model()
+        self.env['vtp.cache.version']._bump('store_route')
+        _logger.info(f"VTP Store Route: Dựng lại {len(warehouse_ids)} kho + mọi kho, "
+                     f"{district_rows + cr.rowcount} dòng")
+        return district_rows + cr.rowcount
+
+    @api.model
+    def _cron_rebuild(self):
+        """Cron: dựng lại toàn bộ để cập nhật cước trung bình mới"""
+        return self._rebuild()
+
+    @api.model
+    def _queue_rebuild(self, warehouse_ids):
+        """Gom các kho cần dựng lại trong transaction, dựng một lần khi commit"""
+        pending = self.env.cr.precommit.data.setdefault('vtp_store_route.pending', set())
+        if not pending:
+            self.env.cr.precommit.add(self._run_queued_rebuild)
+        # 0: chỉ nhóm 'mọi kho'
+        pending.update(warehouse_ids or [0])
+
+    @api.model
+    def _run_queued_rebuild(self):
+        pending = self.env.cr.precommit.data.pop('vtp_store_route.pending', set())
+        if pending:
+            self.sudo()._rebuild(list(pending))
+
+    # ============ Lookup ============
+
+    @api.model
+    @tools.ormcache('warehouse_id', 'province_id', 'district_id', 'version')
+    def _get_route_store_ids(self, warehouse_id, province_id, district_id, version):
+        """Store ứng viên của khóa cụ thể nhất có dữ liệu: (kho, quận) > (kho, tỉnh) > (mọi kho, quận) > (mọi kho, tỉnh)"""
+        self.env.cr.execute("""
+            SELECT warehouse_id, receiver_district_id, store_id
+              FROM vtp_store_route
+             WHERE receiver_province_id = %s
+               AND (receiver_district_id = %s OR receiver_district_id IS NULL)
+               AND (warehouse_id = %s OR warehouse_id IS NULL)
+          ORDER BY warehouse_id IS NULL, receiver_district_id IS NULL, rank
+             LIMIT %s
+        """, (province_id, district_id or None, warehouse_id or None, 4 * ROUTE_CANDIDATES))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return ()
+        best_key = rows[0][:2]
+        return tuple(store_id for warehouse, district, store_id in rows if (warehouse, district) == best_key)
+
+    @api.model
+    def _get_ranked_stores(self, province, district=None, warehouse=None):
+        """vtp.store đã xếp hạng cho địa chỉ nhận (recordset, có thể rỗng)"""
+        province = province or (district.provinceId if district else None)
+        if not province:
+            return self.env['vtp.store']
+        store_ids = self._get_route_store_ids(warehouse.id if warehouse else 0, province.id,
+                                              district.id if district else 0,
+                                              self.env['vtp.cache.version']._get('store_route'))
+        return self.env['vtp.store'].browse(store_ids)
+
+    @api.model
+    def _suggest_store(self, picking, province=None, district=None):
+        """Store đề xuất cho phiếu giao hàng: kho của loại phiếu + địa chỉ nhận"""
+        if not (province or district) and picking.partner_id:
+            location = self.env['vtp.gazetteer'].resolve_partner(picking.partner_id)
+            province = self.env['vtp.province'].browse(location['province_id'] or [])
+            district = self.env['vtp.district'].browse(location['district_id'] or [])
+        return self._get_ranked_stores(
+            province, district, picking.picking_type_id.warehouse_id,
+        ).filtered('active')[:1]
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Stuck Detector - Phát hiện vận đơn nằm quá lâu ở một trạng thái
+
+Mỗi lần chạy chỉ xét các vận đơn "vừa quá hạn" kể từ lần chạy trước:
+vận đơn trạng thái S bị coi là tồn khi vtp_bill_updated_date <= now - T(S).
+Với mốc lần chạy trước (high-water mark) last, tập cần xét là
+    last - T(S) < vtp_bill_updated_date <= now - T(S)
+- một range scan trên index (vtp_order_status, vtp_bill_updated_date).
+Trạng thái có thể được ghi muộn (webhook trễ, re-drive, polling) với
+vtp_bill_updated_date đã nằm trước cửa sổ; các vận đơn được ghi sau lần chạy
+trước (write_date > last) và đã quá ngưỡng cũng được xét. Phiếu đã có activity
+tồn đọng mở được bỏ qua nên xét lại không tạo activity trùng.
+"""
+
+import json
+import logging
+from datetime import timedelta
+
+from odoo import _, api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Ngưỡng mặc định (giờ) theo trạng thái; ghi đè bằng JSON trong
+# ir.config_parameter 'viettel_ingration_odoo_18.stuck_thresholds', vd: {"500": 48, "506": 24}
+DEFAULT_STUCK_THRESHOLDS = {
+    500: 48,    # Đang giao
+    505: 72,    # Tồn - Thông báo chuyển hoàn
+    506: 48,    # Tồn - KH nghỉ, không có nhà
+    507: 72,    # Tồn - KH đến bưu cục nhận
+}
+# Lần chạy đầu tiên chỉ xét vận đơn cập nhật trong N ngày gần nhất
+STUCK_INITIAL_LOOKBACK_DAYS = 30
+
+PARAM_THRESHOLDS = 'viettel_ingration_odoo_18.stuck_thresholds'
+PARAM_LAST_RUN = 'viettel_ingration_odoo_18.stuck_last_run'
+
+
+class VTPStuckDetector(models.AbstractModel):
+    _name = 'vtp.stuck.detector'
+    _description = 'ViettelPost Stuck Shipment Detector'
+
+    @api.model
+    def _get_thresholds(self):
+        """Ngưỡng theo trạng thái: {status: timedelta}"""
+        thresholds = dict(DEFAULT_STUCK_THRESHOLDS)
+        value = self.env['ir.config_parameter'].sudo().get_param(PARAM_THRESHOLDS)
+        if value:
+            try:
+                thresholds = {int(status): float(hours) for status, hours in json.loads(value).items()}
+            except (TypeError, ValueError, AttributeError):
+                _logger.warning(f"VTP Stuck: Cấu hình ngưỡng không hợp lệ: {value}")
+        return {status: timedelta(hours=hours) for status, hours in thresholds.items() if hours > 0}
+
+    @api.model
+    def _cron_detect_stuck(self):
+        """Tìm vận đơn vừa quá ngưỡng kể từ lần chạy trước và tạo activity trên phiếu giao hàng"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        now = fields.Datetime.now()
+        last_run = fields.Datetime.to_datetime(ICP.get_param(PARAM_LAST_RUN)) or (
+            now - timedelta(days=STUCK_INITIAL_LOOKBACK_DAYS)
+        )
+        self.env.flush_all()
+
+        rows = []
+        for status, threshold in self._get_thresholds().items():
+            self.env.cr.execute("""
+                SELECT id, order_id, vtp_bill_updated_date
+                  FROM vtp_order_bill
+                 WHERE vtp_order_status = %s
+                   AND vtp_bill_updated_date <= %s
+                   AND (vtp_bill_updated_date > %s OR write_date > %s)
+                   AND order_id IS NOT NULL
+            """, (status, now - threshold, last_run - threshold, last_run))
+            rows.extend((status, threshold) + row for row in self.env.cr.fetchall())
+
+        created = self._create_stuck_activities(rows)
+        ICP.set_param(PARAM_LAST_RUN, fields.Datetime.to_string(now))
+        if rows:
+            _logger.info(f"VTP Stuck: {len(rows)} vận đơn quá hạn, tạo {created} activity")
+        return created
+
+    @api.model
+    def _create_stuck_activities(self, rows):
+        """
+        Tạo activity hàng loạt trên stock.picking, bỏ qua phiếu đã có activity tồn đọng mở.
+
+        Args:
+            rows: list of (status, threshold, bill_id, picking_id, updated_date)
+        """
+        if not rows:
+            return 0
+        Activity = self.env['mail.activity'].sudo()
+        summary = _('Vận đơn VTP tồn đọng')
+        picking_model = self.env['ir.model']._get('stock.picking')
+
+        picking_ids = {row[3] for row in rows}
+        existing = set(Activity.search([
+            ('res_model', '=', 'stock.picking'),
+            ('res_id', 'in', list(picking_ids)),
+            ('summary', '=', summary),
+        ]).mapped('res_id'))
+
+        pickings = self.env['stock.picking'].sudo().browse(picking_ids - existing)
+        users = {picking.id: picking.user_id.id for picking in pickings}
+        bills = {bill.id: bill for bill in self.env['vtp.order.bill'].sudo().browse({row[2] for row in rows})}
+        activity_type = self.env.ref('mail.mail_activity_data_todo', raise_if_not_found=False)
+        today = fields.Date.context_today(self)
+
+        vals_list = []
+        for status, threshold, bill_id, picking_id, updated in rows:
+            if picking_id in existing or picking_id not in users:
+                continue
+            existing.add(picking_id)
+            bill = bills[bill_id]
+            vals_list.append({
+                'res_model_id': picking_model.id,
+                'res_id': picking_id,
+                'activity_type_id': activity_type.id if activity_type else False,
+                'summary': summary,
+                'note': _(
+                    'Vận đơn %(order)s ở trạng thái %(status)s (%(name)s) từ %(since)s, quá %(hours)s giờ.',
+                    order=bill.order_number,
+                    status=status,
+                    name=bill.status_name or '',
+                    since=updated,
+                    hours=int(threshold.total_seconds() // 3600),
+                ),
+                'date_deadline': today,
+                'user_id': users[picking_id] or self.env.ref('base.user_admin').id,
+            })
+        Activity.create(vals_list)
+        return len(vals_list)
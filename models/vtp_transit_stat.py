@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Transit Stat - Phân phối thời gian vận chuyển theo tuyến
+
+Job phân tích đọc lịch sử trạng thái (vtp_order_bill_history) thành các mảng
+cột, tính thời gian từ lúc lấy hàng tới lúc phát thành công cho từng vận đơn,
+rồi tính percentile theo tuyến (tỉnh gửi, quận/huyện nhận, dịch vụ) bằng các
+phép toán vector hóa (NumPy, có phương án dự phòng thuần Python).
+
+Bảng percentile được dùng để ước tính expected_delivery_date khi webhook VTP
+không gửi EXPECTED_DELIVERY_DATE; tra cứu được cache theo phiên bản 'transit_stat'
+của vtp.cache.version.
+"""
+
+import logging
+import math
+from datetime import timedelta
+
+from odoo import api, fields, models, tools
+from odoo.tools.sql import create_unique_index
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Trạng thái bắt đầu tính thời gian vận chuyển: bưu tá đã nhận / nhận tại bưu cục gốc
+TRANSIT_START_STATUSES = [105, 200]
+# Trạng thái kết thúc: phát thành công
+TRANSIT_END_STATUSES = [501]
+# Số mẫu tối thiểu để một tuyến được dùng cho ước tính
+MIN_TRANSIT_SAMPLES = 5
+DEFAULT_LOOKBACK_DAYS = 180
+# Percentile dùng để ước tính ngày giao
+ETA_PERCENTILE = 'p75_hours'
+
+PERCENTILES = (50, 75, 90)
+
+
+class VTPTransitStat(models.Model):
+    _name = 'vtp.transit.stat'
+    _description = 'ViettelPost Transit Time Statistics'
+    _order = 'sender_province_id, receiver_district_id, service_code'
+
+    sender_province_id = fields.Many2one('vtp.province', string='Tỉnh gửi', ondelete='cascade', readonly=True)
+    receiver_district_id = fields.Many2one('vtp.district', string='Quận/Huyện nhận', ondelete='cascade', readonly=True)
+    service_code = fields.Char(string='Dịch vụ', readonly=True, help='Để trống: mọi dịch vụ trên tuyến')
+    sample_count = fields.Integer(string='Số mẫu', readonly=True)
+    mean_hours = fields.Float(string='Trung bình (giờ)', readonly=True)
+    p50_hours = fields.Float(string='P50 (giờ)', readonly=True)
+    p75_hours = fields.Float(string='P75 (giờ)', readonly=True)
+    p90_hours = fields.Float(string='P90 (giờ)', readonly=True)
+    computed_at = fields.Datetime(string='Tính lúc', readonly=True)
+
+    def init(self):
+        create_unique_index(self.env.cr, 'vtp_transit_stat_route_uniq',
+                            self._table, ['sender_province_id', 'receiver_district_id',
+                                          "COALESCE(service_code, '')"])
+
+    # ============ Analytics Job ============
+
+    @api.model
+    def _cron_compute_transit_stats(self, lookback_days=DEFAULT_LOOKBACK_DAYS):
+        """Tính lại bảng percentile từ lịch sử N ngày gần nhất"""
+        self.env.flush_all()
+        bill_ids, durations = self._load_transit_durations(lookback_days)
+        if not len(bill_ids):
+            _logger.info("VTP Transit: Không có dữ liệu lịch sử để phân tích")
+            return 0
+
+        routes = self._load_route_keys(bill_ids)
+        rows = self._compute_route_percentiles(routes, durations)
+        # Thống kê theo tuyến, không phân biệt dịch vụ - dùng khi dịch vụ thiếu mẫu
+        rows += self._compute_route_percentiles([(p, d, '') for p, d, unused in routes], durations)
+
+        cr = self.env.cr
+        cr.execute("DELETE FROM vtp_transit_stat")
+        now = fields.Datetime.now()
+        vals_list = [{
+            'sender_province_id': province_id,
+            'receiver_district_id': district_id,
+            'service_code': service_code or False,
+            'sample_count': count,
+            'mean_hours': mean,
+            'p50_hours': p50,
+            'p75_hours': p75,
+            'p90_hours': p90,
+            'computed_at': now,
+        } for (province_id, district_id, service_code), count, mean, p50, p75, p90 in rows]
+        self.create(vals_list)
+        self.env['vtp.cache.version']._bump('transit_stat')
+        _logger.info(f"VTP Transit: {len(durations)} vận đơn, {len(vals_list)} tuyến")
+        return len(vals_list)
+
+    @api.model
+    def _load_transit_durations(self, lookback_days):
+        """
+        Đọc lịch sử dạng cột (bill_id, loại mốc, epoch) và tính thời gian vận chuyển
+        (giờ) cho từng vận đơn.
+
+        Returns:
+            tuple: (bill_ids, durations) - cùng độ dài
+        """
+        self.env.cr.execute("""
+            SELECT bill_id,
+                   order_status = ANY(%s) AS is_end,
+                   EXTRACT(EPOCH FROM order_status_date)
+              FROM vtp_order_bill_history
+             WHERE bill_id IS NOT NULL
+               AND order_status = ANY(%s)
+               AND order_status_date >= (now() at time zone 'UTC') - make_interval(days => %s)
+          ORDER BY bill_id
+        """, (TRANSIT_END_STATUSES, TRANSIT_START_STATUSES + TRANSIT_END_STATUSES, lookback_days))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return [], []
+
+        if np is None:
+            return self._transit_durations_python(rows)
+
+        bill_col = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        end_col = np.fromiter((r[1] for r in rows), dtype=bool, count=len(rows))
+        time_col = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+
+        # Ranh giới từng vận đơn (dữ liệu đã sắp xếp theo bill_id)
+        starts = np.flatnonzero(np.r_[True, bill_col[1:] != bill_col[:-1]])
+        first_start = np.minimum.reduceat(np.where(end_col, np.inf, time_col), starts)
+        first_end = np.minimum.reduceat(np.where(end_col, time_col, np.inf), starts)
+
+        hours = (first_end - first_start) / 3600.0
+        valid = np.isfinite(hours) & (hours > 0)
+        return bill_col[starts][valid], hours[valid]
+
+    @staticmethod
+    def _transit_durations_python(rows):
+        first = {}
+        for bill_id, is_end, epoch in rows:
+            start, end = first.get(bill_id, (math.inf, math.inf))
+            if is_end:
+                end = min(end, epoch)
+            else:
+                start = min(start, epoch)
+            first[bill_id] = (start, end)
+        bill_ids, durations = [], []
+        for bill_id, (start, end) in first.items():
+            hours = (end - start) / 3600.0
+            if math.isfinite(hours) and hours > 0:
+                bill_ids.append(bill_id)
+                durations.append(hours)
+        return bill_ids, durations
+
+    @api.model
+    def _load_route_keys(self, bill_ids):
+        """Khóa tuyến (tỉnh gửi, quận/huyện nhận, dịch vụ) theo đúng thứ tự bill_ids"""
+        self.env.cr.execute("""
+            SELECT b.id, s."provinceId", p.vtp_receiver_district_id, COALESCE(p.vtp_service_code, '')
+              FROM vtp_order_bill b
+              LEFT JOIN vtp_store s ON s.id = b.store_id
+              LEFT JOIN stock_picking p ON p.id = b.order_id
+             WHERE b.id = ANY(%s)
+        """, ([int(bill_id) for bill_id in bill_ids],))
+        keys = {bill_id: (province_id, district_id, service) for bill_id, province_id, district_id, service in self.env.cr.fetchall()}
+        return [keys.get(int(bill_id), (None, None, '')) for bill_id in bill_ids]
+
+    @api.model
+    def _compute_route_percentiles(self, routes, durations):
+        """
+        Percentile theo tuyến. Bỏ qua tuyến thiếu tỉnh gửi / quận nhận hoặc ít mẫu.
+
+        Returns:
+            list: ((province, district, service), count, mean, p50, p75, p90)
+        """
+        index = {}
+        codes = []
+        for route in routes:
+            if route[0] and route[1]:
+                codes.append(index.setdefault(route, len(index)))
+            else:
+                codes.append(-1)
+        keys = list(index)
+        if not keys:
+            return []
+
+        if np is None:
+            groups = {}
+            for code, hours in zip(codes, durations):
+                if code >= 0:
+                    groups.setdefault(code, []).append(hours)
+            result = []
+            for code, values in groups.items():
+                if len(values) < MIN_TRANSIT_SAMPLES:
+                    continue
+                values.sort()
+                result.append((keys[code], len(values), sum(values) / len(values))
+                              + tuple(_percentile_sorted(values, q) for q in PERCENTILES))
+            return result
+
+        code_arr = np.asarray(codes, dtype=np.int64)
+        hours_arr = np.asarray(durations, dtype=np.float64)
+        mask = code_arr >= 0
+        code_arr, hours_arr = code_arr[mask], hours_arr[mask]
+
+        # Sắp xếp theo (tuyến, thời gian) để lấy percentile bằng phép chỉ số
+        order = np.lexsort((hours_arr, code_arr))
+        code_arr, hours_arr = code_arr[order], hours_arr[order]
+        group_start = np.flatnonzero(np.r_[True, code_arr[1:] != code_arr[:-1]])
+        counts = np.diff(np.r_[group_start, len(code_arr)])
+        means = np.add.reduceat(hours_arr, group_start) / counts
+
+        percentiles = []
+        for q in PERCENTILES:
+            # Nội suy tuyến tính giống numpy.percentile(method='linear')
+            pos = group_start + (counts - 1) * (q / 100.0)
+            lower = np.floor(pos).astype(np.int64)
+            upper = np.minimum(lower + 1, group_start + counts - 1)
+            frac = pos - lower
+            percentiles.append(hours_arr[lower] + (hours_arr[upper] - hours_arr[lower]) * frac)
+
+        keep = counts >= MIN_TRANSIT_SAMPLES
+        group_codes = code_arr[group_start]
+        return [
+            (keys[int(group_codes[i])], int(counts[i]), float(means[i]))
+            + tuple(float(p[i]) for p in percentiles)
+            for i in np.flatnonzero(keep)
+        ]
+
+    # ============ ETA ============
+
+    @api.model
+    @tools.ormcache('province_id', 'district_id', 'service_code', 'version')
+    def _get_route_hours(self, province_id, district_id, service_code, version):
+        """Số giờ vận chuyển ước tính của tuyến (ưu tiên đúng dịch vụ), hoặc None"""
+        for service in ([service_code, ''] if service_code else ['']):
+            self.env.cr.execute(f"""
+                SELECT {ETA_PERCENTILE} FROM vtp_transit_stat
+                 WHERE sender_province_id = %s AND receiver_district_id = %s
+                   AND COALESCE(service_code, '') = %s
+            """, (province_id, district_id, service))
+            row = self.env.cr.fetchone()
+            if row:
+                return row[0]
+        return None
+
+    @api.model
+    def _estimate_delivery_date(self, bill, service_code=None):
+        """Ngày giao dự kiến = mốc lấy hàng (hoặc cập nhật gần nhất) + percentile của tuyến"""
+        picking = bill.order_id
+        province_id = bill.store_id.provinceId.id
+        district_id = picking.vtp_receiver_district_id.id
+        if not (province_id and district_id):
+            return False
+        hours = self._get_route_hours(province_id, district_id, service_code or picking.vtp_service_code or '',
+                                      self.env['vtp.cache.version']._get('transit_stat'))
+        if hours is None:
+            return False
+
+        self.env.cr.execute("""
+            SELECT min(order_status_date) FROM vtp_order_bill_history
+             WHERE bill_id = %s AND order_status = ANY(%s)
+        """, (bill.id, TRANSIT_START_STATUSES))
+        start = self.env.cr.fetchone()[0] or bill.vtp_bill_updated_date or fields.Datetime.now()
+        return (start + timedelta(hours=hours)).date()
+
+
+def _percentile_sorted(values, q):
+    """Percentile nội suy tuyến tính trên danh sách đã sắp xếp"""
+    pos = (len(values) - 1) * (q / 100.0)
+    lower = int(math.floor(pos))
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
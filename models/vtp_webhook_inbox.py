@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Webhook Inbox - Sự kiện webhook đã nhận nhưng chưa xử lý
+
+Bảng này được ghi bởi receiver độc lập (standalone/webhook_receiver.py) bằng
+một câu INSERT duy nhất cho mỗi request; cron của Odoo đọc các dòng 'pending'
+và đưa qua vtp.order.bill.process_webhook_batch.
+"""
+
+import json
+import logging
+
+from odoo import api, fields, models
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+# Số sự kiện xử lý trong một transaction của cron
+INBOX_BATCH_SIZE = 500
+
+
+class VTPWebhookInbox(models.Model):
+    _name = 'vtp.webhook.inbox'
+    _description = 'VTP Webhook Inbox'
+    _order = 'id'
+    _rec_name = 'order_number'
+
+    account_id = fields.Many2one('vtp.account', string='Tài khoản VTP', ondelete='set null', index=True)
+    order_number = fields.Char(string='Mã vận đơn ViettelPost', index=True)
+    payload = fields.Text(string='Payload', required=True)
+    received_at = fields.Datetime(string='Thời điểm nhận', required=True, default=fields.Datetime.now)
+    state = fields.Selection([
+        ('pending', 'Chờ xử lý'),
+        ('done', 'Đã xử lý'),
+        ('error', 'Lỗi'),
+    ], string='Trạng thái', default='pending', required=True, index=True)
+    result_status = fields.Char(string='Kết quả')
+    error_message = fields.Text(string='Lỗi')
+    processed_at = fields.Datetime(string='Thời điểm xử lý')
+
+    def init(self):
+        # Cron chỉ quét các dòng pending theo thứ tự nhận
+        create_index(self.env.cr, 'vtp_webhook_inbox_pending_idx',
+                     self._table, ['id'], where="state = 'pending'")
+
+    @api.model
+    def _cron_process_inbox(self, limit=None):
+        """
+        Xử lý các sự kiện pending theo thứ tự nhận, commit sau mỗi batch.
+
+        Dùng FOR UPDATE SKIP LOCKED để nhiều worker cron có thể chạy song song.
+        """
+        batch_size = limit or INBOX_BATCH_SIZE
+        total = 0
+        while True:
+            self.env.cr.execute("""
+                SELECT id, payload, account_id FROM vtp_webhook_inbox
+                WHERE state = 'pending'
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (batch_size,))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+
+            ids, items, account_ids = [], [], []
+            for row_id, payload, account_id in rows:
+                ids.append(row_id)
+                account_ids.append(account_id)
+                try:
+                    items.append(json.loads(payload))
+                except ValueError:
+                    items.append(None)
+
+            # Receiver chỉ xác nhận token thuộc một tài khoản đang hoạt động; tài khoản đó
+            # phải là tài khoản sở hữu vận đơn (dòng cũ còn TOKEN trong payload vẫn được kiểm tra)
+            results = self.env['vtp.order.bill'].sudo().process_webhook_batch(
+                items, check_token=True, account_ids=account_ids)
+
+            now = fields.Datetime.now()
+            done_by_status = {}
+            for row_id, result in zip(ids, results):
+                if result['status'] == 'error':
+                    self.browse(row_id).write({
+                        'state': 'error',
+                        'result_status': result['status'],
+                        'error_message': result['message'],
+                        'processed_at': now,
+                    })
+                else:
+                    done_by_status.setdefault(result['status'], []).append(row_id)
+            for status, status_ids in done_by_status.items():
+                self.browse(status_ids).write({
+                    'state': 'done',
+                    'result_status': status,
+                    'processed_at': now,
+                })
+            self.env.cr.commit()
+            total += len(rows)
+            if len(rows) < batch_size:
+                break
+
+        if total:
+            _logger.info(f"VTP Webhook Inbox: Đã xử lý {total} sự kiện")
+        return total
+
+    def action_retry(self):
+        """Đưa các sự kiện lỗi về trạng thái chờ xử lý"""
+        self.filtered(lambda r: r.state == 'error').write({
+            'state': 'pending',
+            'error_message': False,
+        })
+
+    @api.autovacuum
+    def _gc_processed_events(self):
+        """Xóa sự kiện đã xử lý quá 30 ngày"""
+        self.env.cr.execute("""
+            DELETE FROM vtp_webhook_inbox
+            WHERE state = 'done' AND processed_at < (now() at time zone 'UTC') - interval '30 days'
+        """)
+        return True
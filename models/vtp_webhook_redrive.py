@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Webhook Re-drive - Phát lại sự kiện webhook bị lỗi/từ chối từ audit log
+
+Sự kiện được chọn từ vtp.api.audit (endpoint 'webhook/order_status') theo khoảng
+thời gian, tài khoản, loại lỗi và mã trạng thái; sắp xếp theo thời gian trạng
+thái trong từng mã vận đơn rồi phát lại qua process_webhook_batch theo chunk.
+Tiến độ được lưu trên từng item nên job có thể dừng và tiếp tục.
+"""
+
+import json
+import logging
+
+from psycopg2.extras import execute_values
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
+
+from ..services.webhook_decoder import parse_vtp_date
+
+_logger = logging.getLogger(__name__)
+
+WEBHOOK_AUDIT_ENDPOINT = 'webhook/order_status'
+# Số sự kiện phát lại mỗi transaction
+REDRIVE_CHUNK_SIZE = 500
+# Khóa sắp xếp cho sự kiện không có ORDER_STATUSDATE hợp lệ (xếp sau cùng trong vận đơn)
+UNDATED_SORT_KEY = '9999-12-31 23:59:59'
+
+# Điều kiện SQL trên vtp_api_audit cho từng loại sự kiện cần phát lại
+REDRIVE_OUTCOME_FILTERS = {
+    'failed': "NOT a.success",
+    'invalid_transition': "NOT a.success AND a.error_message LIKE 'Chuyển trạng thái không hợp lệ%%'",
+    'unknown_order': "NOT a.success AND a.error_message LIKE 'Rejected unknown order%%'",
+    'error': "NOT a.success AND a.error_message LIKE 'Error:%%'",
+    'ignored': "a.success AND a.response_data LIKE '%%Ignored:%%'",
+}
+
+
+def _status_sort_key(status_date):
+    """Thời gian trạng thái dạng chuỗi (parse_vtp_date); sự kiện không có ngày xếp cuối"""
+    return parse_vtp_date(status_date) or UNDATED_SORT_KEY
+
+
+class VTPWebhookRedrive(models.Model):
+    _name = 'vtp.webhook.redrive'
+    _description = 'ViettelPost Webhook Re-drive'
+    _inherit = ['mail.thread']
+    _order = 'create_date desc, id desc'
+
+    name = fields.Char(string='Tên', required=True, default=lambda self: _('Phát lại webhook %s') % fields.Date.today())
+    date_from = fields.Datetime(string='Từ thời điểm', required=True)
+    date_to = fields.Datetime(string='Đến thời điểm', required=True, default=fields.Datetime.now)
+    account_ids = fields.Many2many('vtp.account', string='Tài khoản VTP', help='Để trống: mọi tài khoản')
+    outcome = fields.Selection([
+        ('failed', 'Mọi sự kiện thất bại'),
+        ('invalid_transition', 'Chuyển trạng thái không hợp lệ'),
+        ('unknown_order', 'Đơn không xác định'),
+        ('error', 'Lỗi xử lý'),
+        ('ignored', 'Bị bỏ qua (trạng thái cuối)'),
+    ], string='Loại sự kiện', default='failed', required=True)
+    order_status = fields.Integer(string='Mã trạng thái', help='0: mọi trạng thái')
+    state = fields.Selection([
+        ('draft', 'Nháp'),
+        ('running', 'Đang chạy'),
+        ('done', 'Hoàn thành'),
+        ('cancelled', 'Đã dừng'),
+    ], string='Trạng thái', default='draft', required=True, tracking=True)
+
+    item_ids = fields.One2many('vtp.webhook.redrive.item', 'redrive_id', string='Sự kiện')
+    total_count = fields.Integer(string='Tổng sự kiện', readonly=True)
+    order_count = fields.Integer(string='Số vận đơn', readonly=True)
+    processed_count = fields.Integer(string='Đã xử lý', readonly=True)
+    updated_count = fields.Integer(string='Cập nhật thành công', readonly=True)
+    failed_count = fields.Integer(string='Vẫn thất bại', readonly=True)
+    progress = fields.Float(string='Tiến độ (%)', compute='_compute_progress')
+
+    @api.depends('processed_count', 'total_count')
+    def _compute_progress(self):
+        for record in self:
+            record.progress = 100.0 * record.processed_count / record.total_count if record.total_count else 0.0
+
+    # ============ Selection ============
+
+    def action_prepare(self):
+        """Chọn sự kiện từ audit log, loại trùng và sắp xếp theo thời gian trong từng vận đơn"""
+        for job in self:
+            if job.state != 'draft':
+                raise UserError(_('Chỉ chuẩn bị được job ở trạng thái Nháp.'))
+            job.item_ids.unlink()
+
+            conditions = [
+                "a.endpoint = %(endpoint)s",
+                "a.timestamp >= %(date_from)s",
+                "a.timestamp <= %(date_to)s",
+                "a.request_data IS NOT NULL",
+                REDRIVE_OUTCOME_FILTERS[job.outcome],
+            ]
+            params = {'endpoint': WEBHOOK_AUDIT_ENDPOINT, 'date_from': job.date_from, 'date_to': job.date_to}
+            if job.account_ids:
+                conditions.append("a.account_id = ANY(%(accounts)s)")
+                params['accounts'] = job.account_ids.ids
+            self.env.flush_all()
+            self.env.cr.execute(f"""
+                SELECT a.id, a.request_data FROM vtp_api_audit a
+                 WHERE {' AND '.join(conditions)}
+              ORDER BY a.id
+            """, params)
+
+            events = {}
+            for audit_id, request_data in self.env.cr.fetchall():
+                try:
+                    data = json.loads(request_data)
+                except ValueError:
+                    continue
+                if not isinstance(data, dict) or not data.get('ORDER_NUMBER'):
+                    continue
+                try:
+                    status = int(data.get('ORDER_STATUS') or 0)
+                except (TypeError, ValueError):
+                    status = 0
+                if job.order_status and status != job.order_status:
+                    continue
+                # Cùng một sự kiện có thể được ghi nhiều lần (VTP gửi lại) - giữ bản ghi cuối
+                key = (str(data['ORDER_NUMBER']), status, data.get('ORDER_STATUSDATE'))
+                events[key] = (audit_id, data)
+
+            ordered = sorted(
+                events.items(),
+                key=lambda item: (item[0][0], _status_sort_key(item[0][2]), item[1][0]),
+            )
+            rows = [
+                (sequence, audit_id, order_number, status, json.dumps(data, ensure_ascii=False))
+                for sequence, ((order_number, status, unused_date), (audit_id, data)) in enumerate(ordered)
+            ]
+            if rows:
+                uid = int(self.env.uid)
+                execute_values(self.env.cr._obj, """
+                    INSERT INTO vtp_webhook_redrive_item
+                        (redrive_id, sequence, audit_id, order_number, order_status, payload, state,
+                         create_uid, create_date, write_uid, write_date)
+                    VALUES %s
+                """, rows, template=(
+                    f"({job.id}, %s, %s, %s, %s, %s, 'pending', "
+                    f"{uid}, now() at time zone 'UTC', {uid}, now() at time zone 'UTC')"
+                ), page_size=1000)
+                self.env['vtp.webhook.redrive.item'].invalidate_model()
+
+            job.write({
+                'total_count': len(rows),
+                'order_count': len({row[2] for row in rows}),
+                'processed_count': 0,
+                'updated_count': 0,
+                'failed_count': 0,
+            })
+        return True
+
+    # ============ Execution ============
+
+    def action_start(self):
+        for job in self:
+            if job.state == 'draft' and not job.total_count:
+                job.action_prepare()
+        self.filtered(lambda j: j.state in ('draft', 'cancelled') and j.total_count).write({'state': 'running'})
+        self.env.ref('viettel_ingration_odoo_18.ir_cron_viettelpost_webhook_redrive')._trigger()
+        return True
+
+    def action_cancel(self):
+        self.filtered(lambda j: j.state == 'running').write({'state': 'cancelled'})
+        return True
+
+    @api.model
+    def _cron_run_redrive(self, chunk_size=REDRIVE_CHUNK_SIZE, max_chunks=20):
+        """Chạy tiếp các job đang chạy theo chunk; commit sau mỗi chunk để có thể tiếp tục"""
+        for unused in range(max_chunks):
+            job = self.search([('state', '=', 'running')], order='id', limit=1)
+            if not job:
+                return True
+            if not job._run_chunk(chunk_size):
+                job.write({'state': 'done'})
+                job.message_post(body=_(
+                    'Phát lại xong: %(updated)s cập nhật, %(failed)s vẫn thất bại / %(total)s sự kiện.',
+                    updated=job.updated_count, failed=job.failed_count, total=job.total_count,
+                ))
+            self.env.cr.commit()
+        # Còn việc - hẹn chạy tiếp ngay
+        if self.search_count([('state', '=', 'running')], limit=1):
+            self.env.ref('viettel_ingration_odoo_18.ir_cron_viettelpost_webhook_redrive')._trigger()
+        return True
+
+    def _run_chunk(self, chunk_size):
+        """Phát lại chunk tiếp theo theo thứ tự; trả về số sự kiện đã xử lý"""
+        self.ensure_one()
+        self.env.cr.execute("""
+            SELECT id, payload FROM vtp_webhook_redrive_item
+             WHERE redrive_id = %s AND state = 'pending'
+          ORDER BY sequence
+             LIMIT %s
+        """, (self.id, chunk_size))
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return 0
+
+        items = [{'DATA': json.loads(payload)} for unused, payload in rows]
+        results = self.env['vtp.order.bill'].sudo().process_webhook_batch(items, check_token=False)
+
+        by_status = {}
+        for (item_id, unused), result in zip(rows, results):
+            by_status.setdefault((result['status'], result['message']), []).append(item_id)
+        Item = self.env['vtp.webhook.redrive.item']
+        for (status, message), item_ids in by_status.items():
+            Item.browse(item_ids).write({
+                'state': 'done',
+                'result_status': status,
+                'result_message': message,
+            })
+
+        updated = len([r for r in results if r['status'] == 'updated'])
+        self.write({
+            'processed_count': self.processed_count + len(rows),
+            'updated_count': self.updated_count + updated,
+            'failed_count': self.failed_count + len(rows) - updated,
+        })
+        return len(rows)
+
+    def action_view_items(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Sự kiện phát lại'),
+            'res_model': 'vtp.webhook.redrive.item',
+            'view_mode': 'list',
+            'domain': [('redrive_id', '=', self.id)],
+        }
+
+
+class VTPWebhookRedriveItem(models.Model):
+    _name = 'vtp.webhook.redrive.item'
+    _description = 'ViettelPost Webhook Re-drive Item'
+    _order = 'redrive_id, sequence'
+    _rec_name = 'order_number'
+
+    redrive_id = fields.Many2one('vtp.webhook.redrive', string='Job', required=True, ondelete='cascade', index=True)
+    sequence = fields.Integer(string='Thứ tự')
+    audit_id = fields.Many2one('vtp.api.audit', string='Audit log', ondelete='set null')
+    order_number = fields.Char(string='Mã vận đơn ViettelPost')
+    order_status = fields.Integer(string='Mã trạng thái')
+    payload = fields.Text(string='Payload')
+    state = fields.Selection([
+        ('pending', 'Chờ phát lại'),
+        ('done', 'Đã phát lại'),
+    ], string='Trạng thái', default='pending', required=True)
+    result_status = fields.Char(string='Kết quả')
+    result_message = fields.Text(string='Chi tiết')
+
+    def init(self):
+        # Job đọc các item pending theo thứ tự
+        create_index(self.env.cr, 'vtp_webhook_redrive_item_pending_idx',
+                     self._table, ['redrive_id', 'sequence'], where="state = 'pending'")
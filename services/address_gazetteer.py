@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Address Gazetteer - Nhận diện tỉnh / quận / phường từ địa chỉ tự do
+
+Pure Python helpers (no ORM access) used by vtp.gazetteer:
+- Chuẩn hóa tên: bỏ dấu, chữ thường, tách "Q.1" / "P12" / "F3", mở rộng viết tắt
+- Bí danh tỉnh thành thông dụng ("TP HCM", "SG", "HN", ...)
+- Chỉ mục n-gram: cụm từ đã chuẩn hóa -> id theo từng cấp
+- Phân giải theo thứ bậc: tỉnh (cụm phải nhất) -> quận thuộc tỉnh -> phường thuộc quận;
+  phường trong đoạn đầu của địa chỉ (số nhà, tên đường) chỉ được nhận khi có tiền tố
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+# Tiền tố loại đơn vị hành chính (đã chuẩn hóa), dài trước ngắn sau
+ADMIN_PREFIXES = ('thanh pho', 'thi tran', 'thi xa', 'tinh', 'quan', 'huyen', 'phuong', 'xa')
+
+# Viết tắt một token -> dạng đầy đủ
+ABBREVIATIONS = {
+    'tp': 'thanh pho',
+    'tx': 'thi xa',
+    'tt': 'thi tran',
+    'q': 'quan',
+    'h': 'huyen',
+    'p': 'phuong',
+    'f': 'phuong',
+    'x': 'xa',
+}
+
+# Bí danh (đã chuẩn hóa) -> tên chuẩn hóa của tỉnh
+PROVINCE_ALIASES = {
+    'hcm': 'ho chi minh',
+    'tphcm': 'ho chi minh',
+    'thanh pho hcm': 'ho chi minh',
+    'sai gon': 'ho chi minh',
+    'sg': 'ho chi minh',
+    'hn': 'ha noi',
+    'brvt': 'ba ria vung tau',
+    'vung tau': 'ba ria vung tau',
+    'hue': 'thua thien hue',
+    'dak lak': 'dak lak',
+    'dac lac': 'dak lak',
+    'daklak': 'dak lak',
+    'dak nong': 'dak nong',
+    'daknong': 'dak nong',
+}
+
+# Token đầu của tên phường/xã có tiền tố rõ ràng ("P." / "F" đã được mở rộng thành 'phuong')
+WARD_PREFIX_TOKENS = {'phuong', 'xa', 'thi'}
+
+# Số token tối đa của một cụm được tra trong chỉ mục (giới hạn thêm bởi dữ liệu)
+MAX_NGRAM = 6
+
+_PREFIX_DIGIT_RE = re.compile(r'\b(q|p|f)(\d+)\b')
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(text):
+    """Chuẩn hóa: bỏ dấu, 'đ' -> 'd', chữ thường, chỉ giữ chữ/số, mở rộng viết tắt"""
+    if not text:
+        return ''
+    text = text.lower().replace('đ', 'd')
+    text = ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+    text = _NON_ALNUM_RE.sub(' ', text)
+    text = _PREFIX_DIGIT_RE.sub(r'\1 \2', text)
+    return ' '.join(ABBREVIATIONS.get(token, token) for token in text.split())
+
+
+def strip_admin_prefix(name):
+    """'quan go vap' -> 'go vap'; trả về tên không đổi nếu không có tiền tố"""
+    for prefix in ADMIN_PREFIXES:
+        if name.startswith(prefix + ' ') and len(name) > len(prefix) + 1:
+            return name[len(prefix) + 1:]
+    return name
+
+
+def name_keys(name, numeric_prefix):
+    """
+    Các khóa tra cứu của một tên địa danh.
+
+    Tên dạng số ("Quận 1", "Phường 12") chỉ được tra cùng tiền tố để tránh khớp
+    nhầm số nhà; numeric_prefix là tiền tố dùng khi tên gốc không có tiền tố.
+    """
+    full = normalize_name(name)
+    if not full:
+        return set()
+    core = strip_admin_prefix(full)
+    keys = {full}
+    if core.isdigit():
+        keys.add(full if full != core else f'{numeric_prefix} {core}')
+    else:
+        keys.add(core)
+    return keys
+
+
+class Gazetteer:
+    """
+    Chỉ mục địa danh trong bộ nhớ.
+
+    Args:
+        provinces: iterable of (id, name)
+        districts: iterable of (id, name, province_id)
+        wards: iterable of (id, name, district_id)
+    """
+
+    def __init__(self, provinces, districts, wards):
+        self.province_index = {}
+        self.district_index = {}
+        self.ward_index = {}
+        self.district_province = {}
+        self.ward_district = {}
+        self.max_ngram = 1
+
+        province_names = {}
+        for province_id, name in provinces:
+            for key in name_keys(name, 'tinh'):
+                self._add(self.province_index, key, province_id)
+            province_names[strip_admin_prefix(normalize_name(name))] = province_id
+        for alias, canonical in PROVINCE_ALIASES.items():
+            if canonical in province_names:
+                self._add(self.province_index, alias, province_names[canonical])
+
+        for district_id, name, province_id in districts:
+            self.district_province[district_id] = province_id
+            for key in name_keys(name, 'quan'):
+                self._add(self.district_index, key, district_id)
+
+        for ward_id, name, district_id in wards:
+            self.ward_district[ward_id] = district_id
+            for key in name_keys(name, 'phuong'):
+                self._add(self.ward_index, key, ward_id)
+
+        self.max_ngram = min(self.max_ngram, MAX_NGRAM)
+
+    def _add(self, index, key, record_id):
+        ids = index.setdefault(key, [])
+        if record_id not in ids:
+            ids.append(record_id)
+        self.max_ngram = max(self.max_ngram, key.count(' ') + 1)
+
+    def _matches(self, tokens):
+        """Mọi cụm n-gram có trong chỉ mục: {cấp: [(start, end, [ids])]}"""
+        found = {'province': [], 'district': [], 'ward': []}
+        indexes = (('province', self.province_index), ('district', self.district_index), ('ward', self.ward_index))
+        count = len(tokens)
+        for start in range(count):
+            for end in range(start + 1, min(start + self.max_ngram, count) + 1):
+                phrase = ' '.join(tokens[start:end])
+                for level, index in indexes:
+                    ids = index.get(phrase)
+                    if ids:
+                        found[level].append((start, end, ids))
+        return found
+
+    def resolve(self, *texts, province_hint=None):
+        """
+        Phân giải địa chỉ tự do.
+
+        Args:
+            texts: các phần địa chỉ (street, street2, city, ...), ghép theo thứ tự
+            province_hint: id tỉnh đã biết (vd: từ state_id), ưu tiên khi khớp
+
+        Returns:
+            dict: {'province_id', 'district_id', 'ward_id'} (None nếu không xác định)
+        """
+        # Token kèm số thứ tự đoạn (tách theo dấu phẩy trên toàn bộ các phần địa chỉ)
+        tokens, token_segment = [], []
+        for part in ','.join(t for t in texts if t).split(','):
+            part_tokens = normalize_name(part).split()
+            if part_tokens:
+                segment = token_segment[-1] + 1 if token_segment else 0
+                tokens.extend(part_tokens)
+                token_segment.extend([segment] * len(part_tokens))
+        found = self._matches(tokens)
+        # Phường không có tiền tố trong đoạn đầu thường là tên đường ("15 Điện Biên Phủ")
+        found['ward'] = [
+            (start, end, ids) for start, end, ids in found['ward']
+            if token_segment[start] > 0 or tokens[start] in WARD_PREFIX_TOKENS
+        ]
+        result = {'province_id': province_hint, 'district_id': None, 'ward_id': None}
+        used = set()
+
+        # Tỉnh: cụm khớp nằm phải nhất (địa chỉ VN kết thúc bằng tỉnh), dài nhất
+        provinces = sorted(found['province'], key=lambda m: (m[1], m[1] - m[0]), reverse=True)
+        if province_hint:
+            provinces = [m for m in provinces if province_hint in m[2]]
+        else:
+            provinces = [m for m in provinces if len(m[2]) == 1]
+        if provinces:
+            start, end, ids = provinces[0]
+            result['province_id'] = province_hint or ids[0]
+            used.update(range(start, end))
+
+        def candidates(level, parent_of, parent_ids):
+            """(cụm, id) không trùng vùng đã dùng và thuộc cấp trên (nếu đã biết)"""
+            matches = []
+            for start, end, ids in found[level]:
+                if used.intersection(range(start, end)):
+                    continue
+                ids = [i for i in ids if not parent_ids or parent_of(i) in parent_ids]
+                if ids:
+                    matches.append((start, end, ids))
+            return sorted(matches, key=lambda m: (m[1] - m[0], m[1]), reverse=True)
+
+        province_ids = {result['province_id']} if result['province_id'] else None
+        districts = candidates('district', self.district_province.get, province_ids)
+        for start, end, ids in districts:
+            if len(ids) == 1:
+                result['district_id'] = ids[0]
+                result['province_id'] = self.district_province.get(ids[0]) or result['province_id']
+                used.update(range(start, end))
+                break
+
+        if result['district_id']:
+            wards = candidates('ward', self.ward_district.get, {result['district_id']})
+        elif province_ids:
+            wards = candidates('ward', lambda w: self.district_province.get(self.ward_district.get(w)), province_ids)
+        else:
+            wards = []
+        for unused_start, unused_end, ids in wards:
+            if len(ids) == 1:
+                ward_id = ids[0]
+                result['ward_id'] = ward_id
+                result['district_id'] = self.ward_district.get(ward_id) or result['district_id']
+                result['province_id'] = self.district_province.get(result['district_id']) or result['province_id']
+                break
+        return result
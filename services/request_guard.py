@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Request Guard - Công cụ bảo vệ endpoint công khai (per-worker, thread-safe)
+
+Pure Python helpers (no ORM access) used by the address conversion controller:
+- SingleFlight: các request giống nhau chạy đồng thời chỉ gọi upstream một lần
+- KeyedRateLimiter: token bucket theo client, không chặn (trả về True/False)
+- Counters: bộ đếm metrics đơn giản
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Gộp các lời gọi cùng khóa đang chạy: chỉ lời gọi đầu tiên thực thi fn"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def do(self, key, fn, timeout=None):
+        """
+        Returns:
+            tuple: (kết quả, shared) - shared=True nếu dùng chung kết quả của lời gọi khác
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return future.result(timeout=timeout), True
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class KeyedRateLimiter:
+    """Token bucket theo khóa (vd: IP client); capacity token, nạp lại rate_per_second"""
+
+    # Dọn bucket không dùng sau mỗi N lần gọi
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._calls = 0
+
+    def allow(self, key, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                self._cleanup(now)
+        return allowed
+
+    def _cleanup(self, now):
+        # Bucket đã nạp đầy lại thì tương đương bucket mới - xóa
+        refill = self.capacity / self.rate if self.rate else 0
+        for key in [k for k, (unused, updated) in self._buckets.items() if now - updated >= refill]:
+            del self._buckets[key]
+
+
+class Counters:
+    """Bộ đếm metrics thread-safe"""
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(names, 0)
+        self.started = time.time()
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + count
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values, uptime_seconds=int(time.time() - self.started))
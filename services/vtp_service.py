@@ -13,7 +13,9 @@ All methods require an `account` parameter to ensure multi-account isolation.
 import json
 import logging
 import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from odoo import api, fields, models, _
@@ -35,6 +37,97 @@ DEFAULT_RETRY_CONFIG = {
     'timeout': 30,  # Request timeout in seconds
 }
 
+# Concurrent API calls (batch operations)
+DEFAULT_CONCURRENCY_CONFIG = {
+    'per_account': 4,        # Số request đồng thời tối đa cho mỗi tài khoản
+    'rate_per_second': 5.0,  # Số request tối đa mỗi giây cho mỗi tài khoản
+    'max_workers': 16,       # Tổng số thread tối đa
+}
+
+# Status polling - endpoint có thể ghi đè bằng ir.config_parameter
+DEFAULT_STATUS_ENDPOINT = 'order/getOrderStatus'
+POLL_BATCH_SIZE = 200
+# Số payload mẫu giữ trong audit log gộp (audit='summary')
+AUDIT_SUMMARY_SAMPLE = 5
+
+
+class _RateLimiter:
+    """Giới hạn số request mỗi giây (thread-safe)"""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _send_request(url, method, headers, data, retry_config):
+    """
+    Gửi một request HTTP với retry - chỉ dùng thư viện requests, không truy cập ORM,
+    nên an toàn khi chạy trong thread. Dùng chung cho _make_api_call và
+    _make_api_calls_concurrently.
+
+    Returns:
+        dict: {'result', 'http_status', 'duration_ms', 'error'}
+    """
+    last_error = None
+    for attempt in range(retry_config['max_retries']):
+        start_time = time.time()
+        try:
+            if method == 'GET':
+                response = requests.get(url, headers=headers, params=data, timeout=retry_config['timeout'])
+            else:
+                response = requests.post(url, headers=headers, json=data, timeout=retry_config['timeout'])
+            duration_ms = int((time.time() - start_time) * 1000)
+
+            if response.status_code in retry_config['retry_on_status'] and attempt < retry_config['max_retries'] - 1:
+                _logger.warning(f"VTP API {url} returned {response.status_code}, retrying "
+                                f"(attempt {attempt + 1}/{retry_config['max_retries']})")
+                time.sleep(retry_config['backoff_factor'] ** attempt)
+                continue
+
+            response.raise_for_status()
+            return {
+                'result': response.json(),
+                'http_status': response.status_code,
+                'duration_ms': duration_ms,
+                'error': None,
+            }
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else 0
+            last_error = f"HTTP Error {status_code}: {str(e)}"
+            if status_code in retry_config['retry_on_status'] and attempt < retry_config['max_retries'] - 1:
+                time.sleep(retry_config['backoff_factor'] ** attempt)
+                continue
+            return {'result': None, 'http_status': status_code, 'duration_ms': None, 'error': last_error}
+        except requests.exceptions.Timeout:
+            last_error = f"Request timeout after {retry_config['timeout']}s"
+            if attempt < retry_config['max_retries'] - 1:
+                _logger.warning(f"VTP API {url} timeout, retrying (attempt {attempt + 1}/{retry_config['max_retries']})")
+                time.sleep(retry_config['backoff_factor'] ** attempt)
+                continue
+        except requests.exceptions.ConnectionError as e:
+            last_error = f"Lỗi kết nối: {str(e)}"
+            if attempt < retry_config['max_retries'] - 1:
+                _logger.warning(f"VTP API {url} connection error, retrying "
+                                f"(attempt {attempt + 1}/{retry_config['max_retries']})")
+                time.sleep(retry_config['backoff_factor'] ** attempt)
+                continue
+        except Exception as e:
+            last_error = f"Lỗi không mong muốn: {str(e)}"
+            _logger.exception(f"VTP API {url} unexpected error")
+            break
+    return {'result': None, 'http_status': None, 'duration_ms': None, 'error': last_error or 'Max retries exhausted'}
+
 
 class VTPService(models.AbstractModel):
     """
@@ -303,159 +396,218 @@ class VTPService(models.AbstractModel):
         """
         if not account:
             raise UserError(_('Cần có tài khoản để thực hiện các cuộc gọi API'))
-        
+        if method not in ('GET', 'POST'):
+            raise UserError(_('Hệ thống không hỗ trợ phương thức HTTP: %s') % method)
+
         account.ensure_one()
-        retry_config = self._get_retry_config()
-        last_error = None
-        
-        for attempt in range(retry_config['max_retries']):
-            try:
-                # Get valid token from account (using sudo due to field restrictions)
-                token = account.sudo().get_valid_token()
-                if not token:
-                    error = _('Không thể lấy Token cho tài khoản %s') % account.name
-                    self._create_audit_log(
-                        account=account,
-                        endpoint=endpoint,
-                        method=method,
-                        request_data=data,
-                        success=False,
-                        error_message=error,
-                        order_bill=order_bill
-                    )
-                    return {'error': error}
-                
-                # Prepare request
-                url = f"{self._get_api_url()}/{endpoint}"
-                headers = {
-                    'Content-Type': 'application/json',
-                    'Token': token
-                }
-                
-                # Make request
-                start_time = time.time()
-                
-                if method == 'GET':
-                    response = requests.get(
-                        url, 
-                        headers=headers, 
-                        params=data, 
-                        timeout=retry_config['timeout']
-                    )
-                elif method == 'POST':
-                    response = requests.post(
-                        url, 
-                        headers=headers, 
-                        json=data, 
-                        timeout=retry_config['timeout']
-                    )
-                else:
-                    raise UserError(_('Hệ thống không hỗ trợ phương thức HTTP: %s') % method)
-                
-                duration_ms = int((time.time() - start_time) * 1000)
-                
-                # Kiểm tra các mã trạng thái có thể retry
-                if response.status_code in retry_config['retry_on_status']:
-                    if attempt < retry_config['max_retries'] - 1:
-                        wait_time = retry_config['backoff_factor'] ** attempt
-                        _logger.warning(
-                            f"VTP API {endpoint} returned {response.status_code}, "
-                            f"retrying in {wait_time}s (attempt {attempt + 1}/{retry_config['max_retries']})"
-                        )
-                        time.sleep(wait_time)
-                        continue
-                
-                response.raise_for_status()
-                result = response.json()
-                
-                # Log success
-                account.log_api_call(endpoint, success=True)
-                self._create_audit_log(
-                    account=account,
-                    endpoint=endpoint,
-                    method=method,
-                    request_data=data,
-                    response_data=result,
-                    success=True,
-                    http_status=response.status_code,
-                    duration_ms=duration_ms,
-                    token=token,
-                    order_bill=order_bill
-                )
-                
-                # Trả về dữ liệu dựa trên cấu trúc phản hồi
-                if isinstance(result, dict):
-                    if result.get('status') == 200:
-                        return result.get('data', result)
-                    else:
-                        error = f"API Error: {result.get('message', 'Unknown error')}"
-                        return {'error': error}
-                elif isinstance(result, list):
-                    return result
-                else:
-                    return result
-                
-            except requests.exceptions.HTTPError as e:
-                status_code = e.response.status_code if e.response is not None else 0
-                last_error = f"HTTP Error {status_code}: {str(e)}"
-                
-                # Retry on specific status codes
-                if status_code in retry_config['retry_on_status'] and attempt < retry_config['max_retries'] - 1:
-                    wait_time = retry_config['backoff_factor'] ** attempt
-                    _logger.warning(
-                        f"VTP API {endpoint} failed with {status_code}, "
-                        f"retrying in {wait_time}s (attempt {attempt + 1}/{retry_config['max_retries']})"
-                    )
-                    time.sleep(wait_time)
-                    continue
-                
-                _logger.error(f"VTP API {endpoint} failed: {last_error}")
-                
-            except requests.exceptions.Timeout:
-                last_error = f"Request timeout after {retry_config['timeout']}s"
-                
-                if attempt < retry_config['max_retries'] - 1:
-                    wait_time = retry_config['backoff_factor'] ** attempt
-                    _logger.warning(
-                        f"VTP API {endpoint} timeout, "
-                        f"retrying in {wait_time}s (attempt {attempt + 1}/{retry_config['max_retries']})"
-                    )
-                    time.sleep(wait_time)
-                    continue
-                
-                _logger.error(f"VTP API {endpoint} failed: {last_error}")
-                
-            except requests.exceptions.ConnectionError:
-                last_error = "Lỗi kết nối - không thể truy cập mạng"
-                
-                if attempt < retry_config['max_retries'] - 1:
-                    wait_time = retry_config['backoff_factor'] ** attempt
-                    _logger.warning(
-                        f"VTP API {endpoint} connection error, "
-                        f"retrying in {wait_time}s (attempt {attempt + 1}/{retry_config['max_retries']})"
-                    )
-                    time.sleep(wait_time)
-                    continue
-                
-                _logger.error(f"VTP API {endpoint} failed: {last_error}")
-                
-            except Exception as e:
-                last_error = f"Lỗi không mong muốn: {str(e)}"
-                _logger.exception(f"VTP API {endpoint} unexpected error")
-        
-        # All retries exhausted
-        account.log_api_call(endpoint, success=False, error=last_error)
+        # Get valid token from account (using sudo due to field restrictions)
+        token = account.sudo().get_valid_token()
+        if not token:
+            error = _('Không thể lấy Token cho tài khoản %s') % account.name
+            self._create_audit_log(
+                account=account,
+                endpoint=endpoint,
+                method=method,
+                request_data=data,
+                success=False,
+                error_message=error,
+                order_bill=order_bill
+            )
+            return {'error': error}
+
+        # Retry / backoff dùng chung với các lời gọi song song
+        response = _send_request(
+            f"{self._get_api_url()}/{endpoint}",
+            method,
+            {'Content-Type': 'application/json', 'Token': token},
+            data,
+            self._get_retry_config(),
+        )
+
+        if response['error']:
+            _logger.error(f"VTP API {endpoint} failed: {response['error']}")
+            account.log_api_call(endpoint, success=False, error=response['error'])
+            self._create_audit_log(
+                account=account,
+                endpoint=endpoint,
+                method=method,
+                request_data=data,
+                success=False,
+                error_message=response['error'],
+                http_status=response['http_status'],
+                token=token,
+                order_bill=order_bill
+            )
+            return {'error': response['error']}
+
+        account.log_api_call(endpoint, success=True)
         self._create_audit_log(
             account=account,
             endpoint=endpoint,
             method=method,
             request_data=data,
-            success=False,
-            error_message=last_error,
+            response_data=response['result'],
+            success=True,
+            http_status=response['http_status'],
+            duration_ms=response['duration_ms'],
+            token=token,
             order_bill=order_bill
         )
-        
-        return {'error': last_error or 'Max retries exhausted'}
+        # Trả về dữ liệu dựa trên cấu trúc phản hồi
+        return self._normalize_api_result(response['result'])
+
+    @api.model
+    def _get_concurrency_config(self):
+        """Lấy cấu hình gọi API đồng thời - có thể ghi đè bằng ir.config_parameter"""
+        config = DEFAULT_CONCURRENCY_CONFIG.copy()
+        ICP = self.env['ir.config_parameter'].sudo()
+        for key in config:
+            value = ICP.get_param(f'viettel_ingration_odoo_18.concurrency_{key}')
+            if value:
+                try:
+                    config[key] = type(config[key])(value)
+                except (TypeError, ValueError):
+                    _logger.warning(f"Giá trị cấu hình không hợp lệ concurrency_{key}: {value}")
+        return config
+
+    @api.model
+    def _make_api_calls_concurrently(self, calls, per_account=None, rate_per_second=None, audit='full'):
+        """
+        Gọi nhiều API song song, giới hạn concurrency và tốc độ theo từng tài khoản.
+
+        Token được lấy trong thread chính; các thread chỉ gửi HTTP (không dùng ORM).
+        Audit log và thống kê tài khoản được ghi trong thread chính sau khi có kết quả.
+
+        Args:
+            calls: list of dict {'account', 'endpoint', 'method', 'data', 'order_bill' (tùy chọn)}
+            per_account: int - Số request đồng thời tối đa mỗi tài khoản
+            rate_per_second: float - Số request tối đa mỗi giây mỗi tài khoản
+            audit: 'full' - một audit log cho mỗi lời gọi; 'summary' - lời gọi lỗi vẫn ghi
+                   từng dòng, lời gọi thành công gộp thành một dòng mỗi (tài khoản, endpoint)
+
+        Returns:
+            list: Kết quả theo đúng thứ tự calls, cùng dạng với _make_api_call
+        """
+        if not calls:
+            return []
+
+        config = self._get_concurrency_config()
+        per_account = per_account or config['per_account']
+        rate_per_second = rate_per_second or config['rate_per_second']
+        retry_config = self._get_retry_config()
+        base_url = self._get_api_url()
+
+        accounts = self.env['vtp.account'].browse()
+        for call in calls:
+            accounts |= call['account']
+
+        tokens = {}
+        limits = {}
+        for account in accounts:
+            tokens[account.id] = account.sudo().get_valid_token()
+            limits[account.id] = (threading.Semaphore(per_account), _RateLimiter(rate_per_second))
+
+        def worker(call):
+            account = call['account']
+            token = tokens.get(account.id)
+            if not token:
+                return {'result': None, 'http_status': None, 'duration_ms': None,
+                        'error': _('Không thể lấy Token cho tài khoản %s') % account.name}
+            semaphore, limiter = limits[account.id]
+            with semaphore:
+                limiter.acquire()
+                return _send_request(
+                    f"{base_url}/{call['endpoint']}",
+                    call.get('method', 'POST'),
+                    {'Content-Type': 'application/json', 'Token': token},
+                    call.get('data'),
+                    retry_config,
+                )
+
+        max_workers = min(config['max_workers'], per_account * len(accounts), len(calls))
+        with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+            responses = list(executor.map(worker, calls))
+
+        results = []
+        stats = {}
+        summaries = {}
+        for call, response in zip(calls, responses):
+            account = call['account']
+            method = call.get('method', 'POST')
+            token = tokens.get(account.id)
+            account_stats = stats.setdefault(account.id, {'count': 0, 'error': None})
+            account_stats['count'] += 1
+
+            if response['error']:
+                account_stats['error'] = response['error']
+                self._create_audit_log(
+                    account=account,
+                    endpoint=call['endpoint'],
+                    method=method,
+                    request_data=call.get('data'),
+                    success=False,
+                    error_message=response['error'],
+                    http_status=response['http_status'],
+                    token=token,
+                    order_bill=call.get('order_bill'),
+                )
+                results.append({'error': response['error']})
+                continue
+
+            if audit == 'summary':
+                summary = summaries.setdefault((account.id, call['endpoint'], method),
+                                               {'account': account, 'token': token, 'calls': 0, 'duration_ms': 0,
+                                                'sample': []})
+                summary['calls'] += 1
+                summary['duration_ms'] += response['duration_ms'] or 0
+                if len(summary['sample']) < AUDIT_SUMMARY_SAMPLE:
+                    summary['sample'].append(call.get('data'))
+            else:
+                self._create_audit_log(
+                    account=account,
+                    endpoint=call['endpoint'],
+                    method=method,
+                    request_data=call.get('data'),
+                    response_data=response['result'],
+                    success=True,
+                    http_status=response['http_status'],
+                    duration_ms=response['duration_ms'],
+                    token=token,
+                    order_bill=call.get('order_bill'),
+                )
+            results.append(self._normalize_api_result(response['result']))
+
+        for (unused_account_id, endpoint, method), summary in summaries.items():
+            self._create_audit_log(
+                account=summary['account'],
+                endpoint=endpoint,
+                method=method,
+                request_data={'calls': summary['calls'], 'sample': summary['sample']},
+                response_data={'status': 'summary', 'calls': summary['calls']},
+                success=True,
+                duration_ms=summary['duration_ms'] // summary['calls'],
+                token=summary['token'],
+            )
+
+        for account in accounts:
+            account_stats = stats.get(account.id)
+            if account_stats:
+                account.log_api_call(
+                    'batch',
+                    success=not account_stats['error'],
+                    error=account_stats['error'],
+                    count=account_stats['count'],
+                )
+        return results
+
+    @api.model
+    def _normalize_api_result(self, result):
+        """Chuẩn hóa phản hồi VTP giống _make_api_call: data nếu thành công, {'error'} nếu lỗi"""
+        if isinstance(result, dict):
+            if result.get('status') == 200:
+                return result.get('data', result)
+            return {'error': f"API Error: {result.get('message', 'Unknown error')}"}
+        return result
 
     # ============ Audit Logging ============
 
@@ -522,6 +674,45 @@ class VTPService(models.AbstractModel):
             return []
         return result
 
+    @api.model
+    def fetch_provinces(self, account):
+        """
+        Danh mục Tỉnh/Thành phố (categories/listProvinceById?provinceId=-1: tất cả).
+        
+        Returns:
+            list: [{'PROVINCE_ID', 'PROVINCE_CODE', 'PROVINCE_NAME'}]
+            or {'error': str} if failed
+        """
+        return self._make_api_call(account, 'categories/listProvinceById?provinceId=-1', method='GET') or []
+
+    @api.model
+    def fetch_districts(self, account, province_id=-1):
+        """
+        Danh mục Quận/Huyện của một tỉnh (-1: tất cả).
+        
+        Returns:
+            list: [{'DISTRICT_ID', 'DISTRICT_VALUE', 'DISTRICT_NAME', 'PROVINCE_ID'}]
+            or {'error': str} if failed
+        """
+        return self._make_api_call(account, f'categories/listDistrict?provinceId={province_id}', method='GET') or []
+
+    @api.model
+    def fetch_wards(self, account, district_ids):
+        """
+        Danh mục Phường/Xã cho nhiều quận/huyện, gọi song song.
+        
+        Args:
+            district_ids: list[int] - DISTRICT_ID của VTP
+        
+        Returns:
+            list: kết quả theo đúng thứ tự district_ids, mỗi phần tử là
+                  [{'WARDS_ID', 'WARDS_NAME', 'DISTRICT_ID'}] hoặc {'error': str}
+        """
+        return self._make_api_calls_concurrently([
+            {'account': account, 'endpoint': f'categories/listWards?districtId={district_id}', 'method': 'GET'}
+            for district_id in district_ids
+        ])
+
     @api.model
     def calculate_fee(self, account, data, order_bill=None):
         """
@@ -702,6 +893,7 @@ class VTPService(models.AbstractModel):
         Get bill status from local history (no API call).
         
         This method does not require account as it reads from local DB.
+        Uses the latest-status projection on vtp.order.bill (last_history_id).
         
         Args:
             order_number: str - VTP order number
@@ -709,16 +901,100 @@ class VTPService(models.AbstractModel):
         Returns:
             dict: Status information or False
         """
-        BillHistory = self.env['vtp.order.bill.history']
-        latest_history = BillHistory.search([
+        bill = self.env['vtp.order.bill'].search([
             ('order_number', '=', order_number)
-        ], order='create_date desc', limit=1)
+        ], limit=1)
+        latest_history = bill.last_history_id
+        if not latest_history and not bill:
+            # Vận đơn đã bị xóa/lưu trữ nhưng lịch sử vẫn còn
+            latest_history = self.env['vtp.order.bill.history'].search([
+                ('order_number', '=', order_number)
+            ], order='create_date desc', limit=1)
         
         if latest_history:
             return {
-                'status': latest_history.status,
-                'ORDER_STATUSDATE': latest_history.status_date,
-                'ORDER_STATUS': latest_history.status_code,
+                'status': latest_history.order_status,
+                'ORDER_STATUSDATE': latest_history.order_status_date,
+                'ORDER_STATUS': latest_history.order_status,
                 'STATUS_NAME': latest_history.status_name,
             }
-        return False
\ No newline at end of file
+        return False
+
+    # ============ Status Polling (Webhook Fallback) ============
+
+    @api.model
+    def _get_status_endpoint(self):
+        return self.env['ir.config_parameter'].sudo().get_param(
+            'viettel_ingration_odoo_18.status_endpoint', DEFAULT_STATUS_ENDPOINT
+        )
+
+    @api.model
+    def update_all_bills_status(self, batch_size=POLL_BATCH_SIZE, max_batches=10):
+        """
+        Cron: hỏi trạng thái các vận đơn đến hạn poll (không nhận được webhook).
+
+        Chỉ đọc các vận đơn có vtp_next_poll_date <= now (partial index, bỏ qua
+        vận đơn ở trạng thái cuối), gọi API song song theo ngân sách từng tài khoản
+        và đưa kết quả qua cùng luồng kiểm tra chuyển trạng thái với webhook.
+        Commit sau mỗi batch.
+        """
+        Bill = self.env['vtp.order.bill'].sudo()
+        total = updated = 0
+        for unused in range(max_batches):
+            bills = Bill.search([
+                ('vtp_next_poll_date', '<=', fields.Datetime.now()),
+            ], order='vtp_next_poll_date', limit=batch_size)
+            if not bills:
+                break
+
+            updated += self._poll_bills_status(bills)
+            total += len(bills)
+            self.env.cr.commit()
+            if len(bills) < batch_size:
+                break
+
+        if total:
+            _logger.info(f"VTP Polling: Đã hỏi {total} vận đơn, {updated} vận đơn thay đổi trạng thái")
+        return updated
+
+    @api.model
+    def _poll_bills_status(self, bills):
+        """Hỏi trạng thái một batch vận đơn; trả về số vận đơn được cập nhật"""
+        endpoint = self._get_status_endpoint()
+        current_status = {bill.order_number: bill.vtp_order_status for bill in bills}
+
+        calls = []
+        for bill in bills.filtered('account_id'):
+            calls.append({
+                'account': bill.account_id,
+                'endpoint': endpoint,
+                'method': 'POST',
+                'data': {'ORDER_NUMBER': bill.order_number},
+                'order_bill': bill,
+            })
+        # Audit gộp: một dòng cho mỗi tài khoản mỗi batch (lời gọi lỗi vẫn ghi từng dòng)
+        responses = self._make_api_calls_concurrently(calls, audit='summary')
+
+        # Chỉ đưa các sự kiện có trạng thái mới vào luồng webhook
+        items = []
+        for response in responses:
+            if not response or (isinstance(response, dict) and response.get('error')):
+                continue
+            for data in (response if isinstance(response, list) else [response]):
+                if not isinstance(data, dict):
+                    continue
+                order_number = data.get('ORDER_NUMBER')
+                try:
+                    status = int(data.get('ORDER_STATUS') or 0)
+                except (TypeError, ValueError):
+                    continue
+                if order_number in current_status and status and status != current_status[order_number]:
+                    items.append({'DATA': data})
+
+        # Ghi mốc poll trước để vận đơn lỗi API cũng lùi lịch hỏi lại
+        bills.write({'vtp_last_poll_date': fields.Datetime.now()})
+
+        if not items:
+            return 0
+        results = self.env['vtp.order.bill'].sudo().process_webhook_batch(items, check_token=False)
+        return len([r for r in results if r['status'] == 'updated'])
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Webhook Decoder - Streaming payload decoder
+
+Pure Python helpers (no ORM access) used by the webhook controller and
+vtp.order.bill:
+- Stream-decode a request body item by item (bounded memory for large lists)
+- Unwrap the different payload shapes (direct VTP, n8n-like proxies, bare DATA)
+- Map VTP keys to bill and history values through one precompiled schema
+- Parse VTP dates with a cached fast path
+"""
+
+import json
+from datetime import datetime
+from functools import lru_cache
+
+# Kích thước mỗi lần đọc từ stream
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Giới hạn kích thước một item (tránh buffer tăng vô hạn khi payload lỗi)
+MAX_ITEM_SIZE = 1024 * 1024
+
+_WHITESPACE = ' \t\n\r'
+_DECODER = json.JSONDecoder()
+
+
+class WebhookPayloadError(ValueError):
+    """Payload webhook không phải JSON hợp lệ"""
+
+
+# ============ Streaming decoder ============
+
+def iter_webhook_items(stream, chunk_size=DEFAULT_CHUNK_SIZE, max_item_size=MAX_ITEM_SIZE):
+    """
+    Giải mã body webhook theo kiểu streaming.
+
+    Nếu body là một JSON array, mỗi phần tử được trả về ngay khi đã đọc đủ,
+    bộ nhớ chỉ phụ thuộc vào kích thước một item chứ không phụ thuộc số item.
+    Nếu body là một object đơn lẻ, trả về đúng một item.
+
+    Args:
+        stream: file-like object có read(size) trả về bytes hoặc str
+        chunk_size: int - Số byte đọc mỗi lần
+        max_item_size: int - Kích thước tối đa của một item
+
+    Yields:
+        object: Từng item đã giải mã
+
+    Raises:
+        WebhookPayloadError: Nếu body không phải JSON hợp lệ
+    """
+    reader = _ChunkReader(stream, chunk_size)
+    buf = reader.skip_whitespace('')
+    if not buf:
+        return
+
+    if buf[0] != '[':
+        # Object đơn lẻ - đọc hết body (body không phải list nên nhỏ)
+        while not reader.eof:
+            buf += reader.read()
+            if len(buf) > max_item_size:
+                raise WebhookPayloadError('Payload quá lớn')
+        try:
+            item, end = _DECODER.raw_decode(buf)
+        except json.JSONDecodeError as e:
+            raise WebhookPayloadError(str(e)) from e
+        if buf[end:].strip(_WHITESPACE):
+            raise WebhookPayloadError('Dữ liệu thừa sau JSON')
+        yield item
+        return
+
+    buf = reader.skip_whitespace(buf[1:])
+    if buf[:1] == ']':
+        return
+
+    while True:
+        item, buf = _decode_next(reader, buf, max_item_size)
+        yield item
+
+        buf = reader.skip_whitespace(buf)
+        if buf[:1] == ',':
+            buf = reader.skip_whitespace(buf[1:])
+            continue
+        if buf[:1] == ']':
+            if reader.skip_whitespace(buf[1:]):
+                raise WebhookPayloadError('Dữ liệu thừa sau JSON')
+            return
+        raise WebhookPayloadError('Thiếu dấu phân cách giữa các item')
+
+
+def _decode_next(reader, buf, max_item_size):
+    """Giải mã item tiếp theo, đọc thêm dữ liệu khi item chưa đầy đủ"""
+    while True:
+        try:
+            item, end = _DECODER.raw_decode(buf)
+            # Số ở cuối buffer có thể chưa đọc hết chữ số
+            if end == len(buf) and not reader.eof and not isinstance(item, (dict, list, str)):
+                raise json.JSONDecodeError('Số chưa đầy đủ', buf, end)
+            return item, buf[end:]
+        except json.JSONDecodeError as e:
+            if reader.eof:
+                raise WebhookPayloadError(str(e)) from e
+            if len(buf) > max_item_size:
+                raise WebhookPayloadError('Item quá lớn') from e
+            buf += reader.read()
+
+
+class _ChunkReader:
+    """Đọc stream theo từng chunk và giải mã UTF-8 tăng dần"""
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.eof = False
+        self._pending = b''
+
+    def read(self):
+        if self.eof:
+            return ''
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            if self._pending:
+                raise WebhookPayloadError('UTF-8 không hợp lệ')
+            return ''
+        if isinstance(chunk, str):
+            return chunk
+        data = self._pending + chunk
+        try:
+            text = data.decode('utf-8')
+            self._pending = b''
+        except UnicodeDecodeError as e:
+            # Ký tự nhiều byte bị cắt ở cuối chunk
+            if e.start < len(data) - 3:
+                raise WebhookPayloadError('UTF-8 không hợp lệ') from e
+            text = data[:e.start].decode('utf-8')
+            self._pending = data[e.start:]
+        return text
+
+    def skip_whitespace(self, buf):
+        buf = buf.lstrip(_WHITESPACE)
+        while not buf and not self.eof:
+            buf = self.read().lstrip(_WHITESPACE)
+        return buf
+
+
+def unwrap_webhook_item(item):
+    """
+    Tách DATA và TOKEN từ một item webhook.
+
+    Hỗ trợ các dạng:
+    - {"body": {"DATA": {...}, "TOKEN": "..."}}  (proxy kiểu n8n)
+    - {"DATA": {...}, "TOKEN": "..."}            (chuẩn VTP)
+    - {...}                                      (bản thân item là DATA)
+
+    Returns:
+        tuple: (data_dict or False, token or False)
+    """
+    if not isinstance(item, dict):
+        return False, False
+    body = item.get('body')
+    if isinstance(body, dict):
+        return body.get('DATA') or False, body.get('TOKEN') or False
+    if 'DATA' in item:
+        return item.get('DATA') or False, item.get('TOKEN') or False
+    return item, False
+
+
+# ============ Date parsing ============
+
+@lru_cache(maxsize=4096)
+def parse_vtp_date(date_str):
+    """
+    Chuyển ngày VTP ('dd/mm/YYYY HH:MM:SS' hoặc 'YYYY-mm-dd HH:MM:SS')
+    sang định dạng Odoo 'YYYY-mm-dd HH:MM:SS'.
+
+    Webhook của cùng một đợt thường lặp lại cùng một mốc thời gian nên kết quả
+    được cache; định dạng chuẩn của VTP được xử lý bằng cắt chuỗi thay vì strptime.
+
+    Returns:
+        str or False
+    """
+    if not date_str or not isinstance(date_str, str):
+        return False
+    s = date_str.strip()
+    if len(s) == 19 and s[2] == '/' and s[5] == '/' and s[13] == ':' and s[16] == ':':
+        try:
+            day, month, year = int(s[0:2]), int(s[3:5]), int(s[6:10])
+            hour, minute, second = int(s[11:13]), int(s[14:16]), int(s[17:19])
+            return datetime(year, month, day, hour, minute, second).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return False
+    for fmt in ('%d/%m/%Y %H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(s, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    return False
+
+
+# ============ Field mapping schema ============
+
+def _to_int(value):
+    if value in (None, '', False):
+        return 0
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _to_float(value):
+    if value in (None, '', False):
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_bool(value):
+    return bool(value)
+
+
+def _identity(value):
+    return value if value is not None else False
+
+
+# (VTP key, field vtp.order.bill, field vtp.order.bill.history, converter)
+WEBHOOK_FIELD_SCHEMA = [
+    ('ORDER_NUMBER', 'order_number', 'order_number', _identity),
+    ('ORDER_REFERENCE', None, 'order_reference', _identity),
+    ('ORDER_STATUSDATE', 'vtp_bill_updated_date', 'order_status_date', parse_vtp_date),
+    ('ORDER_STATUS', 'vtp_order_status', 'order_status', _to_int),
+    ('STATUS_NAME', 'status_name', 'status_name', _identity),
+    ('LOCATION_CURRENTLY', None, 'location_currently', _identity),
+    ('NOTE', None, 'note', _identity),
+    ('MONEY_COLLECTION', 'vtp_money_collection', 'money_collection', _to_float),
+    ('MONEY_FEECOD', None, 'money_feecod', _to_float),
+    ('MONEY_TOTALFEE', 'vtp_money_totalfee', 'money_totalfee', _to_float),
+    ('MONEY_TOTALVAT', None, 'money_totalvat', _to_float),
+    ('MONEY_TOTAL', 'vtp_money_total', 'money_total', _to_float),
+    ('PRODUCT_WEIGHT', 'vtp_product_weight', 'product_weight', _to_float),
+    ('ORDER_SERVICE', None, 'order_service', _identity),
+    ('ORDER_PAYMENT', None, 'order_payment', _to_int),
+    ('EXPECTED_DELIVERY_DATE', 'expected_delivery_date', 'expected_delivery_date', parse_vtp_date),
+    ('IS_RETURNING', None, 'is_returning', _to_bool),
+    ('RECEIVER_FULLNAME', 'vtp_receiver_fullname', 'receiver_fullname', _identity),
+]
+
+# Schema đã biên dịch: tách sẵn danh sách cho bill và history
+_BILL_MAPPING = tuple(
+    (key, bill_field, convert) for key, bill_field, unused, convert in WEBHOOK_FIELD_SCHEMA if bill_field
+)
+_HISTORY_MAPPING = tuple(
+    (key, history_field, convert) for key, unused, history_field, convert in WEBHOOK_FIELD_SCHEMA if history_field
+)
+
+
+def map_webhook_data(data):
+    """
+    Ánh xạ DATA của webhook sang giá trị vtp.order.bill và vtp.order.bill.history.
+
+    Mỗi khóa VTP chỉ được chuyển đổi một lần và dùng chung cho cả hai bảng.
+
+    Returns:
+        tuple: (bill_vals, history_vals)
+    """
+    converted = {}
+    get = data.get
+    for key, unused_bill, unused_history, convert in WEBHOOK_FIELD_SCHEMA:
+        converted[key] = convert(get(key))
+    bill_vals = {field: converted[key] for key, field, unused in _BILL_MAPPING}
+    history_vals = {field: converted[key] for key, field, unused in _HISTORY_MAPPING}
+    return bill_vals, history_vals
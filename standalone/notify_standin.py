@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Notify Stand-in - HTTP server giả lập subscriber để thử outbound notifications
+
+Nhận POST batch từ vtp.notify.outbox, kiểm tra chữ ký HMAC (X-VTP-Signature)
+và in từng sự kiện. Có thể giả lập lỗi / độ trễ để thử retry và backoff.
+
+Chạy:
+    python standalone/notify_standin.py --port 8071 --secret <secret của subscriber>
+    python standalone/notify_standin.py --fail-rate 0.3 --delay 0.5
+
+Sau đó tạo subscriber với URL http://localhost:8071/ và cùng secret.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_logger = logging.getLogger('vtp.notify.standin')
+
+SIGNATURE_HEADER = 'X-VTP-Signature'
+TIMESTAMP_HEADER = 'X-VTP-Timestamp'
+
+
+def verify_signature(secret, timestamp, body, signature):
+    """Cùng thuật toán với models/vtp_notify.sign_payload"""
+    message = f"{timestamp}.".encode('utf-8') + body
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    # Được gán bởi make_handler
+    secret = None
+    fail_rate = 0.0
+    delay = 0.0
+    seen = None
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        if self.secret and not verify_signature(
+            self.secret, self.headers.get(TIMESTAMP_HEADER, ''), body, self.headers.get(SIGNATURE_HEADER)
+        ):
+            _logger.warning("Chữ ký không hợp lệ")
+            return self._respond(401, {'error': 'invalid signature'})
+
+        if self.fail_rate and random.random() < self.fail_rate:
+            _logger.info("Giả lập lỗi 503")
+            return self._respond(503, {'error': 'simulated failure'})
+
+        try:
+            events = json.loads(body).get('events', [])
+        except ValueError:
+            return self._respond(400, {'error': 'invalid json'})
+
+        for event in events:
+            order_number = event.get('order_number')
+            last_id = self.seen.get(order_number)
+            if last_id is not None and event.get('id', 0) and event['id'] < last_id:
+                _logger.warning(f"Sai thứ tự: {order_number} id={event['id']} < {last_id}")
+            self.seen[order_number] = event.get('id', 0)
+            _logger.info(f"#{event.get('id')} {order_number}: {event.get('order_status')} {event.get('status_name')}")
+        return self._respond(200, {'received': len(events)})
+
+    def _respond(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        _logger.debug(format, *args)
+
+
+def make_handler(secret=None, fail_rate=0.0, delay=0.0):
+    return type('ConfiguredStandinHandler', (StandinHandler,), {
+        'secret': secret,
+        'fail_rate': fail_rate,
+        'delay': delay,
+        'seen': {},
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Subscriber giả lập cho VTP outbound notifications')
+    parser.add_argument('--port', type=int, default=8071)
+    parser.add_argument('--secret', help='Secret HMAC của subscriber (bỏ trống: không kiểm tra chữ ký)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Tỉ lệ trả về 503 (0..1)')
+    parser.add_argument('--delay', type=float, default=0.0, help='Độ trễ mỗi request (giây)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    server = ThreadingHTTPServer(('', args.port), make_handler(args.secret, args.fail_rate, args.delay))
+    _logger.info(f"VTP Notify stand-in listening on :{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Webhook Receiver - Standalone WSGI app
+
+Receiver tối giản cho callback ViettelPost, chạy độc lập với Odoo (không
+registry, session hay ORM):
+- Kiểm tra TOKEN với bảng vtp_account (cache trong bộ nhớ, làm mới theo TTL)
+- Ghi các item vào vtp_webhook_inbox bằng một câu INSERT
+- Odoo cron (vtp.webhook.inbox._cron_process_inbox) xử lý sau
+
+Cấu hình qua biến môi trường:
+    VTP_RECEIVER_DSN        DSN PostgreSQL (vd: "dbname=odoo user=odoo host=db")
+    VTP_RECEIVER_TOKEN_TTL  Thời gian cache token (giây, mặc định 60)
+    VTP_RECEIVER_MAX_BODY   Kích thước body tối đa (byte, mặc định 10MB)
+    VTP_RECEIVER_POOL_SIZE  Số kết nối tối đa trong pool (mặc định 4)
+
+Chạy:
+    gunicorn -w 4 -b 0.0.0.0:8070 --chdir standalone webhook_receiver:application
+    python standalone/webhook_receiver.py   # server phát triển (wsgiref)
+"""
+
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+_logger = logging.getLogger('vtp.webhook.receiver')
+
+
+def _load_decoder():
+    """Nạp services/webhook_decoder.py trực tiếp (không import package Odoo)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'services', 'webhook_decoder.py')
+    spec = importlib.util.spec_from_file_location('vtp_webhook_decoder', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+decoder = _load_decoder()
+
+WEBHOOK_PATH = '/vtp/webhook/order_status'
+HEALTH_PATH = '/health'
+
+INSERT_SQL = """
+    INSERT INTO vtp_webhook_inbox
+        (account_id, order_number, payload, received_at, state, create_date, write_date)
+    VALUES %s
+"""
+INSERT_TEMPLATE = "(%s, %s, %s, now() at time zone 'UTC', 'pending', now() at time zone 'UTC', now() at time zone 'UTC')"
+
+
+class _LimitedReader:
+    """Chỉ đọc đúng CONTENT_LENGTH byte từ wsgi.input"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size):
+        if self.remaining <= 0:
+            return b''
+        chunk = self.stream.read(min(size, self.remaining))
+        self.remaining -= len(chunk)
+        return chunk
+
+
+class WebhookReceiver:
+    """WSGI app nhận webhook VTP và ghi vào inbox"""
+
+    def __init__(self, dsn, token_ttl=60, max_body=10 * 1024 * 1024, pool_size=4):
+        self.dsn = dsn
+        self.token_ttl = token_ttl
+        self.max_body = max_body
+        self.pool_size = pool_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._tokens = {}
+        self._tokens_loaded_at = 0.0
+        self._tokens_lock = threading.Lock()
+
+    # ============ Database ============
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(1, self.pool_size, self.dsn)
+        return self._pool
+
+    def _execute(self, callback):
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cr:
+                    return callback(cr)
+        except psycopg2.OperationalError:
+            pool.putconn(conn, close=True)
+            conn = None
+            raise
+        finally:
+            if conn is not None:
+                pool.putconn(conn)
+
+    def _account_tokens(self):
+        """Bảng token -> account_id, cache theo TTL"""
+        now = time.monotonic()
+        if now - self._tokens_loaded_at < self.token_ttl:
+            return self._tokens
+        with self._tokens_lock:
+            if now - self._tokens_loaded_at >= self.token_ttl:
+                def load(cr):
+                    cr.execute("""
+                        SELECT webhook_token, id FROM vtp_account
+                        WHERE active AND webhook_token IS NOT NULL AND webhook_token != ''
+                    """)
+                    return dict(cr.fetchall())
+                self._tokens = self._execute(load)
+                self._tokens_loaded_at = time.monotonic()
+        return self._tokens
+
+    # ============ WSGI ============
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        method = environ.get('REQUEST_METHOD', 'GET')
+
+        if path == HEALTH_PATH:
+            return self._respond(start_response, 200, {'status': 'ok'})
+        if path != WEBHOOK_PATH:
+            return self._respond(start_response, 404, {'error': 'Not found'})
+        if method != 'POST':
+            return self._respond(start_response, 405, {'error': 'Method not allowed'})
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length <= 0:
+            return self._respond(start_response, 400, {'error': 'Không nhận được dữ liệu'})
+        if length > self.max_body:
+            return self._respond(start_response, 413, {'error': 'Payload quá lớn'})
+
+        try:
+            return self._handle_webhook(environ, start_response, _LimitedReader(environ['wsgi.input'], length))
+        except decoder.WebhookPayloadError as e:
+            _logger.warning(f"VTP Receiver: JSON không hợp lệ: {e}")
+            return self._respond(start_response, 400, {'error': 'JSON không hợp lệ'})
+        except psycopg2.Error as e:
+            _logger.error(f"VTP Receiver: Lỗi database: {e}")
+            return self._respond(start_response, 503, {'error': 'Database unavailable'})
+
+    def _handle_webhook(self, environ, start_response, stream):
+        tokens = self._account_tokens()
+        rows = []
+        rejected = []
+        for index, item in enumerate(decoder.iter_webhook_items(stream)):
+            data_dict, token = decoder.unwrap_webhook_item(item)
+            if not (isinstance(data_dict, dict) and data_dict.get('ORDER_NUMBER')):
+                rejected.append({'index': index, 'status': 'invalid'})
+                continue
+            account_id = None
+            if token:
+                account_id = tokens.get(token)
+                if account_id is None:
+                    rejected.append({
+                        'index': index,
+                        'order_number': data_dict.get('ORDER_NUMBER'),
+                        'status': 'unauthorized',
+                    })
+                    continue
+            # Chỉ lưu DATA - TOKEN không được ghi xuống inbox; tài khoản khớp token được lưu
+            # ở account_id để cron đối chiếu với tài khoản sở hữu vận đơn
+            rows.append((account_id, str(data_dict['ORDER_NUMBER']),
+                         json.dumps({'DATA': data_dict}, ensure_ascii=False)))
+
+        if rows:
+            self._execute(lambda cr: execute_values(cr, INSERT_SQL, rows, template=INSERT_TEMPLATE, page_size=len(rows)))
+
+        unauthorized = [r for r in rejected if r['status'] == 'unauthorized']
+        if not rows and unauthorized:
+            status = 401
+        elif not rows and rejected:
+            status = 400
+        elif unauthorized:
+            status = 207
+        else:
+            status = 202
+        return self._respond(start_response, status, {
+            'accepted': len(rows),
+            'failed_count': len(unauthorized),
+            'failed': unauthorized,
+            'rejected': rejected,
+        })
+
+    @staticmethod
+    def _respond(start_response, status, body):
+        reasons = {
+            200: 'OK', 202: 'Accepted', 207: 'Multi-Status', 400: 'Bad Request', 401: 'Unauthorized',
+            404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable',
+        }
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        start_response(f'{status} {reasons.get(status, "")}', [
+            ('Content-Type', 'application/json; charset=utf-8'),
+            ('Content-Length', str(len(payload))),
+        ])
+        return [payload]
+
+
+def create_app():
+    return WebhookReceiver(
+        dsn=os.environ.get('VTP_RECEIVER_DSN', ''),
+        token_ttl=int(os.environ.get('VTP_RECEIVER_TOKEN_TTL', 60)),
+        max_body=int(os.environ.get('VTP_RECEIVER_MAX_BODY', 10 * 1024 * 1024)),
+        pool_size=int(os.environ.get('VTP_RECEIVER_POOL_SIZE', 4)),
+    )
+
+
+application = create_app()
+
+
+if __name__ == '__main__':
+    from wsgiref.simple_server import make_server
+
+    logging.basicConfig(level=logging.INFO)
+    port = int(os.environ.get('VTP_RECEIVER_PORT', 8070))
+    _logger.info(f"VTP Receiver listening on :{port}")
+    make_server('', port, application).serve_forever()
@@ -0,0 +1,82 @@
+/** @odoo-module **/
+
+import { Component, onWillStart, onWillUnmount, useState } from "@odoo/owl";
+import { registry } from "@web/core/registry";
+import { useService } from "@web/core/utils/hooks";
+
+const NOTIFICATION = "vtp_board/update";
+
+/**
+ * Board vận đơn trực tiếp: tải một lần, sau đó áp các delta nhận qua bus
+ * (mỗi tài khoản tối đa một thông báo mỗi khoảng board_min_interval_seconds)
+ * thay vì search/read lại; vận đơn trong 'removed' bị bỏ khỏi board.
+ */
+export class VtpShipmentBoard extends Component {
+    static template = "viettel_ingration_odoo_18.VtpShipmentBoard";
+    static props = ["*"];
+
+    setup() {
+        this.orm = useService("orm");
+        this.action = useService("action");
+        this.busService = useService("bus_service");
+        this.state = useState({ bills: [], lastUpdate: null, limit: 200 });
+        this.channels = [];
+        this.onNotification = this.onNotification.bind(this);
+
+        onWillStart(async () => {
+            await this.load();
+            this.busService.subscribe(NOTIFICATION, this.onNotification);
+        });
+        onWillUnmount(() => {
+            this.busService.unsubscribe(NOTIFICATION, this.onNotification);
+            for (const channel of this.channels) {
+                this.busService.deleteChannel(channel);
+            }
+        });
+    }
+
+    async load() {
+        const data = await this.orm.call("vtp.order.bill", "get_board_data", []);
+        this.state.bills = data.bills;
+        this.state.limit = data.limit;
+        for (const channel of data.channels) {
+            if (!this.channels.includes(channel)) {
+                this.busService.addChannel(channel);
+                this.channels.push(channel);
+            }
+        }
+    }
+
+    async onNotification(payload) {
+        if (payload.reload) {
+            await this.load();
+            return;
+        }
+        const byId = new Map(this.state.bills.map((bill) => [bill.id, bill]));
+        for (const billId of payload.removed || []) {
+            byId.delete(billId);
+        }
+        for (const bill of payload.bills || []) {
+            if (byId.has(bill.id)) {
+                Object.assign(byId.get(bill.id), bill);
+            } else {
+                byId.set(bill.id, bill);
+            }
+        }
+        this.state.bills = [...byId.values()]
+            .sort((a, b) => (b.vtp_bill_updated_date || "").localeCompare(a.vtp_bill_updated_date || ""))
+            .slice(0, this.state.limit);
+        this.state.lastUpdate = new Date().toLocaleTimeString();
+    }
+
+    openBill(bill) {
+        this.action.doAction({
+            type: "ir.actions.act_window",
+            res_model: "vtp.order.bill",
+            res_id: bill.id,
+            views: [[false, "form"]],
+        });
+    }
+}
+
+registry.category("actions").add("vtp_shipment_board", VtpShipmentBoard);
@@ -1,5 +1,9 @@
 from . import vtp_shipping_wizard_mixin
 from . import vtp_create_bill_wizard
+from . import vtp_mass_create_bill_wizard
+from . import vtp_batch_quote_wizard
 from . import vtp_update_bill_status_wizard
 from . import vtp_update_bill_wizard
 from . import vtp_print_bill_wizard
+from . import vtp_cod_import_wizard
+from . import vtp_consistency_sweep_wizard
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Batch Quote Wizard - Tra cước ViettelPost cho nhiều đơn bán cùng lúc
+
+- Tổng giá trị / khối lượng của mọi đơn tính bằng một truy vấn GROUP BY
+- Các đơn có cùng tuyến + khối lượng + giá trị chỉ tra cước một lần
+- Các lời gọi order/getPrice duy nhất chạy song song (_make_api_calls_concurrently)
+- vtp.pricing tạo bằng một lần create nhiều bản ghi; vtp_store_id ghi theo nhóm store
+"""
+
+import logging
+from collections import defaultdict
+
+from markupsafe import Markup
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+PRICE_ENDPOINT = 'order/getPrice'
+
+
+class VTPBatchQuoteWizard(models.TransientModel):
+    _name = 'vtp.batch.quote.wizard'
+    _description = 'Tra cước ViettelPost hàng loạt'
+
+    sale_order_ids = fields.Many2many('sale.order', string='Đơn bán', required=True)
+    store_id = fields.Many2one('vtp.store', string='Store ViettelPost',
+                               help='Để trống: dùng store của đơn, bảng định tuyến hoặc store mặc định')
+    service_type = fields.Many2one('vtp.service.bill', string='Dịch vụ', required=True,
+                                   default=lambda self: self.env['vtp.service.bill'].search(
+                                       [('service_code', '=', 'VSL6')], limit=1))
+    product_length = fields.Float(string='Chiều dài (cm)')
+    product_width = fields.Float(string='Chiều rộng (cm)')
+    product_height = fields.Float(string='Chiều cao (cm)')
+
+    order_count = fields.Integer(string='Số đơn', compute='_compute_order_count')
+    quoted_count = fields.Integer(string='Đã tra cước', readonly=True)
+    call_count = fields.Integer(string='Số lần gọi API', readonly=True)
+    error_count = fields.Integer(string='Lỗi', readonly=True)
+    report_html = fields.Html(string='Báo cáo', readonly=True, sanitize=False)
+
+    @api.depends('sale_order_ids')
+    def _compute_order_count(self):
+        for wizard in self:
+            wizard.order_count = len(wizard.sale_order_ids)
+
+    @api.model
+    def default_get(self, fields_list):
+        res = super().default_get(fields_list)
+        if self._context.get('active_model') == 'sale.order' and self._context.get('active_ids'):
+            res['sale_order_ids'] = [(6, 0, self._context['active_ids'])]
+        return res
+
+    # ============ Payload ============
+
+    def _read_order_totals(self, orders):
+        """{order_id: (tổng giá trị, tổng khối lượng gram)} - một truy vấn GROUP BY"""
+        self.env['sale.order.line'].flush_model(['order_id', 'product_id', 'product_uom_qty', 'price_unit'])
+        self.env['product.product'].flush_model(['weight'])
+        self.env.cr.execute("""
+            SELECT l.order_id,
+                   SUM(l.price_unit * l.product_uom_qty),
+                   SUM(COALESCE(p.weight, 0) * l.product_uom_qty) * 1000
+              FROM sale_order_line l
+              LEFT JOIN product_product p ON p.id = l.product_id
+             WHERE l.order_id = ANY(%s)
+          GROUP BY l.order_id
+        """, (orders.ids,))
+        return {order_id: (price or 0.0, weight or 0.0) for order_id, price, weight in self.env.cr.fetchall()}
+
+    def _prepare_quotes(self, orders, report):
+        """
+        Payload getPrice cho từng đơn hợp lệ.
+
+        Returns:
+            list of dict: {'order', 'store', 'province', 'district', 'data'}
+        """
+        orders.fetch(['name', 'partner_id', 'vtp_store_id'])
+        orders.partner_id.fetch(['street', 'street2', 'city', 'state_id',
+                                 'vtp_province_id', 'vtp_district_id', 'vtp_ward_id'])
+        totals = self._read_order_totals(orders)
+        Gazetteer = self.env['vtp.gazetteer']
+        Route = self.env['vtp.store.route']
+        Province, District = self.env['vtp.province'], self.env['vtp.district']
+        default_store = self.env['vtp.store'].search([('is_default', '=', True), ('active', '=', True)], limit=1)
+        service_code = self.service_type.service_code or 'VSL6'
+
+        quotes = []
+        for order in orders:
+            location = Gazetteer.resolve_partner(order.partner_id) if order.partner_id else {}
+            province = Province.browse(location.get('province_id') or [])
+            district = District.browse(location.get('district_id') or [])
+            if not province or not district:
+                report[order.id] = ('error', _('Không xác định được tỉnh / quận người nhận'))
+                continue
+            store = (self.store_id or order.vtp_store_id
+                     or Route._get_ranked_stores(province, district).filtered('active')[:1] or default_store)
+            if not store or not store.account_id:
+                report[order.id] = ('error', _('Không có store ViettelPost phù hợp'))
+                continue
+            price, weight = totals.get(order.id, (0.0, 0.0))
+            data = {
+                "PRODUCT_WEIGHT": int(weight),
+                "PRODUCT_PRICE": int(price),
+                "MONEY_COLLECTION": int(price),
+                "ORDER_SERVICE_ADD": "",
+                "ORDER_SERVICE": service_code,
+                "SENDER_PROVINCE": store.provinceId.provinceId if store.provinceId else '',
+                "SENDER_DISTRICT": store.districtId.districtId if store.districtId else '',
+                "RECEIVER_PROVINCE": province.provinceId,
+                "RECEIVER_DISTRICT": district.districtId,
+                "PRODUCT_TYPE": "HH",
+                "NATIONAL_TYPE": 1,
+            }
+            if self.product_length and self.product_width and self.product_height:
+                data.update({
+                    'PRODUCT_LENGTH': self.product_length,
+                    'PRODUCT_WIDTH': self.product_width,
+                    'PRODUCT_HEIGHT': self.product_height,
+                })
+            quotes.append({'order': order, 'store': store, 'province': province,
+                           'district': district, 'data': data})
+        return quotes
+
+    # ============ Execution ============
+
+    def action_quote(self):
+        self.ensure_one()
+        orders = self.sale_order_ids
+        if not orders:
+            raise UserError(_('Vui lòng chọn đơn bán!'))
+
+        report = {}
+        quotes = self._prepare_quotes(orders, report)
+
+        # Gộp các đơn cùng tài khoản + payload (tuyến, khối lượng, giá trị, dịch vụ)
+        groups = defaultdict(list)
+        for quote in quotes:
+            key = (quote['store'].account_id.id, tuple(sorted(quote['data'].items())))
+            groups[key].append(quote)
+        unique = list(groups.values())
+        results = self.env['vtp.service']._make_api_calls_concurrently([{
+            'account': members[0]['store'].account_id,
+            'endpoint': PRICE_ENDPOINT,
+            'method': 'POST',
+            'data': members[0]['data'],
+        } for members in unique])
+
+        pricing_vals = []
+        stores = defaultdict(list)
+        for members, result in zip(unique, results):
+            if isinstance(result, list):
+                result = result[0] if result else None
+            if not result or (isinstance(result, dict) and result.get('error')):
+                error = result.get('error') if isinstance(result, dict) else _('Unknown error')
+                if 'Price does not apply to this itinerary' in str(error):
+                    error = _('Giá không áp dụng cho tuyến này!')
+                for quote in members:
+                    report[quote['order'].id] = ('error', error)
+                continue
+            for quote in members:
+                order = quote['order']
+                pricing_vals.append({
+                    'name': order.name or _('Tra cước'),
+                    'store_id': quote['store'].id,
+                    'service_code': self.service_type.id,
+                    'sale_order_id': order.id,
+                    'receiver_province_id': quote['province'].id,
+                    'receiver_district_id': quote['district'].id,
+                    'money_total_old': result.get('MONEY_TOTAL', 0.0),
+                    'money_total': result.get('MONEY_TOTAL', 0.0),
+                    'money_total_fee': result.get('MONEY_TOTAL_FEE', 0.0),
+                    'money_fee': result.get('MONEY_FEE', 0.0),
+                    'money_collection_fee': result.get('MONEY_COLLECTION_FEE', 0.0),
+                    'money_other_fee': result.get('MONEY_OTHER_FEE', 0.0),
+                    'money_vas': result.get('MONEY_VAS', 0.0),
+                    'money_vat': result.get('MONEY_VAT', 0.0),
+                    'kpi_ht': result.get('KPI_HT', 0),
+                    'vtp_response': str(result),
+                })
+                report[order.id] = ('done', result.get('MONEY_TOTAL', 0))
+                if order.vtp_store_id != quote['store']:
+                    stores[quote['store'].id].append(order.id)
+
+        self.env['vtp.pricing'].create(pricing_vals)
+        # Lưu store cho lần sau - một lần ghi cho mỗi store
+        for store_id, order_ids in stores.items():
+            self.env['sale.order'].browse(order_ids).write({'vtp_store_id': store_id})
+
+        _logger.info(f"VTP Batch Quote: {len(orders)} đơn, {len(unique)} lời gọi getPrice, "
+                     f"{len(pricing_vals)} kết quả")
+        self.write({
+            'quoted_count': len(pricing_vals),
+            'call_count': len(unique),
+            'error_count': len(orders) - len(pricing_vals),
+            'report_html': self._render_report(orders, report),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _render_report(self, orders, report):
+        """Bảng kết quả theo đơn: lỗi trước"""
+        rows = []
+        for order in orders.sorted(lambda o: (report.get(o.id, ('error',))[0] != 'error', o.name or '')):
+            status, value = report.get(order.id, ('error', _('Không xử lý')))
+            rows.append(Markup('<tr class="%s"><td>%s</td><td>%s</td><td class="text-end">%s</td></tr>') % (
+                'text-danger' if status == 'error' else '', order.name,
+                _('Thành công') if status == 'done' else _('Lỗi'), value,
+            ))
+        return Markup(
+            '<table class="table table-sm"><thead><tr><th>%s</th><th>%s</th><th class="text-end">%s</th></tr>'
+            '</thead><tbody>%s</tbody></table>'
+        ) % (_('Đơn bán'), _('Kết quả'), _('Tổng cước / Chi tiết'), Markup('').join(rows))
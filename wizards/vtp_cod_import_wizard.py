@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+VTP COD Import Wizard - Import bảng kê chuyển tiền COD của ViettelPost (CSV/XLSX)
+
+File được đọc theo luồng (csv.reader / openpyxl read_only) và ghi xuống
+vtp.cod.reconcile.line theo chunk, không dựng danh sách toàn bộ dòng trong bộ nhớ.
+"""
+
+import base64
+import csv
+import io
+import logging
+import re
+import unicodedata
+
+from odoo import _, fields, models
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Tên cột chấp nhận (đã chuẩn hóa: chữ thường, bỏ dấu, bỏ ký tự đặc biệt)
+ORDER_NUMBER_COLUMNS = {'ordernumber', 'mavandon', 'sovandon', 'mabuugui', 'sohieubuugui'}
+AMOUNT_COLUMNS = {'moneycollection', 'cod', 'tienthuho', 'sotienthuho', 'tiencod', 'sotien', 'amount'}
+
+
+def _normalize_header(value):
+    text = unicodedata.normalize('NFKD', str(value or '')).replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+
+def _parse_amount(value):
+    """Số tiền VTP: 150000 / 150.000 / 150,000 / 150000.0 / 150,5 / 1.500,50"""
+    if value is None or value == '':
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = re.sub(r'[^0-9,.\-]', '', str(value))
+    if ',' in text and '.' in text:
+        # Dấu xuất hiện sau cùng là dấu thập phân
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    else:
+        separator = ',' if ',' in text else '.'
+        # Nhiều dấu, hoặc một dấu theo sau đúng 3 chữ số: phân cách hàng nghìn
+        if text.count(separator) > 1 or re.fullmatch(rf'-?\d{{1,3}}(\{separator}\d{{3}})+', text):
+            text = text.replace(separator, '')
+        else:
+            text = text.replace(',', '.')
+    try:
+        return float(text)
+    except ValueError:
+        return 0.0
+
+
+def _cell_text(value):
+    """Giá trị ô thành chuỗi; số nguyên đọc từ Excel (123.0) không kèm phần thập phân"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value if value is not None else '').strip()
+
+
+class VTPCodImportWizard(models.TransientModel):
+    _name = 'vtp.cod.import.wizard'
+    _description = 'Import bảng kê COD ViettelPost'
+
+    file = fields.Binary(string='File bảng kê', required=True)
+    filename = fields.Char(string='Tên file')
+    account_id = fields.Many2one('vtp.account', string='Tài khoản VTP')
+    tolerance = fields.Float(string='Sai số cho phép', default=0.0)
+
+    def action_import(self):
+        self.ensure_one()
+        if not self.file:
+            raise UserError(_('Vui lòng chọn file bảng kê.'))
+
+        content = base64.b64decode(self.file)
+        batch = self.env['vtp.cod.reconcile'].create({
+            'name': _('Đối soát COD %s') % (self.filename or fields.Date.today()),
+            'account_id': self.account_id.id,
+            'filename': self.filename,
+            'tolerance': self.tolerance,
+        })
+        count = batch._insert_lines(self._iter_statement_rows(content))
+        if not count:
+            raise UserError(_('File bảng kê không có dòng dữ liệu hợp lệ.'))
+        batch.action_reconcile()
+        _logger.info(f"VTP COD: Đã import {count} dòng từ {self.filename}")
+
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Đối soát COD'),
+            'res_model': 'vtp.cod.reconcile',
+            'res_id': batch.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    # ============ Parsing ============
+
+    def _iter_statement_rows(self, content):
+        """Yield (row_number, order_number, amount) từ CSV hoặc XLSX"""
+        filename = (self.filename or '').lower()
+        if filename.endswith(('.xlsx', '.xlsm')) or content[:2] == b'PK':
+            rows = self._iter_xlsx(content)
+        else:
+            rows = self._iter_csv(content)
+
+        order_idx = amount_idx = None
+        for row_number, row in rows:
+            if order_idx is None:
+                headers = [_normalize_header(cell) for cell in row]
+                order_idx = next((i for i, h in enumerate(headers) if h in ORDER_NUMBER_COLUMNS), None)
+                amount_idx = next((i for i, h in enumerate(headers) if h in AMOUNT_COLUMNS), None)
+                if order_idx is None or amount_idx is None:
+                    # Bỏ qua các dòng tiêu đề phụ phía trên bảng dữ liệu
+                    order_idx = amount_idx = None
+                    if row_number > 20:
+                        raise UserError(_(
+                            'Không tìm thấy cột mã vận đơn và cột tiền thu hộ trong file bảng kê.'
+                        ))
+                continue
+            if len(row) <= max(order_idx, amount_idx):
+                continue
+            order_number = _cell_text(row[order_idx])
+            if not order_number:
+                continue
+            yield row_number, order_number, _parse_amount(row[amount_idx])
+
+    @staticmethod
+    def _iter_csv(content):
+        text = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8-sig', errors='replace', newline='')
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        for row_number, row in enumerate(csv.reader(text, dialect), start=1):
+            yield row_number, row
+
+    @staticmethod
+    def _iter_xlsx(content):
+        if openpyxl is None:
+            raise UserError(_('Cần cài thư viện openpyxl để import file Excel. Vui lòng dùng file CSV.'))
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                yield row_number, list(row)
+        finally:
+            workbook.close()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Consistency Sweep Wizard - Chạy sweeper nhất quán thủ công (dry run hoặc sửa)
+"""
+
+from markupsafe import Markup, escape
+
+from odoo import _, fields, models
+
+from ..models.vtp_consistency_sweeper import SWEEP_CHUNK_SIZE
+
+
+class VTPConsistencySweepWizard(models.TransientModel):
+    _name = 'vtp.consistency.sweep.wizard'
+    _description = 'Kiểm tra nhất quán vận đơn ViettelPost'
+
+    dry_run = fields.Boolean(string='Chỉ kiểm tra (dry run)', default=True)
+    chunk_size = fields.Integer(string='Số bản ghi mỗi chunk', default=SWEEP_CHUNK_SIZE)
+    report_html = fields.Html(string='Báo cáo', readonly=True, sanitize=False)
+
+    def action_run(self):
+        self.ensure_one()
+        report = self.env['vtp.consistency.sweeper']._sweep(
+            dry_run=self.dry_run,
+            chunk_size=max(self.chunk_size, 1),
+        )
+        self.report_html = self._render_report(report)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _render_report(self, report):
+        rows = []
+        for line in report:
+            samples = Markup('<br/>').join(escape(sample) for sample in line['samples'])
+            rows.append(Markup(
+                '<tr><td>%s</td><td class="text-end">%s</td><td class="text-end">%s</td><td><small>%s</small></td></tr>'
+            ) % (line['label'], line['found'], line['fixed'] if line['fixable'] else '-', samples))
+        return Markup(
+            '<table class="table table-sm"><thead><tr><th>%s</th><th class="text-end">%s</th>'
+            '<th class="text-end">%s</th><th>%s</th></tr></thead><tbody>%s</tbody></table>'
+        ) % (_('Kiểm tra'), _('Phát hiện'), _('Đã sửa'), _('Ví dụ'), Markup('').join(rows))
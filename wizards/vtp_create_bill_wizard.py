@@ -35,15 +35,7 @@ class VTPCreateBillWizard(models.TransientModel):
                 self.receiver_name = partner.name
                 self.receiver_phone = partner.phone or partner.mobile
                 self.receiver_address = partner.street
-                if partner.state_id:
-                    province = self.env['vtp.province'].search([
-                        ('province_code', '=', partner.state_id.code)
-                    ], limit=1)
-                    if province:
-                        self.receiver_province_id = province.id
-                
-                self.receiver_district_id = False
-                self.receiver_ward_id = False
+                self._set_receiver_location(partner)
 
             # Build list item
             list_item, unused_price, unused_weight, unused_qty = self._prepare_list_items()
@@ -54,10 +46,12 @@ class VTPCreateBillWizard(models.TransientModel):
             self.product_quantity = unused_qty
             self.cod_amount = unused_price
             
-            # Auto-select account and store from picking if available
-            if self.picking_id.vtp_store_id:
-                self.store_id = self.picking_id.vtp_store_id
-                self.account_id = self.picking_id.vtp_store_id.account_id
+            # Auto-select account and store from picking if available, else from routing table
+            store = self.picking_id.vtp_store_id or self.env['vtp.store.route']._suggest_store(
+                self.picking_id, self.receiver_province_id, self.receiver_district_id)
+            if store:
+                self.store_id = store
+                self.account_id = store.account_id
     
     def action_create_bill(self):
         """Create ViettelPost shipping bill"""
@@ -133,13 +127,16 @@ class VTPCreateBillWizard(models.TransientModel):
         _logger.info("VTP Create Bill - Account: %s, Store: %s, Data: %s", 
                      self.account_id.name, self.store_id.name, data)
         
-        # Call service with account (NEW: account parameter required)
-        VTPService = self.env['vtp.service']
-        result = VTPService.create_bill(
-            account=self.account_id,
-            data=data,
-            order_bill=self.vtp_bill_id
+        # Gọi qua account pool: tự chuyển tài khoản khi tài khoản đã chọn lỗi token / bị giới hạn
+        result, used_store = self.env['vtp.account.pool'].create_bill(
+            self.store_id, data,
+            order_bill=self.vtp_bill_id,
+            receiver_province=self.receiver_province_id,
+            receiver_district=self.receiver_district_id,
+            warehouse=self.picking_id.picking_type_id.warehouse_id,
         )
+        if used_store != self.store_id:
+            self.write({'store_id': used_store.id, 'account_id': used_store.account_id.id})
 
         if result and not isinstance(result, dict):
             # Success - result is the order data
@@ -166,6 +163,8 @@ class VTPCreateBillWizard(models.TransientModel):
             'vtp_store_id': self.store_id.id,
             'vtp_state': 'waiting_webhook',
             'vtp_order_number': order_number,
+            'vtp_receiver_district_id': self.receiver_district_id.id,
+            'vtp_service_code': self.service_type.service_code if self.service_type else 'VSL6',
         })
         
         # Update order_bill if exists
@@ -269,14 +268,7 @@ class VTPCheckFeeWizard(models.TransientModel):
                 self.receiver_name = partner.name
                 self.receiver_phone = partner.phone or partner.mobile
                 self.receiver_address = partner.street or ''
-                if partner.state_id:
-                    province = self.env['vtp.province'].search([
-                        ('province_code', '=', partner.state_id.code)
-                    ], limit=1)
-                    if province:
-                        self.receiver_province_id = province.id
-                self.receiver_district_id = False
-                self.receiver_ward_id = False
+                self._set_receiver_location(partner)
 
             # Calculate totals from SO lines
             total_price = 0
@@ -334,12 +326,14 @@ class VTPCheckFeeWizard(models.TransientModel):
 
         _logger.info("VTP Calculate Fee - Account: %s, Data: %s", self.account_id.name, data)
         
-        # Call service with account (NEW: account parameter required)
-        VTPService = self.env['vtp.service']
-        result = VTPService.calculate_fee(
-            account=self.account_id,
-            data=data
+        # Gọi qua account pool: tự chuyển tài khoản khi tài khoản đã chọn lỗi token / bị giới hạn
+        result, used_store = self.env['vtp.account.pool'].calculate_fee(
+            self.store_id, data,
+            receiver_province=self.receiver_province_id,
+            receiver_district=self.receiver_district_id,
         )
+        if used_store != self.store_id:
+            self.write({'store_id': used_store.id, 'account_id': used_store.account_id.id})
         
         # Handle error
         if not result or (isinstance(result, dict) and result.get('error')):
@@ -354,6 +348,8 @@ class VTPCheckFeeWizard(models.TransientModel):
             'store_id': self.store_id.id,
             'service_code': self.service_type.id if self.service_type else False,
             'sale_order_id': self.sale_order_id.id,
+            'receiver_province_id': self.receiver_province_id.id,
+            'receiver_district_id': self.receiver_district_id.id,
             'money_total_old': result.get('MONEY_TOTAL', 0.0),
             'money_total': result.get('MONEY_TOTAL', 0.0),
             'money_total_fee': result.get('MONEY_TOTAL_FEE', 0.0),
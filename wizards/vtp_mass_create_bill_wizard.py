@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+VTP Mass Create Bill Wizard - Tạo vận đơn hàng loạt cho nhiều phiếu xuất kho
+
+- Payload được dựng từ dữ liệu đọc gộp (move line, sản phẩm, khách hàng) thay vì
+  chạy _prepare_list_items cho từng phiếu
+- order/createOrder được gọi song song qua vtp.service._make_api_calls_concurrently
+  (giới hạn số request đồng thời theo tài khoản)
+- Sau mỗi chunk: ghi mã vận đơn bằng một câu UPDATE, commit (để không mất mã vận
+  đơn đã tạo phía ViettelPost) và gửi thông báo tiến độ qua bus
+- Lỗi trước khi VTP nhận đơn (token, 401/403/429) được thử lại một lần với store
+  của tài khoản khác cùng điểm lấy hàng (account pool)
+"""
+
+import logging
+
+from markupsafe import Markup
+from psycopg2.extras import execute_values
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+from ..models.vtp_account_pool import is_failover_error
+
+_logger = logging.getLogger(__name__)
+
+MASS_BILL_CHUNK_SIZE = 100
+CREATE_ENDPOINT = 'order/createOrder'
+# Phương thức thanh toán không thu giá trị hàng hóa (1: không thu tiền, 4: chỉ thu phí vận chuyển)
+NO_COD_PAYMENTS = ('1', '4')
+
+
+class VTPMassCreateBillWizard(models.TransientModel):
+    _name = 'vtp.mass.create.bill.wizard'
+    _description = 'Tạo vận đơn ViettelPost hàng loạt'
+
+    picking_ids = fields.Many2many('stock.picking', string='Phiếu xuất kho', required=True)
+    store_id = fields.Many2one('vtp.store', string='Store ViettelPost',
+                               help='Để trống: dùng store của phiếu, bảng định tuyến hoặc store mặc định')
+    service_type = fields.Many2one('vtp.service.bill', string='Dịch vụ', required=True,
+                                   default=lambda self: self.env['vtp.service.bill'].search(
+                                       [('service_code', '=', 'VSL6')], limit=1))
+    order_payment = fields.Selection([
+        ('1', 'Không thu tiền'),
+        ('2', 'Thu phí vận chuyển và giá trị hàng hóa'),
+        ('3', 'Thu giá trị hàng hóa'),
+        ('4', 'Thu phí vận chuyển')
+    ], string='Phương thức thanh toán', default='3', required=True)
+    product_name = fields.Char(string='Tên hàng hóa', default='Hàng hóa')
+    product_length = fields.Float(string='Chiều dài (cm)')
+    product_width = fields.Float(string='Chiều rộng (cm)')
+    product_height = fields.Float(string='Chiều cao (cm)')
+    chunk_size = fields.Integer(string='Số phiếu mỗi chunk', default=MASS_BILL_CHUNK_SIZE)
+    per_account = fields.Integer(string='Request đồng thời mỗi tài khoản',
+                                 help='Để trống: dùng cấu hình concurrency_per_account')
+
+    picking_count = fields.Integer(string='Số phiếu', compute='_compute_picking_count')
+    done_count = fields.Integer(string='Đã tạo', readonly=True)
+    error_count = fields.Integer(string='Lỗi', readonly=True)
+    skipped_count = fields.Integer(string='Bỏ qua', readonly=True)
+    report_html = fields.Html(string='Báo cáo', readonly=True, sanitize=False)
+
+    @api.depends('picking_ids')
+    def _compute_picking_count(self):
+        for wizard in self:
+            wizard.picking_count = len(wizard.picking_ids)
+
+    @api.model
+    def default_get(self, fields_list):
+        res = super().default_get(fields_list)
+        if self._context.get('active_model') == 'stock.picking' and self._context.get('active_ids'):
+            res['picking_ids'] = [(6, 0, self._context['active_ids'])]
+        return res
+
+    @api.model
+    def _action_open(self, pickings):
+        """Server action trên danh sách phiếu xuất kho"""
+        return {
+            'name': _('Tạo vận đơn ViettelPost hàng loạt'),
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'default_picking_ids': [(6, 0, pickings.ids)]},
+        }
+
+    # ============ Payload ============
+
+    def _read_list_items(self, pickings):
+        """
+        LIST_ITEM và tổng giá trị / khối lượng / số lượng của mọi phiếu, đọc gộp.
+
+        Returns:
+            dict: {picking_id: (list_item, total_price, total_weight, total_quantity)}
+        """
+        lines = self.env['stock.move.line'].search_fetch(
+            [('picking_id', 'in', pickings.ids), ('product_id', '!=', False)],
+            ['picking_id', 'product_id', 'quantity'],
+        )
+        rows = [(line.picking_id.id, line.product_id, line.quantity) for line in lines]
+        # Phiếu chưa có move line (chưa giữ hàng): dùng số lượng nhu cầu của stock.move
+        missing = set(pickings.ids) - {row[0] for row in rows}
+        if missing:
+            moves = self.env['stock.move'].search_fetch(
+                [('picking_id', 'in', list(missing)), ('product_id', '!=', False)],
+                ['picking_id', 'product_id', 'product_uom_qty'],
+            )
+            rows += [(move.picking_id.id, move.product_id, move.product_uom_qty) for move in moves]
+        products = self.env['product.product'].browse({row[1].id for row in rows})
+        products.fetch(['list_price', 'weight'])
+
+        result = {}
+        for picking_id, product, qty in rows:
+            list_item, total_price, total_weight, total_quantity = result.get(picking_id, ([], 0, 0, 0))
+            product_price = (product.list_price or product.lst_price) * qty
+            # Trọng lượng (kg → gram)
+            weight = (product.weight or 0.0) * qty * 1000
+            list_item.append({
+                "PRODUCT_NAME": product.display_name,
+                "PRODUCT_PRICE": int(product_price),
+                "PRODUCT_WEIGHT": int(weight),
+                "PRODUCT_QUANTITY": int(qty),
+            })
+            result[picking_id] = (list_item, total_price + product_price,
+                                  total_weight + weight, total_quantity + qty)
+        return result
+
+    def _prepare_requests(self, pickings, report):
+        """
+        Dựng payload createOrder cho từng phiếu hợp lệ.
+
+        Returns:
+            list of dict: {'picking', 'store', 'province', 'district', 'data'}
+        """
+        pickings.fetch(['name', 'partner_id', 'scheduled_date', 'vtp_store_id', 'picking_type_id', 'vtp_id'])
+        pickings.partner_id.fetch(['name', 'phone', 'mobile', 'street', 'street2', 'city', 'state_id',
+                                   'vtp_province_id', 'vtp_district_id', 'vtp_ward_id'])
+        items = self._read_list_items(pickings)
+        Gazetteer = self.env['vtp.gazetteer']
+        Route = self.env['vtp.store.route']
+        default_store = self.env['vtp.store'].search([('is_default', '=', True), ('active', '=', True)], limit=1)
+        Province, District, Ward = self.env['vtp.province'], self.env['vtp.district'], self.env['vtp.ward']
+
+        requests = []
+        for picking in pickings:
+            partner = picking.partner_id
+            if not partner or not partner.street:
+                report[picking.id] = ('error', _('Thiếu địa chỉ giao hàng'))
+                continue
+            location = Gazetteer.resolve_partner(partner)
+            province = Province.browse(location['province_id'] or [])
+            district = District.browse(location['district_id'] or [])
+            ward = Ward.browse(location['ward_id'] or [])
+            if not province or not district:
+                report[picking.id] = ('error', _('Không xác định được tỉnh / quận người nhận'))
+                continue
+            store = (self.store_id or picking.vtp_store_id
+                     or Route._suggest_store(picking, province, district) or default_store)
+            if not store or not store.account_id:
+                report[picking.id] = ('error', _('Không có store ViettelPost phù hợp'))
+                continue
+
+            list_item, total_price, total_weight, total_quantity = items.get(picking.id, ([], 0, 0, 0))
+            data = {
+                'ORDER_NUMBER': picking.name,
+                'GROUPADDRESS_ID': int(store.groupaddressId) if store.groupaddressId else 0,
+                'CUS_ID': int(store.cusId) if store.cusId else 0,
+                'DELIVERY_DATE': (picking.scheduled_date and picking.scheduled_date.strftime("%d/%m/%Y %H:%M:%S")),
+                'SENDER_FULLNAME': store.name,
+                'SENDER_ADDRESS': store.address,
+                'SENDER_PHONE': store.phone,
+                'SENDER_WARD': store.wardId.wardId if store.wardId else '',
+                'SENDER_DISTRICT': store.districtId.districtId if store.districtId else '',
+                'SENDER_PROVINCE': store.provinceId.provinceId if store.provinceId else '',
+                'RECEIVER_FULLNAME': partner.name,
+                'RECEIVER_ADDRESS': partner.street,
+                'RECEIVER_PHONE': partner.phone or partner.mobile,
+                'RECEIVER_WARD': ward.wardId if ward else '',
+                'RECEIVER_DISTRICT': district.districtId,
+                'RECEIVER_PROVINCE': province.provinceId,
+                'PRODUCT_NAME': self.product_name or 'Hàng hóa',
+                'PRODUCT_DESCRIPTION': '',
+                'PRODUCT_QUANTITY': int(total_quantity) or 1,
+                'PRODUCT_PRICE': int(total_price),
+                'PRODUCT_WEIGHT': int(total_weight),
+                'PRODUCT_TYPE': 'HH',
+                'ORDER_PAYMENT': int(self.order_payment or 3),
+                'ORDER_SERVICE': self.service_type.service_code or 'VSL6',
+                'ORDER_SERVICE_ADD': '',
+                'ORDER_VOUCHER': '',
+                'MONEY_COLLECTION': 0 if self.order_payment in NO_COD_PAYMENTS else int(total_price),
+                'MONEY_TOTALFEE': 0,
+                'LIST_ITEM': list_item,
+                'NOTE': picking.name,
+            }
+            if self.product_length and self.product_width and self.product_height:
+                data.update({
+                    'PRODUCT_LENGTH': self.product_length,
+                    'PRODUCT_WIDTH': self.product_width,
+                    'PRODUCT_HEIGHT': self.product_height,
+                })
+            requests.append({'picking': picking, 'store': store, 'province': province,
+                             'district': district, 'data': data})
+        return requests
+
+    # ============ Execution ============
+
+    def _send_requests(self, requests):
+        """
+        Gọi createOrder song song; lỗi trước khi VTP nhận đơn được thử lại một lần
+        với store cùng điểm lấy hàng của tài khoản khác.
+
+        Returns:
+            list: kết quả theo thứ tự requests, mỗi phần tử (order_number | None, error | None)
+        """
+        VTPService = self.env['vtp.service']
+        Pool = self.env['vtp.account.pool']
+        pending = list(range(len(requests)))
+        outcomes = [(None, None)] * len(requests)
+        for attempt in range(2):
+            if not pending:
+                break
+            calls = [{
+                'account': requests[i]['store'].account_id,
+                'endpoint': CREATE_ENDPOINT,
+                'method': 'POST',
+                'data': requests[i]['data'],
+                'order_bill': requests[i]['picking'].vtp_id,
+            } for i in pending]
+            responses = VTPService._make_api_calls_concurrently(calls, per_account=self.per_account or None)
+            retry = []
+            for i, result in zip(pending, responses):
+                order_number = None
+                if isinstance(result, str):
+                    order_number = result
+                elif isinstance(result, dict) and result.get('ORDER_NUMBER'):
+                    order_number = result['ORDER_NUMBER']
+                if order_number:
+                    outcomes[i] = (order_number, None)
+                    continue
+                error = result.get('error') if isinstance(result, dict) else str(result)
+                outcomes[i] = (None, error or _('Unknown error'))
+                if attempt == 0 and is_failover_error(error, CREATE_ENDPOINT):
+                    request = requests[i]
+                    fallback = Pool._get_candidate_stores(
+                        request['store'], request['province'], request['district'],
+                        request['picking'].picking_type_id.warehouse_id, endpoint=CREATE_ENDPOINT,
+                    ).filtered(lambda s: s.account_id != request['store'].account_id)[:1]
+                    if fallback:
+                        request['data'] = Pool._apply_store(request['data'], fallback)
+                        request['store'] = fallback
+                        retry.append(i)
+            pending = retry
+        return outcomes
+
+    def _write_back(self, created):
+        """
+        Ghi mã vận đơn cho các phiếu vừa tạo bằng một câu UPDATE.
+
+        Args:
+            created: list of (request, order_number)
+        """
+        if not created:
+            return
+        Picking = self.env['stock.picking']
+        fields_written = ['vtp_order_number', 'vtp_state', 'vtp_store_id', 'vtp_account_id',
+                          'vtp_receiver_district_id', 'vtp_service_code']
+        Picking.flush_model(fields_written)
+        service_code = self.service_type.service_code or 'VSL6'
+        execute_values(self.env.cr._obj, """
+            UPDATE stock_picking p
+               SET vtp_order_number = v.order_number,
+                   vtp_state = 'waiting_webhook',
+                   vtp_store_id = v.store_id,
+                   vtp_account_id = v.account_id,
+                   vtp_receiver_district_id = v.district_id,
+                   vtp_service_code = v.service_code,
+                   write_uid = v.uid,
+                   write_date = now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(id, order_number, store_id, account_id, district_id, service_code, uid)
+             WHERE p.id = v.id
+        """, [
+            (request['picking'].id, order_number, request['store'].id, request['store'].account_id.id,
+             request['district'].id, service_code, self.env.uid)
+            for request, order_number in created
+        ], template="(%s, %s, %s::int, %s::int, %s::int, %s, %s::int)", page_size=1000)
+        Picking.invalidate_model(fields_written)
+
+        # Vận đơn đã gắn sẵn với phiếu (ít gặp) - cập nhật qua ORM để giữ board / KPI,
+        # ghi token đã dùng như luồng tạo từng vận đơn (store có thể đã đổi khi failover)
+        for request, order_number in created:
+            bill = request['picking'].vtp_id
+            if bill:
+                bill.write({'order_number': order_number, 'store_id': request['store'].id})
+                bill._track_token_usage(request['store'].account_id.token)
+
+    def _notify_progress(self, processed, total, done, errors):
+        self.env['bus.bus']._sendone(self.env.user.partner_id, 'simple_notification', {
+            'title': _('Tạo vận đơn ViettelPost'),
+            'message': _('Đã xử lý %(processed)s/%(total)s phiếu: %(done)s thành công, %(errors)s lỗi',
+                         processed=processed, total=total, done=done, errors=errors),
+            'sticky': False,
+            'type': 'info',
+        })
+
+    def action_create_bills(self):
+        self.ensure_one()
+        pickings = self.picking_ids
+        if not pickings:
+            raise UserError(_('Vui lòng chọn phiếu xuất kho!'))
+
+        report = {}
+        for picking in pickings:
+            if picking.vtp_order_number:
+                report[picking.id] = ('skipped', _('Đã có mã vận đơn %s') % picking.vtp_order_number)
+            elif picking.state == 'cancel':
+                report[picking.id] = ('skipped', _('Phiếu đã hủy'))
+        todo = pickings.filtered(lambda p: p.id not in report)
+
+        chunk_size = max(self.chunk_size, 1)
+        done = errors = 0
+        processed = len(pickings) - len(todo)
+        for start in range(0, len(todo), chunk_size):
+            chunk = todo[start:start + chunk_size]
+            requests = self._prepare_requests(chunk, report)
+            outcomes = self._send_requests(requests)
+            created = []
+            for request, (order_number, error) in zip(requests, outcomes):
+                if order_number:
+                    created.append((request, order_number))
+                    report[request['picking'].id] = ('done', order_number)
+                else:
+                    report[request['picking'].id] = ('error', error)
+            self._write_back(created)
+
+            done += len(created)
+            errors += len(chunk) - len(created)
+            processed += len(chunk)
+            self._notify_progress(processed, len(pickings), done, errors)
+            # Mã vận đơn đã tồn tại phía ViettelPost - commit để không mất khi chunk sau lỗi
+            self.env.cr.commit()
+            _logger.info(f"VTP Mass Bill: {processed}/{len(pickings)} phiếu, {done} thành công, {errors} lỗi")
+
+        self.write({
+            'done_count': done,
+            'error_count': errors,
+            'skipped_count': len(pickings) - len(todo),
+            'report_html': self._render_report(pickings, report),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _render_report(self, pickings, report):
+        """Bảng kết quả theo phiếu: lỗi trước, sau đó bỏ qua và thành công"""
+        order = {'error': 0, 'skipped': 1, 'done': 2}
+        labels = {'error': _('Lỗi'), 'skipped': _('Bỏ qua'), 'done': _('Thành công')}
+        rows = []
+        for picking in pickings.sorted(lambda p: (order[report.get(p.id, ('error', ''))[0]], p.name or '')):
+            status, message = report.get(picking.id, ('error', _('Không xử lý')))
+            rows.append(Markup('<tr class="%s"><td>%s</td><td>%s</td><td>%s</td></tr>') % (
+                'text-danger' if status == 'error' else '', picking.name, labels[status], message or '',
+            ))
+        return Markup(
+            '<table class="table table-sm"><thead><tr><th>%s</th><th>%s</th><th>%s</th></tr></thead>'
+            '<tbody>%s</tbody></table>'
+        ) % (_('Phiếu'), _('Kết quả'), _('Mã vận đơn / Chi tiết'), Markup('').join(rows))
@@ -66,24 +66,23 @@ class VTPShippingWizardMixin(models.AbstractModel):
             self.receiver_phone = self.partner_id.phone or self.partner_id.mobile
             self.receiver_address = self.partner_id.street or ''
             
-            # Tìm và gán tỉnh/thành phố nếu có
-            if self.partner_id.state_id:
-                province = self.env['vtp.province'].search([
-                    ('province_code', '=', self.partner_id.state_id.code)
-                ], limit=1)
-                if province:
-                    self.receiver_province_id = province
-                    
-            # Reset quận/huyện và phường/xã
-            self.receiver_district_id = False
-            self.receiver_ward_id = False
+            self._set_receiver_location(self.partner_id)
             
     @api.onchange('receiver_province_id')
     def _onchange_receiver_province_id(self):
-        if self.receiver_province_id:
+        # Chỉ reset khi quận/phường không thuộc tỉnh mới (giữ kết quả tự nhận diện)
+        if self.receiver_district_id and self.receiver_district_id.provinceId != self.receiver_province_id:
             self.receiver_district_id = False
+        if self.receiver_ward_id and self.receiver_ward_id.districtId != self.receiver_district_id:
             self.receiver_ward_id = False
 
+    def _set_receiver_location(self, partner):
+        """Gán tỉnh/quận/phường người nhận từ địa chỉ khách hàng (gazetteer)"""
+        location = self.env['vtp.gazetteer'].resolve_partner(partner)
+        self.receiver_province_id = location['province_id'] or False
+        self.receiver_district_id = location['district_id'] or False
+        self.receiver_ward_id = location['ward_id'] or False
+
     def _prepare_list_items(self):
         """Build LIST_ITEM từ picking để gửi API"""
         self.ensure_one()
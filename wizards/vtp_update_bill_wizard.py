@@ -46,15 +46,7 @@ class VTPUpdateBillWizard(models.TransientModel):
                 self.receiver_name = partner.name
                 self.receiver_phone = partner.phone or partner.mobile
                 self.receiver_address = partner.street
-                if partner.state_id:
-                    province = self.env['vtp.province'].search([
-                        ('province_code', '=', partner.state_id.code)
-                    ], limit=1)
-                    if province:
-                        self.receiver_province_id = province.id
-
-                self.receiver_district_id = False
-                self.receiver_ward_id = False
+                self._set_receiver_location(partner)
 
             # Build list item from picking
             list_item, unused_p, unused_w, unused_q = self._prepare_list_items()
@@ -93,9 +85,7 @@ class VTPUpdateBillWizard(models.TransientModel):
                     })
 
                 # Get latest history for defaults
-                latest_history = self.env['vtp.order.bill.history'].search([
-                    ('order_number', '=', vtp_bill.order_number)
-                ], order='create_date desc', limit=1)
+                latest_history = vtp_bill.last_history_id
                 
                 if latest_history:
                     service_id = False